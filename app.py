@@ -1,12 +1,41 @@
 import streamlit as st
 import pandas as pd
-import io
 import plotly.express as px
 import os
-import re
+import sys
+import importlib.machinery
+import atexit
 import time
+import threading
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 import plotly.graph_objects as go
+import plotly.io as pio
 from streamlit_option_menu import option_menu
+from mesures import (
+    nouveau_releve, etiqueter_releve, clore_releve, chrono, demarrer_chrono, arreter_chrono, integrer_releve,
+    derniers_releves, exporter_journal, releve_de_fragment
+)
+from moteur import (
+    NOMS_MOIS, CATEGORIES_VIREMENTS, CAT_TRANSFERT, simplifier_nom_definitif, construire_moteur,
+    importer_en_flux, importer_fichier, importer_fichier_mesure, construire_index_soldes, IndexRecherche, masque_regle, solde_debut_annee, flux_annee, soldes_fin_de_mois, periode_index_soldes
+)
+from stockage import (
+    charger_donnees, ajouter_transactions, lire_transactions, charger_cumuls,
+    supprimer_transactions, modifier_transactions, stockage_sqlite_actif, migrer_csv_vers_sqlite,
+    signature_stockage, signature_fichier, lire_memoire, apprendre_categories, calculer_empreintes,
+    charger_profils, enregistrer_profils, type_mois, rapport_memoire, lire_reglage, modifier_reglage,
+    RegistreComptes, charger_registre, enregistrer_registre, COULEUR_COMPTE_DEFAUT, marquer_transferts,
+    recategoriser_transactions, finaliser_import, marquer_transferts_import
+)
+
+# Streamlit exécute ce script comme module __main__ (un nouveau à chaque rerun). Déclaré comme tel,
+# il n'est pas rejoué au démarrage des processus "spawn" du pool d'import, comme le __main__.py
+# d'un paquet : leurs tâches n'appellent que des fonctions de moteur.
+__spec__ = importlib.machinery.ModuleSpec("__main__", None)
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(page_title="Mes Budgets", layout="wide",initial_sidebar_state="collapsed")
@@ -108,18 +137,85 @@ def update_couleur_compte(nom_compte):
         # 3. On sauvegarde le dictionnaire complet qui est maintenant à jour
         sauvegarder_config(st.session_state.config_groupes)
 
+# --- CACHE PARTAGÉ ENTRE SESSIONS ---
+# Le grand livre, la config des comptes et la mémoire sont lus UNE fois pour tout le serveur,
+# puis relus seulement si le fichier change (date de modif + taille).
+# Le DataFrame partagé est en lecture seule : toute modification crée un nouveau DataFrame
+# qui est publié avec publier_donnees().
+
+@st.cache_resource(show_spinner=False)
+def cache_donnees():
+    # version : compteur incrémenté à chaque nouveau grand livre (détecte une écriture sur des données périmées)
+    return {"signature": None, "df": None, "soldes": None, "recherche": None, "version": 0, "verrou": threading.Lock()}
+
+def donnees_versionnees():
+    # (grand livre, version) lus ensemble sous le verrou
+    cache = cache_donnees()
+    signature = signature_stockage()
+    with cache["verrou"]:
+        if cache["df"] is None or cache["signature"] != signature:
+            cache["df"] = charger_donnees()
+            cache["signature"] = signature
+            cache["version"] += 1
+        return cache["df"], cache["version"]
+
+def donnees_partagees():
+    return donnees_versionnees()[0]
+
+def donnees_a_jour(version):
+    # Grand livre courant s'il est encore celui affiché, sinon None : un import ou une autre
+    # session l'a changé depuis, et une écriture faite sur l'ancien écraserait ses changements
+    df, version_courante = donnees_versionnees()
+    return df if version_courante == version else None
+
+def refuser_ecriture_perimee():
+    st.toast("Les données ont changé depuis l'affichage : rien n'a été enregistré, la page est rechargée.", icon="⚠️")
+    time.sleep(1)
+    st.rerun()
+
+def publier_donnees(df):
+    # Invalidation explicite après un import / une édition : les autres sessions voient
+    # directement le nouveau DataFrame, sans relire le fichier
+    cache = cache_donnees()
+    with cache["verrou"]:
+        cache["df"] = df
+        cache["signature"] = signature_stockage()
+        cache["version"] += 1
+        st.session_state.version_df = cache["version"]
+    st.session_state.df = df
+
+def index_soldes_partage():
+    # Index des soldes cumulés par compte : reconstruit seulement quand le grand livre publié change
+    cache = cache_donnees()
+    df = donnees_partagees()
+    with cache["verrou"]:
+        if cache["soldes"] is None or cache["soldes"][0] is not df:
+            cache["soldes"] = (df, construire_index_soldes(df))
+        return cache["soldes"][1]
+
+def rechercher_libelles(texte="", montant_min=None, montant_max=None):
+    # Recherche de la Gestion dans l'index inversé des libellés, partagé par toutes les sessions :
+    # construit au premier usage puis mis à jour par différence quand le grand livre publié change
+    cache = cache_donnees()
+    df = donnees_partagees()
+    with cache["verrou"]:
+        if cache["recherche"] is None: cache["recherche"] = (None, IndexRecherche())
+        if cache["recherche"][0] is not df:
+            cache["recherche"][1].synchroniser(df)
+            cache["recherche"] = (df, cache["recherche"][1])
+        return cache["recherche"][1].rechercher(texte, montant_min, montant_max)
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def lire_memoire_cache(signature):
+    return lire_memoire()
+
 # --- 2. SESSION STATE (La mémoire) ---
-if 'df' not in st.session_state:
-    # --- CHARGEMENT AUTO AU DÉMARRAGE ---
-    if os.path.exists("ma_base_de_donnees.csv"):
-        try:
-            df_load = pd.read_csv("ma_base_de_donnees.csv", encoding='utf-8-sig')
-            df_load["Date"] = pd.to_datetime(df_load["Date"], errors='coerce')
-            st.session_state.df = df_load
-        except:
-            st.session_state.df = pd.DataFrame(columns=["Date", "Nom", "Montant", "Categorie", "Compte", "Mois"])
-    else:
-        st.session_state.df = pd.DataFrame(columns=["Date", "Nom", "Montant", "Categorie", "Compte", "Mois"])
+# Mesures de performance : un relevé par exécution du script (clos en fin de page)
+nouveau_releve()
+
+# CHARGEMENT AUTO (CSV ou SQLite selon le stockage actif) : même objet pour toutes les sessions
+with chrono("chargement"):
+    st.session_state.df, st.session_state.version_df = donnees_versionnees()
 
 if 'choix_g' not in st.session_state:
     st.session_state['choix_g'] = "Tout le monde"
@@ -137,22 +233,17 @@ if 'groupes_liste' not in st.session_state:
         st.session_state.groupes_liste = []
 
 if 'config_groupes' not in st.session_state:
-    if os.path.exists("config_comptes.csv"):
-        try:
-            temp_df = pd.read_csv("config_comptes.csv", index_col=0, encoding='utf-8-sig')
-            if "Couleur" not in temp_df.columns:
-                temp_df["Couleur"] = "#1f77b4"
-            temp_df["Couleur"] = temp_df["Couleur"].fillna("#1f77b4")
-            st.session_state.config_groupes = temp_df.to_dict('index')
-            
-            for nom_compte, data in st.session_state.config_groupes.items():
-                cle_picker = f"cp_{nom_compte}"
-                if cle_picker not in st.session_state:
-                    st.session_state[cle_picker] = data["Couleur"]
-        except Exception as e:
-            st.error(f"Erreur lecture config: {e}")
-            st.session_state.config_groupes = {}
-    else:
+    # Copie de travail de la session, tirée du registre des comptes partagé
+    try:
+        registre = charger_registre()
+        st.session_state.config_groupes = registre.vers_dict()
+        for nom_compte, data in st.session_state.config_groupes.items():
+            data["Couleur"] = registre.couleur(nom_compte, COULEUR_COMPTE_DEFAUT)
+            cle_picker = f"cp_{nom_compte}"
+            if cle_picker not in st.session_state:
+                st.session_state[cle_picker] = data["Couleur"]
+    except Exception as e:
+        st.error(f"Erreur lecture config: {e}")
         st.session_state.config_groupes = {}
 
 # --- AJOUT INDISPENSABLE ICI (En dehors du IF) ---
@@ -167,10 +258,10 @@ if not st.session_state.df.empty:
             st.session_state[f"cp_{c}"] = "#1f77b4"
 
 # --- 3. VARIABLES DE TRAVAIL (Initialisation par défaut) ---
-df_h = st.session_state.df.copy()
+# Pas de copie : le DataFrame partagé n'est jamais modifié sur place
+df_h = st.session_state.df
 df_f = pd.DataFrame()
-df_dash = pd.DataFrame()
-df_reel = pd.DataFrame()
+cube_dash = pd.DataFrame()
 solde_global = 0.0
 obj = 0.0
 s_init = 0.0
@@ -186,15 +277,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 2. DICTIONNAIRES ET CONSTANTES ---
-CORRESPONDANCE = {
-    "Date": ["Date", "Date opération", "Date de valeur", "Effective Date", "Date op", "Date val", "Le", "Date de comptabilisation","Date operation", "date"],
-    "Nom": ["Nom", "Libelle simplifie", "Libellé", "Description", "Transaction", "Libellé de l'opération", "Détails", "Objet", "Type"],
-    "Montant": ["Montant", "Montant(EUROS)", "Valeur", "Amount", "Prix", "Montant net", "Somme"],
-    "Debit": ["Debit", "Débit"],
-    "Credit": ["Credit", "Crédit"]
-}
-
-NOMS_MOIS = ["Janvier", "Février", "Mars", "Avril", "Mai", "Juin", "Juillet", "Août", "Septembre", "Octobre", "Novembre", "Décembre"]
 
 
 def charger_categories_perso():
@@ -223,6 +305,7 @@ def sauvegarder_nouvelle_categorie(nouvelle_cat):
 
 
 LISTE_CATEGORIES_COMPLETE = charger_categories_perso()
+TAILLES_PAGE_GESTION = [25, 50, 100, 200]
 
 # --- 3. TOUTES LES FONCTIONS ---
 
@@ -230,25 +313,105 @@ LISTE_CATEGORIES_COMPLETE = charger_categories_perso()
 
 def charger_memoire():
     if os.path.exists("memoire_categories.csv"):
-        return pd.read_csv("memoire_categories.csv").set_index('Nom')['Categorie'].to_dict()
+        return dict(lire_memoire_cache(signature_fichier("memoire_categories.csv")))
     return {}
 
-def sauvegarder_apprentissage(nom_ope, categorie):
-    memoire = charger_memoire()
-    # On nettoie le nom pour qu'il soit générique
-    nom_clean = simplifier_nom_definitif(nom_ope)
-    memoire[nom_clean] = categorie
-    pd.DataFrame(list(memoire.items()), columns=['Nom', 'Categorie']).to_csv("memoire_categories.csv", index=False)
-
-
-
-def charger_couleur(nom_fichier, defaut="#1f77b4"):
-    if os.path.exists(nom_fichier):
-        with open(nom_fichier, "r") as f: return f.read().strip()
-    return defaut
-
-def sauvegarder_couleur(nom_fichier, hex_color):
-    with open(nom_fichier, "w") as f: f.write(hex_color)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def construire_moteur_cache(signature_memoire):
+    # Recompilé seulement quand memoire_categories.csv change (la signature = date de modif + taille) ;
+    # un seul moteur gardé : l'ancien est libéré à chaque apprentissage
+    return construire_moteur(charger_memoire())
+
+def moteur_categorisation():
+    return construire_moteur_cache(signature_fichier("memoire_categories.csv"))
+
+@st.cache_resource(show_spinner=False)
+def pool_import():
+    # Processus réutilisés d'un import à l'autre. Toujours "spawn" : le serveur Streamlit a déjà ses threads,
+    # et un fork copierait leurs verrous dans un état quelconque. Arrêté proprement à la sortie du serveur.
+    pool = ProcessPoolExecutor(max_workers=min(8, os.cpu_count() or 1), mp_context=multiprocessing.get_context("spawn"))
+    atexit.register(pool.shutdown, cancel_futures=True)
+    return pool
+
+def soumettre_import(*args):
+    # La tâche est une fonction de moteur. Les processus naissent dans submit() : si le module __main__
+    # courant est celui d'un rerun qui n'a pas encore exécuté sa déclaration (voir __spec__ en tête),
+    # un processus lancé maintenant rejouerait la page ; ce fichier-là est alors analysé ici même
+    # (mesuré directement dans le relevé de la page, d'où l'absence de relevé renvoyé).
+    if getattr(sys.modules["__main__"].__spec__, "name", None) != "__main__":
+        futur = Future()
+        try: futur.set_result(importer_fichier(*args) + (None,))
+        except Exception as e: futur.set_exception(e)
+        return futur
+    return pool_import().submit(importer_fichier_mesure, *args)
+
+def arreter_pool_import():
+    pool_import().shutdown(wait=False, cancel_futures=True)
+    pool_import.clear()
+
+def importer_plusieurs_fichiers(fichiers_comptes):
+    # fichiers_comptes : [(fichier, compte)]. Chaque fichier est analysé dans un processus du pool,
+    # puis tout est enregistré en UNE écriture dédoublonnée. Renvoie (statuts par fichier, nouvelles, doublons, transferts).
+    memoire, profils = charger_memoire(), charger_profils()
+    futurs = [soumettre_import(fi.getvalue(), compte, memoire, profils.get(compte)) for fi, compte in fichiers_comptes]
+
+    statuts, resultats, appris, pool_casse = [], [], {}, False
+    for (fi, compte), futur in zip(fichiers_comptes, futurs):
+        try:
+            df_res, profils_fichier, releve = futur.result()
+            # Chronos de la catégorisation et de la lecture faites dans le processus du pool
+            integrer_releve(releve)
+            appris.setdefault(compte, dict(profils.get(compte, {}))).update(profils_fichier)
+            statut = "✅"
+        except BrokenProcessPool as e:
+            # Un processus est mort (mémoire...) : le pool est inutilisable, on en recrée un au prochain import
+            pool_casse = True
+            df_res, statut = None, f"❌ {e}"
+        except Exception as e:
+            df_res, statut = None, f"❌ {e}"
+        statuts.append({"Fichier": fi.name, "Compte": compte, "Lignes": 0 if df_res is None else len(df_res), "Nouvelles": 0, "Doublons": 0, "Statut": statut})
+        resultats.append(df_res)
+    if pool_casse: arreter_pool_import()
+
+    # Formats de banque appris : une écriture par compte, seulement si quelque chose a changé
+    for compte, profils_compte in appris.items():
+        if profils_compte != profils.get(compte, {}): enregistrer_profils(compte, profils_compte)
+
+    valides = [(i, r) for i, r in enumerate(resultats) if r is not None and not r.empty]
+    if not valides: return statuts, 0, 0, 0
+
+    df_tous = pd.concat([r for _, r in valides], ignore_index=True)
+    origine = pd.Series([i for i, r in valides for _ in range(len(r))])
+    n_avant = len(st.session_state.df)
+    # Transferts entre comptes : les nouvelles lignes sont rapprochées de tout le grand livre et
+    # marquées avant l'ajout ; seules leurs contreparties déjà présentes sont mises à jour ensuite
+    df_tous, contreparties, nb_transferts = marquer_transferts_import(st.session_state.df, df_tous)
+    df_maj, nb_nouvelles, nb_doublons = ajouter_transactions(st.session_state.df, df_tous, instantane=False)
+    df_maj = recategoriser_transactions(df_maj, contreparties, CAT_TRANSFERT)
+    finaliser_import(df_maj)
+    publier_donnees(df_maj)
+
+    # Nouvelles lignes par fichier : à doublon égal, c'est le premier fichier qui l'apporte
+    empreintes = calculer_empreintes(df_tous.assign(Date=df_tous["Date"].dt.normalize()))
+    ajoutees = calculer_empreintes(df_maj.iloc[n_avant:]).tolist()
+    par_fichier = (~empreintes.duplicated() & empreintes.isin(ajoutees)).groupby(origine).sum()
+    for i, statut in enumerate(statuts):
+        statut["Nouvelles"] = int(par_fichier.get(i, 0))
+        statut["Doublons"] = statut["Lignes"] - statut["Nouvelles"]
+    return statuts, nb_nouvelles, nb_doublons, nb_transferts
+
+def sauvegarder_apprentissages(paires):
+    # On nettoie les noms pour qu'ils soient génériques, puis une seule écriture pour tout le lot
+    # (en cas de doublon, la dernière catégorie l'emporte)
+    return apprendre_categories({simplifier_nom_definitif(nom): cat for nom, cat in paires}, charger_memoire())
+
+
+
+def selecteur_couleur(libelle, cle, defaut="#1f77b4"):
+    # Couleur lue dans le cache des réglages : rien n'est écrit tant qu'elle ne change pas
+    couleur = st.color_picker(libelle, lire_reglage(cle, defaut))
+    modifier_reglage(cle, couleur)
+    return couleur
 
 def charger_groupes():
     if os.path.exists("mes_groupes.txt"):
@@ -262,179 +425,30 @@ def sauvegarder_groupes(liste):
         for item in liste: f.write(f"{item}\n")
 
 def charger_config():
-    if os.path.exists("config_comptes.csv"):
-        return pd.read_csv("config_comptes.csv", index_col=0).to_dict('index')
-    return {}
+    return charger_registre().vers_dict()
 
 def sauvegarder_config(config_dict):
     try:
-        # 1. On tente de lire ce qui existe déjà sur le fichier pour ne rien perdre
-        if os.path.exists("config_comptes.csv"):
-            df_existant = pd.read_csv("config_comptes.csv", index_col=0)
-            
-            # On convertit le dict actuel en DataFrame
-            df_nouveau = pd.DataFrame.from_dict(config_dict, orient='index')
-            
-            # On fusionne : le nouveau écrase l'ancien, MAIS on garde les colonnes manquantes
-            for col in df_existant.columns:
-                if col not in df_nouveau.columns:
-                    df_nouveau[col] = df_existant[col]
-            
-            df_save = df_nouveau
-        else:
-            df_save = pd.DataFrame.from_dict(config_dict, orient='index')
-
-        df_save.to_csv("config_comptes.csv", encoding='utf-8-sig', index=True)
+        # Une seule écriture ; les colonnes du fichier absentes du dict sont conservées
+        enregistrer_registre(config_dict)
     except Exception as e:
         st.error(f"Erreur sauvegarde : {e}")
 
 
 # --- GARDE-FOU ANTI-RETOUR AU BLEU ---
-if os.path.exists("config_comptes.csv"):
-    try:
-        # On lit le CSV de référence
-        df_ref = pd.read_csv("config_comptes.csv", index_col=0, encoding='utf-8-sig')
-        
-        if "Couleur" in df_ref.columns:
-            for nom_compte in st.session_state.config_groupes:
-                if nom_compte in df_ref.index:
-                    couleur_csv = df_ref.loc[nom_compte, "Couleur"]
-                    
-                    # Si la couleur en mémoire est celle par défaut ou vide, on force celle du CSV
-                    memo_color = st.session_state.config_groupes[nom_compte].get("Couleur", "#1f77b4")
-                    if (memo_color == "#1f77b4" or pd.isna(memo_color)) and pd.notna(couleur_csv):
-                        st.session_state.config_groupes[nom_compte]["Couleur"] = couleur_csv
-                        # On met aussi à jour le widget picker pour qu'il ne re-bascule pas
-                        st.session_state[f"cp_{nom_compte}"] = couleur_csv
-    except:
-        pass
-
-
-def clean_montant_physique(valeur):
-    if pd.isna(valeur) or valeur == "": return 0.0
-    s = str(valeur).replace('\xa0', '').replace(' ', '').replace('€', '').replace('$', '')
-    if ',' in s and '.' in s: s = s.replace(',', '')
-    elif ',' in s: s = s.replace(',', '.')
-    try: return float(s)
-    except: return 0.0
-
-def charger_donnees():
-    if os.path.exists("ma_base_de_donnees.csv"):
-        try:
-            # On essaie UTF-8, sinon Latin-1 pour gérer les accents
-            try:
-                df = pd.read_csv("ma_base_de_donnees.csv", encoding='utf-8-sig')
-            except UnicodeDecodeError:
-                df = pd.read_csv("ma_base_de_donnees.csv", encoding='latin-1')
-
-            if "Date" in df.columns:
-                df["Date"] = pd.to_datetime(df["Date"], errors='coerce')
-                df = df.dropna(subset=["Date"])
-                
-                # --- AJOUT CRITIQUE POUR LE DASHBOARD ---
-                if "Année" not in df.columns:
-                    df["Année"] = df["Date"].dt.year
-                
-                if "Mois" not in df.columns:
-                    df["Mois"] = df["Date"].dt.month.map(lambda x: NOMS_MOIS[int(x)-1] if pd.notna(x) else "Inconnu")
-
-            if "Montant" in df.columns:
-                df["Montant"] = df["Montant"].apply(clean_montant_physique)
-            
-            return df
-        except Exception as e:
-            # En cas d'erreur, on affiche l'erreur pour déboguer
-            print(f"Erreur lecture : {e}")
-            return pd.DataFrame(columns=["Date", "Nom", "Montant", "Categorie", "Compte", "Mois", "Année"])
-            
-    return pd.DataFrame(columns=["Date", "Nom", "Montant", "Categorie", "Compte", "Mois", "Année"])
-
-def sauvegarder_donnees(nouveau_df):
-    nom_fichier = "ma_base_de_donnees.csv"
-    if "Mois" not in nouveau_df.columns:
-        nouveau_df["Mois"] = nouveau_df["Date"].dt.month.map(lambda x: NOMS_MOIS[int(x)-1] if pd.notna(x) else "Inconnu")
-    if os.path.exists(nom_fichier):
-        ancien_df = pd.read_csv(nom_fichier, encoding='utf-8-sig')
-        ancien_df["Date"] = pd.to_datetime(ancien_df["Date"], errors='coerce')
-        df_total = pd.concat([ancien_df, nouveau_df], ignore_index=True)
-        df_total = df_total.drop_duplicates(subset=["Date", "Nom", "Montant", "Compte"])
-        df_total.to_csv(nom_fichier, index=False, encoding='utf-8-sig')
-    else: nouveau_df.to_csv(nom_fichier, index=False, encoding='utf-8-sig')
-
-def simplifier_nom_definitif(nom):
-    if not isinstance(nom, str): return str(nom)
-    nom = nom.upper()
-    nom = re.sub(r'(FAC|REF|NUM|ID|PRLV|VIREMENT)\s*[:.\-]?\s*[0-9A-Z]+', '', nom)
-    nom = re.sub(r'\d{2}[\./]\d{2}([\./]\d{2,4})?', '', nom)
-    for m in ["ACHAT CB", "ACHAT", "CB", "CARTE", "VERSEMENT", "CHEQUE", "SEPA"]: nom = nom.replace(m, "")
-    return ' '.join(re.sub(r'[\*\-\/#]', ' ', nom).split()).strip() or "AUTRE"
-
-def categoriser(nom_operation, montant=0, compte_actuel=None, ligne_complete=None):
-    n_brut = str(nom_operation).upper()
-    n_clean = simplifier_nom_definitif(n_brut)
-    
-    mots_transfert = [
-        "VIREMENT VERS COMPTE CHEQUES", "VIREMENT VERS LIVRET A","Virement interne"
-    ]
+# Référence : le registre des comptes (en mémoire, relu seulement si le fichier change)
+registre_fichier = charger_registre()
+for nom_compte in st.session_state.config_groupes:
+    couleur_csv = registre_fichier.couleur(nom_compte)
+    # Si la couleur en mémoire est celle par défaut ou vide, on force celle du registre
+    memo_color = st.session_state.config_groupes[nom_compte].get("Couleur", COULEUR_COMPTE_DEFAUT)
+    if (memo_color == COULEUR_COMPTE_DEFAUT or pd.isna(memo_color)) and couleur_csv:
+        st.session_state.config_groupes[nom_compte]["Couleur"] = couleur_csv
+        # On met aussi à jour le widget picker pour qu'il ne re-bascule pas
+        st.session_state[f"cp_{nom_compte}"] = couleur_csv
 
-    # --- ÉTAPE 1 : Scan du libellé principal ---
-    est_transfert = any(m in n_brut for m in mots_transfert)
-
-    # --- ÉTAPE 2 : Scan de TOUTES les colonnes du CSV ---
-    if not est_transfert and ligne_complete is not None:
-        # On récupère toutes les valeurs de la ligne, on les transforme en texte, 
-        # on les met en majuscules et on colle tout avec un espace.
-        texte_complet_ligne = " ".join([str(v).upper() for v in ligne_complete.values])
-        
-        # On vérifie si un de nos mots-clés est n'importe où dans ce texte
-        if any(m in texte_complet_ligne for m in mots_transfert):
-            est_transfert = True
-
-    if est_transfert:
-        return "🔄 Transfert Interne"
-
-    # ... reste de la fonction (mémoire, puis catégories)
-
-    # --- 2. VÉRIFICATION DE LA MÉMOIRE (Apprentissage) ---
-    memoire = charger_memoire()
-    if n_clean in memoire:
-        return memoire[n_clean]
-    
-
-    # --- 3. TES CATÉGORIES HABITUELLES ---
-    CATEGORIES_MOTS_CLES = {
-        "💰 Salaire": ["MELTED", "JEFF DB", "FRANCE TRAVAIL", "POLE EMPLOI", "SARL","JEFF DE BRUGES"],
-        "🏥 Remboursements": ["NOSTRUMCARE", "AMELI", "CPAM", "REMBOURSEMENT", "SANTÉ","FAUSTINE BOJUC"],
-        "👫 Compte Commun": ["A FONTA AUDE OU LEBARBIER THEO","AUDE FONTATHEO LEBARBIE", "VERSEMENT COMMUN", "VIREMENT COMMUN"],
-        "🤝 Virements Reçus": ["LEBARBIER THEO", "LEBARBIER DIDIER", "MARYLINE FONTA", "AURORE FONTA", "MME AUDE FONTA","DE MR LEBARBIER D"],
-        "📱 Abonnements": ["NETFLIX", "SPOTIFY", "DISNEY PLUS", "AMAZON PRIME", "YOUTUBE PREMIUM", "ORANGE", "GOOGLE PLAY", "GOOGLE ONE", "AMZ DIGITAL", "TWITCH"],
-        "🛒 Alimentation": ["CARREFOUR", "AUCHAN", "MONOPRIX", "CASINO", "SUPER", "PICARD", "BIOCOOP", "MARCHE", "BOULANGERIE", "RESTAURANT", "BAR", "MCDO", "SUBWAY", "INTERMARCHE", "LECLERC","AUTOGRILL","PROZIS","CIAO BELLA"],
-        "🛍️ Shopping": ["AMAZON", "FNAC", "DARTY", "CULTURA", "ZARA", "H&M", "KIABI", "KLARNA"],
-        "👕 Habillement": ["VETEMENTS", "CHAUSSURES", "MODE", "CELIO", "JULES", "ASOS"],
-        "⚖️ Impôts": ["IMPOTS", "TRESOR PUBLIC", "DGFIP"],
-        "🏦 Frais Bancaires": ["COTISATION BANCAIRE", "FRAIS BANCAIRES", "COTISATION ESSENTIEL"],
-        "🏠 Assurance Habitation": ["PACIFICA", "MMA", "MAIF", "MACIF"],
-        "🎮 Jeux vidéos": ["SONY PLAYSTATION", "NINTENDO", "STEAM", "EPIC GAMES", "INSTANT GAMING"],
-        "🩺 Mutuelle": ["MUTUELLE", "HARMONIE", "MGEN", "NOSTRUM CARE"],
-        "💊 Pharmacie": ["PHARMACIE", "MÉNARD", "PHARMA"],
-        "👨‍⚕️ Médecin/Santé": ["MEDECIN", "DENTISTE", "DOCTOLIB"],
-        "🔑 Loyer": ["LOYER", "AGENCE IMMOBILIERE", "Jason Moliner","JASON MOLINER"],
-        "🔨 Bricolage": ["CASTORAMA", "LEROY", "BRICO DEPOT", "IKEA"],
-        "🚌 Transports": ["RATP", "SNCF", "TCL", "ORIZO"],
-        "⛽ Carburant": ["TOTAL", "BP", "ESSENCE", "SHELL", "ESSOF", "CERTAS","STATION"],
-        "🚗 Auto": ["CREDIT AUTO", "GARAGE", "REPARATION", "AUTO"],
-        "💸 Virements Perso": ["VIREMENT A", "VIREMENT INSTANTANE", "VIR SEPA"],
-        "🏧 Retraits": ["RETRAIT DAB", "RETRAIT GAB"],
-        "🌐 Web/Énergie": ["FREE", "SFR", "BOUYGUES", "EDF", "ENGIE"],
-    }
-    
-    for cat, mots in CATEGORIES_MOTS_CLES.items():
-        if any(m in n_brut for m in mots): return cat
-    
-    return "💰 Autres Revenus" if montant > 0 else "❓ Autre"
 
 # --- 4. INITIALISATION ---
-if 'df' not in st.session_state: st.session_state.df = charger_donnees()
 if 'config_groupes' not in st.session_state: st.session_state.config_groupes = charger_config()
 if 'groupes_liste' not in st.session_state: st.session_state.groupes_liste = charger_groupes()
 
@@ -442,58 +456,33 @@ if 'groupes_liste' not in st.session_state: st.session_state.groupes_liste = cha
 comptes_avec_data = st.session_state.df["Compte"].unique().tolist() if not st.session_state.df.empty else []
 
 # --- 2. On récupère TOUS les comptes configurés dans ton fichier config ---
-comptes_configures = []
-if os.path.exists("config_comptes.csv"):
-    try:
-        df_cfg = pd.read_csv("config_comptes.csv", encoding='utf-8-sig')
-        # On suppose que le nom du compte est dans la première colonne
-        comptes_configures = df_cfg.iloc[:, 0].unique().tolist()
-    except:
-        pass
+comptes_configures = charger_registre().comptes()
 
 # --- 3. On fusionne les deux listes (sans doublons) pour la liste déroulante ---
 comptes_detectes = sorted(list(set(comptes_avec_data + comptes_configures)))
 bg_color_saved = st.session_state.get('page_bg_color', "#0e1117")
 # --- 5. SIDEBAR ---
+mesure_barre = demarrer_chrono("barre_laterale")
 with st.sidebar:
     st.title("🛡️ Configuration")
 
     st.subheader("🎨 Réglages du Thème")
 
-    col_patri = st.color_picker("Évolution Patrimoine", charger_couleur("color_patrimoine.txt", "#1f77b4"))
-    sauvegarder_couleur("color_patrimoine.txt", col_patri)
-    
-    col_jauge = st.color_picker("Jauge Objectif", charger_couleur("color_jauge.txt", "#f1c40f"))
-    sauvegarder_couleur("color_jauge.txt", col_jauge)
-    
-    col_dep = st.color_picker("Barres des dépenses", charger_couleur("color_depenses.txt", "#e74c3c"))
-    sauvegarder_couleur("color_depenses.txt", col_dep)
-    
-    col_rev = st.color_picker("Aires des Revenus", charger_couleur("color_revenus.txt", "#2ecc71"))
-    sauvegarder_couleur("color_revenus.txt", col_rev)
-    
-    col_perf_dep = st.color_picker("Aires des Dépenses", charger_couleur("color_perf_dep.txt", "#e74c3c"))
-    sauvegarder_couleur("color_perf_dep.txt", col_perf_dep)
-
-    col_epargne = st.color_picker("Aires de l'Épargne", charger_couleur("color_epargne.txt", "#3498db"))
-    sauvegarder_couleur("color_epargne.txt", col_epargne)
-
-    col_Icones = st.color_picker("Icones menus", charger_couleur("color_icones", "#15C98D"))
-    sauvegarder_couleur("color_epargne.txt", col_Icones)
+    col_patri = selecteur_couleur("Évolution Patrimoine", "color_patrimoine", "#1f77b4")
+    col_jauge = selecteur_couleur("Jauge Objectif", "color_jauge", "#f1c40f")
+    col_dep = selecteur_couleur("Barres des dépenses", "color_depenses", "#e74c3c")
+    col_rev = selecteur_couleur("Aires des Revenus", "color_revenus", "#2ecc71")
+    col_perf_dep = selecteur_couleur("Aires des Dépenses", "color_perf_dep", "#e74c3c")
+    col_epargne = selecteur_couleur("Aires de l'Épargne", "color_epargne", "#3498db")
+    col_Icones = selecteur_couleur("Icones menus", "color_icones", "#15C98D")
    
    
     toutes_cats = sorted(st.session_state.df["Categorie"].unique().tolist()) if not st.session_state.df.empty else []
 
-      # 1. On charge la couleur depuis le fichier (ou gris foncé par défaut)
-    bg_color = st.color_picker(
-        "Couleur de fond", 
-        charger_couleur("color_background.txt", "#0e1117")
-    )
-    
-    # 2. On sauvegarde immédiatement le choix
-    sauvegarder_couleur("color_background.txt", bg_color)
+    # Couleur de fond (gris foncé par défaut), enregistrée seulement si elle change
+    bg_color = selecteur_couleur("Couleur de fond", "color_background", "#0e1117")
 
-    # --- 3. INJECTION DU CSS POUR APPLIQUER LA COULEUR ---
+    # --- INJECTION DU CSS POUR APPLIQUER LA COULEUR ---
     st.markdown(f"""
         <style>
         .stApp {{
@@ -536,10 +525,39 @@ with st.sidebar:
             on_change=update_couleur_compte,
             args=(c,)
         )
-            
+
+    st.subheader("🗄️ Stockage")
+    if stockage_sqlite_actif():
+        st.caption("Base SQLite active (requêtes indexées).")
+    else:
+        st.caption("Stockage CSV : chaque enregistrement réécrit tout le fichier.")
+        if st.button("Migrer vers SQLite", use_container_width=True):
+            nb = migrer_csv_vers_sqlite()
+            publier_donnees(charger_donnees())
+            st.toast(f"✅ {nb} transactions migrées vers SQLite")
+            st.rerun()
+
+    # Empreinte mémoire du grand livre partagé (schéma texte d'origine vs schéma compact)
+    if st.toggle("🧠 Mémoire du grand livre", key="rapport_memoire") and not st.session_state.df.empty:
+        st.dataframe(rapport_memoire(st.session_state.df), use_container_width=True)
+
+    # Chronos des dernières exécutions (ms) et compteurs de lectures / écritures, exportables
+    if st.toggle("⏱️ Performances", key="panneau_mesures"):
+        releves = derniers_releves(20)
+        if releves:
+            st.dataframe(pd.json_normalize(releves[::-1]), hide_index=True, use_container_width=True)
+            st.download_button("📥 Exporter les mesures (JSON lines)", exporter_journal(), file_name="mesures_performances.jsonl", mime="application/x-ndjson", use_container_width=True)
+        else:
+            st.caption("Aucune mesure pour l'instant.")
+arreter_chrono(mesure_barre)
 
 
 
+
+# Registre de la session (config en cours d'édition, comptes détectés compris) : index des groupes
+# calculé une fois par exécution pour les filtres et les totaux
+registre_session = RegistreComptes(st.session_state.config_groupes)
+
 # --- BARRE DE NAVIGATION CAMOUFLÉE ---
 selected = option_menu(
     menu_title=None,
@@ -610,14 +628,467 @@ st.markdown("""
 
 
 
+# --- RENDU HTML GROUPÉ ---
+# Chaque liste est envoyée en UN seul bloc HTML : le nombre de messages par rerun ne dépend
+# plus du nombre de transactions. Les lignes sont formatées colonne par colonne (pandas).
+
+def html_liste_compacte(df, couleur_montant, prefixe=""):
+    if df.empty: return ""
+    categories = df['Categorie'].astype("str").fillna("")
+    icones = "🔄" if prefixe == "🔄" else categories.str[:1].mask(categories == "", "💰")
+    lignes = (
+        '<div style="display: flex; align-items: center; justify-content: space-between; padding: 4px 0; border-bottom: 1px solid #f0f2f6;">'
+        '<div style="display: flex; align-items: center; gap: 8px;">'
+        '<span style="font-size: 15px;">' + icones + '</span>'
+        '<div><p style="margin: 0; font-weight: bold; font-size: 12px; line-height: 1.1;">' + df['Nom'].astype("str").fillna("") + '</p>'
+        '<p style="margin: 0; font-size: 10px; color: gray;">' + df['Date'].dt.strftime('%d/%m') + ' • ' + df['Compte'].astype("str").fillna("") + '</p></div>'
+        '</div>'
+        f'<div style="text-align: right;"><p style="margin: 0; color: {couleur_montant}; font-weight: bold; font-size: 12px;">{prefixe}'
+        + df['Montant'].abs().map("{:.2f}".format) + '€</p></div>'
+        '</div>'
+    )
+    return "".join(lignes)
+
+# Mêmes proportions que les anciennes colonnes Streamlit [1.2, 1, 1, 1.2, 1.3]
+GRILLE_RECAP = "display: grid; grid-template-columns: 1.2fr 1fr 1fr 1.2fr 1.3fr; column-gap: 1rem; align-items: center;"
+
+def html_entete_recap():
+    base_h = "margin:0; font-weight:bold; font-size:10px; color:gray; text-align:Center;"
+    return f"<div style='{GRILLE_RECAP}'>" + "".join(f"<p style='{base_h}'>{t}</p>" for t in ["MOIS", "REVENUS", "DÉPENSES", "ÉPARGNE", "SOLDE"]) + "</div>"
+
+def html_recap_annuel(df_tab, col_rev, col_dep, col_epargne, col_patri):
+    base_d = "margin:0; font-weight:bold; font-size:13px;"
+    # Style gris pour les mois sans mouvement
+    opacite = ((df_tab['Revenus'] > 0) | (df_tab['Dépenses'] > 0)).map({True: "1.0", False: "0.4"})
+    couleur_ep = (df_tab['Épargne'] >= 0).map({True: col_epargne, False: "#ff4b4b"})
+    def euros(colonne): return df_tab[colonne].map("{:,.0f}€".format)
+    lignes = (
+        f"<div style='{GRILLE_RECAP}'>"
+        f"<p style='{base_d} text-align:left; opacity:" + opacite + ";'>" + df_tab['Mois'].astype("str") + "</p>"
+        f"<p style='{base_d} text-align:right; color:{col_rev}; opacity:" + opacite + ";'>" + euros('Revenus') + "</p>"
+        f"<p style='{base_d} text-align:right; color:{col_dep}; opacity:" + opacite + ";'>" + euros('Dépenses') + "</p>"
+        f"<p style='{base_d} text-align:right; color:" + couleur_ep + "; opacity:" + opacite + ";'>" + euros('Épargne') + "</p>"
+        f"<p style='{base_d} text-align:right; color:{col_patri};'>" + euros('Patrimoine') + "</p>"
+        "</div><hr style='margin: 4px 0; border: 0.1px solid #f8f9fb;'>"
+    )
+    return "".join(lignes)
+
+
+# --- FIGURES PLOTLY (mémorisées) ---
+# Une figure est décrite par une petite clé : version du grand livre, comptes, année, réglages
+# affichés et couleurs. Tant qu'elle ne change pas, un rerun réutilise le JSON de la figure déjà
+# construite (traces, dégradés, validation Plotly) sans hacher ni dépickler de DataFrame.
+# Chaque appel reçoit sa propre Figure : une session ne modifie jamais la figure d'une autre.
+NB_FIGURES_CACHE = 64
+
+@st.cache_resource(show_spinner=False)
+def cache_figures():
+    return {"figures": OrderedDict(), "verrou": threading.Lock()}
+
+def figure_memorisee(cle, construire):
+    # construire() n'est appelée qu'en l'absence de la clé ; les plus anciennes figures sont oubliées
+    cache = cache_figures()
+    with cache["verrou"]:
+        spec = cache["figures"].get(cle)
+        if spec is not None: cache["figures"].move_to_end(cle)
+    if spec is None:
+        spec = pio.to_json(construire(), validate=False)
+        with cache["verrou"]:
+            cache["figures"][cle] = spec
+            while len(cache["figures"]) > NB_FIGURES_CACHE: cache["figures"].popitem(last=False)
+    # Le JSON vient d'une figure déjà validée à sa construction : pas de seconde validation
+    return go.Figure(json.loads(spec), _validate=False)
+
+def degrade_vertical(couleur_hex):
+    # Dégradé de la couleur : transparent en bas, 60% d'opacité en haut
+    hex_c = couleur_hex.lstrip('#')
+    r, g, b = tuple(int(hex_c[i:i+2], 16) for i in (0, 2, 4))
+    return dict(
+        type='vertical',
+        colorscale=[
+            (0, f'rgba({r},{g},{b},0)'),   # 0% en bas
+            (1, f'rgba({r},{g},{b},0.6)') # 60% en haut
+        ]
+    )
+
+def figure_depenses(df_res, couleur_barres):
+    fig_b = px.bar(df_res, x="Montant", y="Categorie", orientation='h')
+
+    max_val = df_res["Montant"].max()
+    fig_b.update_traces(
+        marker_color=couleur_barres, 
+        texttemplate='%{x:.0f} €',
+        textposition='outside', 
+        textfont=dict(size=10, color="gray")
+    )
+    fig_b.update_layout(
+        height=400, 
+        margin=dict(l=0, r=50, t=10, b=0), 
+        xaxis=dict(showgrid=False, visible=False, range=[0, max_val * 1.3]),
+        yaxis=dict(showgrid=False, tickfont=dict(color="gray")),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig_b
+
+def figure_flux(df_flux, profil, annee, couleurs):
+    # couleurs = (revenus, dépenses, épargne)
+    fig_p = go.Figure()
+    for colonne, nom, couleur in zip(["Revenus", "Dépenses", "Épargne"], ["Rev.", "Dép.", "Épar."], couleurs):
+        fig_p.add_trace(go.Scatter(
+            x=df_flux["Mois"], y=df_flux[colonne], name=nom, 
+            fill='tozeroy', 
+            line=dict(color=couleur, width=2),
+            fillgradient=degrade_vertical(couleur)
+        ))
+
+    fig_p.update_layout(
+        title=dict(text=f"Flux {annee} : {profil}", font=dict(size=14, color="white")),
+        height=180, 
+        margin=dict(l=0, r=0, t=40, b=0),
+        hovermode="x unified",
+        showlegend=True,
+        paper_bgcolor='rgba(0,0,0,0)', 
+        plot_bgcolor='rgba(0,0,0,0)',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(size=10, color="gray")),
+        xaxis=dict(showgrid=False, tickfont=dict(size=10, color="gray")),
+        yaxis=dict(showgrid=False, visible=False)
+    )
+    return fig_p
+
+def figure_evolution(df_evol, profil, titre_evol, couleurs_comptes, couleur_total):
+    # couleurs_comptes = ((compte, couleur), ...) dans l'ordre d'empilement
+    fig_e = go.Figure()
+    for nom_c, couleur_hex in couleurs_comptes:
+        fig_e.add_trace(go.Scatter(
+            x=df_evol["Mois"], 
+            y=df_evol[nom_c], 
+            name=nom_c, 
+            stackgroup='one', 
+            line=dict(color=couleur_hex, width=1.5),
+            fillgradient=degrade_vertical(couleur_hex),
+            hoverinfo='x+y+name'
+        ))
+
+    # Ajout du TOTAL (Ligne pointillée)
+    fig_e.add_trace(go.Scatter(
+        x=df_evol["Mois"], 
+        y=df_evol["Patrimoine"], 
+        name="TOTAL", 
+        line=dict(color=couleur_total, width=3, dash='dot')
+    ))
+
+    fig_e.update_layout(
+        title=dict(text=f"Évolution comptes {titre_evol} : {profil}", font=dict(size=14, color="white")),
+        height=300, 
+        margin=dict(l=0, r=0, t=40, b=0),
+        hovermode="x unified",
+        showlegend=True,
+        xaxis=dict(showgrid=False, tickfont=dict(color="gray")),
+        yaxis=dict(showgrid=False, visible=False),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        legend=dict(orientation="h", yanchor="bottom", y=0.93, xanchor="right", x=1, font=dict(color="gray", size=10))
+    )
+    return fig_e
+
+
+# --- FRAGMENTS (zones recalculées seules) ---
+# Un widget placé dans un fragment ne relance que ce fragment, pas toute la page.
+# Les données dont dépend chaque zone lui sont passées explicitement en paramètres.
+
+@st.fragment
+@releve_de_fragment()
+def panneau_details(df, comptes_profil, annee_choisie, liste_m, categories_annee, couleur_barres):
+    # Le choix du mois ne concerne que ce panneau : le récapitulatif et les graphiques ne sont pas recalculés
+    mois_choisi = st.selectbox("📆 Mois :", liste_m)
+
+    # 1. Utilisation de Markdown au lieu de subheader pour un contrôle total des marges
+    st.markdown(f"""
+        <h3 style='margin-bottom: 0px; padding-bottom: 0px;'>
+            📋 Détails {mois_choisi} {annee_choisie}
+        </h3>
+    """, unsafe_allow_html=True)
+
+    # 2. CSS compact étendu
+    st.markdown("""
+        <style>
+        /* Supprime l'espace vertical entre les blocs Streamlit dans cette colonne */
+        [data-testid="stVerticalBlock"] > div {
+            gap: 0rem !important;
+        }
+
+        /* Compactage des onglets */
+        button[data-baseweb="tab"] {
+            padding-left: 00px !important;
+            padding-right: 10px !important;
+            gap: 4px !important;
+            margin-top: 0px !important;
+        }
+
+        /* Réduit l'espace au-dessus du conteneur d'onglets */
+        div[data-testid="stTabs"] {
+            margin-top: 0px !important;
+        }
+        </style>
+    """, unsafe_allow_html=True)
+
+    # 2. PRÉPARER LES DONNÉES 
+    # SÉCURITÉ : On filtre par Mois ET par Année pour être certain
+    # Seules les lignes du mois affiché sont lues (requête indexée en SQLite)
+    if mois_choisi is not None:
+        df_m = lire_transactions(df, comptes_profil, annee_choisie, mois_choisi).sort_values("Date", ascending=False)
+    else:
+        df_m = df.iloc[0:0]
+
+    is_vir = df_m['Categorie'].str.upper().isin([c.upper() for c in CATEGORIES_VIREMENTS])
+
+    df_virs = df_m[is_vir]
+    df_dep = df_m[(df_m['Montant'] < 0) & (~is_vir)]
+    df_rev = df_m[(df_m['Montant'] > 0) & (~is_vir)]
+
+    # 3. ONGLETS COMPACTS
+    t_dep, t_rev, t_vir, t_graph = st.tabs([
+        f"Dépenses ({len(df_dep)})", 
+        f"Revenus ({len(df_rev)})", 
+        f"Transferts({len(df_virs)})",
+        "Analyses"
+    ])
+
+    with t_dep:
+        with st.container(height=430):
+            st.markdown(html_liste_compacte(df_dep, "#ff4b4b", "-"), unsafe_allow_html=True)
+
+    with t_rev:
+        with st.container(height=430):
+            st.markdown(html_liste_compacte(df_rev, "#00c853", "+"), unsafe_allow_html=True)
+
+    with t_vir:
+        with st.container(height=430):
+            st.markdown(html_liste_compacte(df_virs, "gray", ""), unsafe_allow_html=True)
+
+    with t_graph:
+        # Les options viennent du cube de l'année afin d'avoir toutes les catégories de l'année
+        # (dans le panneau : un fragment ne peut pas écrire dans la barre latérale)
+        categories_a_masquer = st.multiselect("Catégories à masquer", options=categories_annee, key="mask_recap")
+
+        liste_exclusion = CATEGORIES_VIREMENTS + categories_a_masquer
+        df_b = df_m[(df_m['Montant'] < 0) & (~df_m['Categorie'].isin(liste_exclusion))]
+
+        if not df_b.empty:
+            df_res = df_b.groupby("Categorie")["Montant"].sum().abs().reset_index().sort_values("Montant")
+            cle = ("depenses", st.session_state.version_df, tuple(comptes_profil or ()), annee_choisie, mois_choisi, tuple(categories_a_masquer), couleur_barres)
+            fig_b = figure_memorisee(cle, lambda: figure_depenses(df_res, couleur_barres))
+            with chrono("plotly"):
+                st.plotly_chart(fig_b, use_container_width=True, config={'displayModeBar': False})
+        else:
+            st.info("Aucune dépense à analyser pour cette période.")
+
+
+@st.fragment
+@releve_de_fragment()
+def graphique_evolution(df_tab, cps, index_soldes, registre_session, registre_fichier, annee_choisie, choix_actuel, couleur_total):
+    # Option : courbe sur toutes les années (soldes de fin de mois lus dans l'index)
+    df_evol, titre_evol = df_tab, f"{annee_choisie}"
+    periode = periode_index_soldes(index_soldes, [str(c).strip() for c in cps])
+    toutes_annees = st.toggle("📈 Toutes les années", key="evol_toutes_annees") and periode is not None
+    if toutes_annees:
+        mois_evol = pd.date_range(periode[0].to_period("M").to_timestamp(), periode[1], freq="MS")
+        df_evol = pd.DataFrame({"Mois": mois_evol})
+        for c in cps:
+            nom_c = str(c).strip()
+            df_evol[nom_c] = soldes_fin_de_mois(index_soldes, nom_c, mois_evol, registre_session.solde(nom_c))
+        df_evol["Patrimoine"] = df_evol[[str(c).strip() for c in cps]].sum(axis=1)
+        titre_evol = f"{mois_evol[0].year}" if mois_evol[0].year == mois_evol[-1].year else f"{mois_evol[0].year}-{mois_evol[-1].year}"
+
+
+    # Couleur enregistrée du compte (registre), sinon celle de la session
+    couleurs_comptes = tuple(
+        (nom_c, registre_fichier.couleur(nom_c) or registre_session.couleur(nom_c, COULEUR_COMPTE_DEFAUT))
+        for nom_c in (str(c).strip() for c in cps) if nom_c in df_evol.columns
+    )
+    df_figure = df_evol[["Mois"] + [nom_c for nom_c, _ in couleurs_comptes] + ["Patrimoine"]]
+    # Les soldes initiaux viennent du registre, hors grand livre : ils font partie de la clé
+    soldes_initiaux = tuple(registre_session.solde(str(c).strip()) for c in cps)
+    cle = ("evolution", st.session_state.version_df, choix_actuel, annee_choisie, toutes_annees, soldes_initiaux, couleurs_comptes, couleur_total)
+    fig_e = figure_memorisee(cle, lambda: figure_evolution(df_figure, choix_actuel, titre_evol, couleurs_comptes, couleur_total))
+    with chrono("plotly"):
+        st.plotly_chart(fig_e, use_container_width=True, config={'displayModeBar': False},key=f"patri_{choix_actuel}_{annee_choisie}")
+
+
+@st.fragment
+@releve_de_fragment()
+def regle_recategorisation(df, version, comptes):
+    # L'aperçu est recalculé à chaque changement de la règle sans relancer toute la page Gestion
+    motif = st.text_input("Le libellé contient", key="regle_motif", placeholder="ex : AMAZON")
+    compte = st.selectbox("Compte", ["Tous"] + comptes, key="regle_compte")
+    rd1, rd2 = st.columns(2)
+    date_debut = rd1.date_input("Du", value=None, format="DD/MM/YYYY", key="regle_debut")
+    date_fin = rd2.date_input("Au", value=None, format="DD/MM/YYYY", key="regle_fin")
+    rm1, rm2 = st.columns(2)
+    montant_min = rm1.number_input("Montant min (€)", min_value=0.0, value=None, step=10.0, key="regle_min")
+    montant_max = rm2.number_input("Montant max (€)", min_value=0.0, value=None, step=10.0, key="regle_max")
+    categorie = st.selectbox("Nouvelle catégorie", LISTE_CATEGORIES_COMPLETE, key="regle_categorie")
+    # La mémoire associe un libellé exact à une catégorie : elle retient les libellés visés, pas la règle
+    memoriser = st.checkbox(
+        "🧠 Mémoriser ces libellés pour les futurs imports", value=True, key="regle_memo",
+        help="Chaque libellé visé est retenu tel quel : un nouveau libellé contenant le motif ne sera pas reconnu."
+    )
+
+    masque = masque_regle(df, motif, None if compte == "Tous" else compte, date_debut, date_fin, montant_min, montant_max)
+    cibles = df[masque]
+    a_changer = int((cibles["Categorie"].astype(object) != categorie).sum())
+    st.caption(f"Aperçu : {len(cibles)} transactions concernées, dont {a_changer} à recatégoriser")
+    if st.button(f"🏷️ Appliquer ({a_changer})", use_container_width=True, type="primary", disabled=a_changer == 0, key="regle_appliquer"):
+        # Un seul masque et une seule écriture pour toutes les lignes visées
+        df = donnees_a_jour(version)
+        if df is None: refuser_ecriture_perimee()
+        publier_donnees(recategoriser_transactions(df, cibles.index, categorie))
+        if memoriser: sauvegarder_apprentissages(zip(cibles["Nom"], [categorie] * len(cibles)))
+        st.toast(f"✅ {a_changer} transactions passées en {categorie}", icon="🏷️")
+        time.sleep(1)
+        st.rerun()
+
+
+@st.fragment
+@releve_de_fragment()
+def editeur_transactions(df_f, version):
+    # Les sélecteurs de catégorie / mois ne relancent que l'éditeur (st.rerun() relance toute la page)
+    ct1, ct2, ct3 = st.columns([1.5, 1, 0.8]) # On ajoute une 3ème colonne
+    with ct1: 
+        st.markdown(f"### 📝 Édition ({len(df_f)})")
+
+    with ct2:
+        # On utilise "Categorie" sans accent pour correspondre au DataFrame
+        mode_tri = st.selectbox("📍 Trier par", ["Date", "Montant", "Categorie", "Nom"], label_visibility="collapsed")
+
+    with ct3:
+        # Choix de l'ordre
+        ordre = st.selectbox("Ordre", ["Décroissant", "Ascendant"], label_visibility="collapsed")
+        est_ascendant = (ordre == "Ascendant")
+
+    # Application du tri
+    if mode_tri in df_f.columns:
+        # Cas particulier : pour le montant, on inverse souvent la logique intuitive
+        # (Décroissant = les plus grosses dépenses en premier)
+        df_f = df_f.sort_values(by=mode_tri, ascending=est_ascendant)
+
+    # PAGINATION : on ne crée les widgets que pour la page affichée
+    # (le coût d'affichage dépend de la taille de page, pas du nombre de lignes filtrées)
+    cp1, cp2, cp3 = st.columns([1, 1, 1.3])
+    with cp2:
+        taille_page = st.selectbox("Lignes par page", TAILLES_PAGE_GESTION, index=1, key="taille_page_gestion", label_visibility="collapsed")
+    nb_pages = max(1, -(-len(df_f) // taille_page))
+    # On recale la page si les filtres ont réduit le nombre de lignes
+    st.session_state.page_gestion = min(max(1, st.session_state.get("page_gestion", 1)), nb_pages)
+    with cp1:
+        page = st.number_input("Page", min_value=1, max_value=nb_pages, step=1, key="page_gestion", label_visibility="collapsed")
+    with cp3:
+        st.caption(f"Page {page} / {nb_pages} • {taille_page} lignes par page")
+
+    df_page = df_f.iloc[(page - 1) * taille_page: page * taille_page].copy()
+    df_page['Date_Affiche'] = df_page['Date'].dt.strftime('%d/%m/%Y')
+
+    # Modifications en attente (toutes pages confondues) : {index: {"Categorie": ..., "Mois": ...}}
+    modifs = st.session_state.modifs_gestion
+
+    h_col1, h_col2, h_col3, h_col4 = st.columns([3, 2, 2, 0.5])
+    h_col1.caption("DÉTAILS")
+    h_col2.caption("CATÉGORIE")
+    h_col3.caption("MOIS")
+    h_col4.caption("X")
+    # Conteneur de défilement pour les transactions
+    with st.container(height=600, border=True):
+        for idx, row in df_page.iterrows():
+            color_amount = "#2ecc71" if row['Montant'] > 0 else "#ff4b4b"
+            c_info, c_cat, c_mois, c_del = st.columns([3, 2, 2, 0.5])
+
+            with c_info:
+                st.markdown(f'<div style="border-left:3px solid {color_amount}; padding-left:10px;"><div style="font-weight:bold; font-size:13px;">{row["Nom"]}</div><div style="font-size:11px; color:gray;">{row["Date_Affiche"]} • {row["Compte"]}</div><div style="font-weight:bold; color:{color_amount}; font-size:13px;">{row["Montant"]:.2f} €</div></div>', unsafe_allow_html=True)
+
+            # Valeurs affichées : modification en attente si l'utilisateur est déjà passé par là
+            cat_aff = modifs.get(idx, {}).get('Categorie', row['Categorie'])
+            mois_aff = modifs.get(idx, {}).get('Mois', row['Mois'])
+
+            with c_cat:
+                n_cat_ligne = st.selectbox("C", options=LISTE_CATEGORIES_COMPLETE, index=LISTE_CATEGORIES_COMPLETE.index(cat_aff) if cat_aff in LISTE_CATEGORIES_COMPLETE else 0, key=f"cat_{idx}", label_visibility="collapsed")
+
+            with c_mois:
+                n_mois_ligne = st.selectbox("M", options=NOMS_MOIS, index=NOMS_MOIS.index(mois_aff) if mois_aff in NOMS_MOIS else 0, key=f"mo_{idx}", label_visibility="collapsed")
+
+            # On ne garde en attente que ce que l'utilisateur a changé
+            # (une valeur hors liste affichée par défaut n'est pas une modification)
+            cat_base = row['Categorie'] if row['Categorie'] in LISTE_CATEGORIES_COMPLETE else LISTE_CATEGORIES_COMPLETE[0]
+            mois_base = row['Mois'] if row['Mois'] in NOMS_MOIS else NOMS_MOIS[0]
+            if n_cat_ligne != cat_base or n_mois_ligne != mois_base:
+                modifs[idx] = {
+                    'Categorie': n_cat_ligne if n_cat_ligne != cat_base else row['Categorie'],
+                    'Mois': n_mois_ligne if n_mois_ligne != mois_base else row['Mois'],
+                }
+            else:
+                modifs.pop(idx, None)
+
+            with c_del:
+                if st.button("🗑️", key=f"d_{idx}"):
+                    df = donnees_a_jour(version)
+                    if df is None: refuser_ecriture_perimee()
+                    publier_donnees(supprimer_transactions(df, [idx]))
+                    st.rerun()
+
+            st.markdown('<hr style="margin:5px 0; border:0; border-top:1px solid rgba(128,128,128,0.05);">', unsafe_allow_html=True)
+
+    # --- ICI ON SORT DE LA BOUCLE FOR (Même niveau que le for) ---
+
+
+    # Les lignes supprimées entre-temps ne sont plus à modifier
+    for idx_modif in [i for i in modifs if i not in st.session_state.df.index]: modifs.pop(idx_modif)
+    if modifs: st.caption(f"✏️ {len(modifs)} modification(s) en attente")
+
+    # Checkbox hors boucle pour éviter l'erreur DuplicateElementID
+    apprendre = st.checkbox(
+        "🧠 Mémoriser les changements de catégories pour les futurs imports", 
+        value=True, 
+        key="global_memo_setting" 
+    )
+
+    if st.button("💾 Sauvegarder les modifications", use_container_width=True, type="primary", key="main_save_btn"):
+        df = donnees_a_jour(version)
+        if df is None:
+            # Les index en attente peuvent désigner d'autres lignes dans le nouveau grand livre (relu depuis
+            # le fichier) : on ne garde que les modifications dont la ligne est restée la même
+            df_courant = donnees_partagees()
+            communs = [i for i in modifs if i in df_courant.index]
+            memes = calculer_empreintes(st.session_state.df.loc[communs]).values == calculer_empreintes(df_courant.loc[communs]).values
+            st.session_state.modifs_gestion = {i: modifs[i] for i, meme in zip(communs, memes) if meme}
+            refuser_ecriture_perimee()
+        # Les modifications de toutes les pages sont appliquées d'un coup
+        # En texte : une catégorie nouvelle ne rentre pas dans le type catégoriel du grand livre
+        df_modifs = df.loc[list(modifs)].astype({'Categorie': object, 'Mois': object})
+        for idx_save, valeurs in modifs.items():
+            df_modifs.at[idx_save, 'Categorie'] = valeurs['Categorie']
+            df_modifs.at[idx_save, 'Mois'] = valeurs['Mois']
+
+        if apprendre:
+            # On compare avec la valeur d'origine dans le session_state
+            anciennes_cats = df.loc[df_modifs.index, 'Categorie']
+            changees = df_modifs[anciennes_cats.values != df_modifs['Categorie'].values]
+            sauvegarder_apprentissages(zip(changees['Nom'], changees['Categorie']))
+
+        # Mise à jour globale : seules les lignes modifiées sont écrites
+        publier_donnees(modifier_transactions(df, df_modifs))
+        st.session_state.modifs_gestion = {}
+        st.success("Modifications enregistrées ! ✨")
+        time.sleep(1)
+        st.rerun()
+
+
+
 # --- LOGIQUE D'AFFICHAGE (Routage) ---
+etiqueter_releve(selected)
+mesure_onglet = demarrer_chrono(f"onglet {selected}")
 if selected == "Analyses":
     # --- 6. TAB DASHBOARD ---
         if not st.session_state.df.empty:
-            # On s'assure que la colonne Année existe dans le DataFrame
-            if "Année" not in st.session_state.df.columns:
-                st.session_state.df["Année"] = st.session_state.df["Date"].dt.year
-
             # 1. LES SÉLECTEURS (Profil, Année, Mois)
             cols_filtres = st.columns([1, 1, 1, 1])
             
@@ -630,35 +1101,46 @@ if selected == "Analyses":
 
             # --- LOGIQUE DE FILTRAGE PAR PROFIL ---
             choix_actuel = st.session_state.choix_g
-            df_h = st.session_state.df.copy()
 
             if choix_actuel != "Tout le monde":
-                cps = [c for c, cfg in st.session_state.config_groupes.items() if cfg.get("Groupe") == choix_actuel]
-                df_dash = df_h[df_h["Compte"].isin(cps)].copy()
-                s_init = sum([v.get("Solde", 0.0) for k, v in st.session_state.config_groupes.items() if k in cps])
-                obj = sum([v.get("Objectif", 0.0) for k, v in st.session_state.config_groupes.items() if v.get("Groupe") == choix_actuel])
+                cps = registre_session.comptes_du_groupe(choix_actuel)
+                comptes_profil = cps
             else:
-                cps = list(st.session_state.config_groupes.keys())
-                df_dash = df_h.copy()
-                s_init = sum([v.get("Solde", 0.0) for v in st.session_state.config_groupes.values()])
-                obj = sum([v.get("Objectif", 0.0) for v in st.session_state.config_groupes.values()])
+                cps = registre_session.comptes()
+                comptes_profil = None
+            s_init = registre_session.total_soldes(cps)
+            obj = registre_session.total_objectifs(cps)
+
+            # Tous les totaux viennent du cube des cumuls mensuels (Compte, Année, Mois, Categorie)
+            cube = charger_cumuls(st.session_state.df)
+            cube_profil = cube if comptes_profil is None else cube[cube["Compte"].isin(comptes_profil)]
 
             # --- NOUVEAU : FILTRAGE PAR ANNÉE ---
-            liste_annees = sorted(df_dash['Année'].unique().tolist(), reverse=True)
+            liste_annees = sorted(cube_profil["Année"].dropna().astype(int).unique().tolist(), reverse=True)
             with cols_filtres[1]:
                 annee_choisie = st.selectbox("📅 Année :", liste_annees)
             
-            # On affine df_dash avec l'année choisie
-            df_dash = df_dash[df_dash["Année"] == annee_choisie]
+            cube_dash = cube_profil[cube_profil["Année"] == annee_choisie]
 
             # --- FILTRAGE PAR MOIS ---
-            liste_m = sorted(df_dash['Mois'].unique(), key=lambda x: NOMS_MOIS.index(x) if x in NOMS_MOIS else 0)
-            with cols_filtres[2]:
-                mois_choisi = st.selectbox("📆 Mois :", liste_m)
+            # Ordre chronologique donné par le type catégoriel ordonné des mois
+            # (le sélecteur est dans le panneau Détails : changer de mois ne relance que ce panneau)
+            mois_presents = cube_dash['Mois'].dropna().unique()
+            liste_m = pd.Categorical(mois_presents, dtype=type_mois(mois_presents)).sort_values().tolist()
 
             # Calculs finaux basés sur les filtres Profil + Année
-            solde_global = s_init + df_dash["Montant"].sum()
-            df_reel = df_dash[~df_dash["Categorie"].isin(["Virement Perso", "Transfert Interne"])].copy()
+            flux_dash = cube_dash["Revenus"] - cube_dash["Dépenses"]
+            solde_global = s_init + flux_dash.sum()
+            cube_reel = cube_dash[~cube_dash["Categorie"].isin(CATEGORIES_VIREMENTS)]
+
+            # Flux mensuels de chaque compte (12 mois × comptes)
+            flux_mensuels = flux_dash.groupby([cube_dash["Mois"], cube_dash["Compte"]]).sum().unstack("Compte").reindex(NOMS_MOIS).fillna(0.0)
+
+            def flux_du_compte(nom):
+                return flux_mensuels.get(nom, pd.Series(0.0, index=NOMS_MOIS)).to_numpy()
+
+            # Soldes des comptes à n'importe quelle date : recherche dichotomique dans l'index
+            index_soldes = index_soldes_partage()
 
             st.write(f"#### 🏦 Situation Financière : {choix_g}")
             col_Card = "#3498db"
@@ -674,33 +1156,17 @@ if selected == "Analyses":
                 """, unsafe_allow_html=True)
 
             # --- 2. CARTES DES COMPTES INDIVIDUELS ---
-            config_master = st.session_state.get('config_groupes', {})
 
             for i, c in enumerate(cps):
                 # NETTOYAGE : On enlève les espaces invisibles
                 nom_propre = str(c).strip()
                 
-                # Calcul du solde
-                val = config_master.get(nom_propre, {}).get("Solde", 0.0) + df_dash[df_dash["Compte"] == nom_propre]["Montant"].sum()
+                # Calcul du solde (solde initial + mouvements de l'année choisie)
+                val = registre_session.solde(nom_propre)
+                if annee_choisie is not None: val += flux_annee(index_soldes, nom_propre, annee_choisie)
                 
-                # RÉCUPÉRATION : On essaie d'abord le dictionnaire en mémoire
-                couleur_compte = config_master.get(nom_propre, {}).get("Couleur")
-
-                # Si absent du dict, on tente une relecture du CSV avec sécurité anti-KeyError
-                if not couleur_compte and os.path.exists("config_comptes.csv"):
-                    try:
-                        df_c = pd.read_csv("config_comptes.csv", index_col=0, encoding='utf-8-sig')
-                        # VÉRIFICATION SÉCURISÉE (Évite le crash KeyError)
-                        if nom_propre in df_c.index and "Couleur" in df_c.columns:
-                            val_csv = df_c.loc[nom_propre, "Couleur"]
-                            if pd.notna(val_csv):
-                                couleur_compte = val_csv
-                    except Exception:
-                        pass # On ignore l'erreur pour ne pas bloquer l'affichage
-
-                # Sécurité finale si toujours rien (on utilise le bleu par défaut)
-                if not isinstance(couleur_compte, str) or pd.isna(couleur_compte) or not str(couleur_compte).startswith("#"):
-                    couleur_compte = col_Card
+                # Couleur : la session d'abord, puis le registre des comptes, sinon celle des cartes
+                couleur_compte = registre_session.couleur(nom_propre) or registre_fichier.couleur(nom_propre, col_Card)
 
                 with cols_kpi[i+1]:
                     st.markdown(f"""
@@ -711,27 +1177,17 @@ if selected == "Analyses":
                     """, unsafe_allow_html=True)
 
             # Données Annuelles (Mots entiers et Épargne)
-            annee_max = df_dash['Date'].dt.year.max()
-            df_ann = df_reel[df_dash['Date'].dt.year == annee_max].groupby('Mois').agg(
-                Revenus=('Montant', lambda x: x[x > 0].sum()),
-                Dépenses=('Montant', lambda x: abs(x[x < 0].sum()))
-            ).reset_index()
+            df_ann = cube_reel.groupby('Mois')[['Revenus', 'Dépenses']].sum().reset_index()
             # 1. On crée la base du tableau avec les mois
             df_tab = pd.DataFrame({'Mois': NOMS_MOIS})
 
             # 2. On calcule le cumulé pour CHAQUE compte du groupe sélectionné
             for c in cps:
                 # On récupère le solde initial de ce compte précis
-                s_init_compte = st.session_state.config_groupes[c].get("Solde", 0.0)
+                s_init_compte = registre_session.solde(c)
                 
-                # On calcule les mouvements mensuels pour ce compte
-                mouvements = df_dash[df_dash["Compte"] == c].groupby("Mois")["Montant"].sum().reset_index()
-                
-                # On fusionne avec les mois pour avoir les 12 mois, même sans mouvements
-                df_c = pd.merge(pd.DataFrame({'Mois': NOMS_MOIS}), mouvements, on='Mois', how='left').fillna(0)
-                
-                # On crée la colonne du compte avec son cumul
-                df_tab[c] = s_init_compte + df_c["Montant"].cumsum()
+                # On crée la colonne du compte avec le cumul de ses flux mensuels (12 mois, même sans mouvements)
+                df_tab[c] = s_init_compte + flux_du_compte(c).cumsum()
 
             # 3. On recrée les colonnes globales pour tes autres graphiques
             # On récupère aussi Revenus/Dépenses depuis df_ann pour garder tes autres stats
@@ -745,116 +1201,7 @@ if selected == "Analyses":
             c_recap, c_ann, c_graph = st.columns([1, 1, 1])
 
             with c_recap:
-        # 1. Utilisation de Markdown au lieu de subheader pour un contrôle total des marges
-                st.markdown(f"""
-                    <h3 style='margin-bottom: 0px; padding-bottom: 0px;'>
-                        📋 Détails {mois_choisi} {annee_choisie}
-                    </h3>
-                """, unsafe_allow_html=True)
-                
-                # 2. CSS compact étendu
-                st.markdown("""
-                    <style>
-                    /* Supprime l'espace vertical entre les blocs Streamlit dans cette colonne */
-                    [data-testid="stVerticalBlock"] > div {
-                        gap: 0rem !important;
-                    }
-                    
-                    /* Compactage des onglets */
-                    button[data-baseweb="tab"] {
-                        padding-left: 00px !important;
-                        padding-right: 10px !important;
-                        gap: 4px !important;
-                        margin-top: 0px !important;
-                    }
-                    
-                    /* Réduit l'espace au-dessus du conteneur d'onglets */
-                    div[data-testid="stTabs"] {
-                        margin-top: 0px !important;
-                    }
-                    </style>
-                """, unsafe_allow_html=True)
-
-                # 1. DÉFINITION DE LA FONCTION (Inchangée)
-                def afficher_ligne_compacte(row, couleur_montant, prefixe=""):
-                    ico = row['Categorie'][:1] if row['Categorie'] else "💰"
-                    if prefixe == "🔄": ico = "🔄"
-                    st.markdown(f"""
-                        <div style="display: flex; align-items: center; justify-content: space-between; padding: 4px 0; border-bottom: 1px solid #f0f2f6;">
-                            <div style="display: flex; align-items: center; gap: 8px;">
-                                <span style="font-size: 15px;">{ico}</span>
-                                <div>
-                                    <p style="margin: 0; font-weight: bold; font-size: 12px; line-height: 1.1;">{row['Nom']}</p>
-                                    <p style="margin: 0; font-size: 10px; color: gray;">{row['Date'].strftime('%d/%m')} • {row['Compte']}</p>
-                                </div>
-                            </div>
-                            <div style="text-align: right;">
-                                <p style="margin: 0; color: {couleur_montant}; font-weight: bold; font-size: 12px;">{prefixe}{abs(row['Montant']):.2f}€</p>
-                            </div>
-                        </div>
-                    """, unsafe_allow_html=True)
-
-                # 2. PRÉPARER LES DONNÉES 
-                # SÉCURITÉ : On filtre par Mois ET par Année pour être certain
-                df_m = df_dash[(df_dash['Mois'] == mois_choisi) & (df_dash['Année'] == annee_choisie)].sort_values("Date", ascending=False)
-                
-                cats_masquees = ["Virement Perso", "Transfert Interne", "Virement interne", "🔄 Transfert Interne"]
-                is_vir = df_m['Categorie'].str.upper().isin([c.upper() for c in cats_masquees])
-
-                df_virs = df_m[is_vir]
-                df_dep = df_m[(df_m['Montant'] < 0) & (~is_vir)]
-                df_rev = df_m[(df_m['Montant'] > 0) & (~is_vir)]
-
-                # 3. ONGLETS COMPACTS
-                t_dep, t_rev, t_vir, t_graph = st.tabs([
-                    f"Dépenses ({len(df_dep)})", 
-                    f"Revenus ({len(df_rev)})", 
-                    f"Transferts({len(df_virs)})",
-                    "Analyses"
-                ])
-
-                with t_dep:
-                    with st.container(height=430):
-                        for _, row in df_dep.iterrows(): afficher_ligne_compacte(row, "#ff4b4b", "-")
-                
-                with t_rev:
-                    with st.container(height=430):
-                        for _, row in df_rev.iterrows(): afficher_ligne_compacte(row, "#00c853", "+")
-                
-                with t_vir:
-                    with st.container(height=430):
-                        for _, row in df_virs.iterrows(): afficher_ligne_compacte(row, "gray", "")
-
-                with t_graph:
-                    virements_techniques = ["Virement Perso", "Transfert Interne", "Virement interne", "🔄 Transfert Interne"]
-                    # On utilise df_dash pour les options du multiselect afin d'avoir toutes les catégories de l'année
-                    categories_a_masquer = st.sidebar.multiselect("Catégories à masquer", options=sorted(df_dash['Categorie'].unique()), key="mask_recap")
-                    
-                    liste_exclusion = virements_techniques + categories_a_masquer
-                    df_b = df_m[(df_m['Montant'] < 0) & (~df_m['Categorie'].isin(liste_exclusion))]
-                    
-                    if not df_b.empty:
-                        df_res = df_b.groupby("Categorie")["Montant"].sum().abs().reset_index().sort_values("Montant")
-                        fig_b = px.bar(df_res, x="Montant", y="Categorie", orientation='h')
-                        
-                        max_val = df_res["Montant"].max()
-                        fig_b.update_traces(
-                            marker_color=col_perf_dep, 
-                            texttemplate='%{x:.0f} €',
-                            textposition='outside', 
-                            textfont=dict(size=10, color="gray")
-                        )
-                        fig_b.update_layout(
-                            height=400, 
-                            margin=dict(l=0, r=50, t=10, b=0), 
-                            xaxis=dict(showgrid=False, visible=False, range=[0, max_val * 1.3]),
-                            yaxis=dict(showgrid=False, tickfont=dict(color="gray")),
-                            paper_bgcolor='rgba(0,0,0,0)',
-                            plot_bgcolor='rgba(0,0,0,0)'
-                        )
-                        st.plotly_chart(fig_b, use_container_width=True, config={'displayModeBar': False})
-                    else:
-                        st.info("Aucune dépense à analyser pour cette période.")
+                panneau_details(st.session_state.df, comptes_profil, annee_choisie, liste_m, sorted(cube_dash['Categorie'].unique()), col_perf_dep)
 
 
 
@@ -863,12 +1210,9 @@ if selected == "Analyses":
             with c_ann:
                 st.subheader(f"🗓️ Récapitulatif {annee_choisie}")
                 
-                if not df_dash.empty:
+                if not cube_dash.empty:
                     # 1. On crée le récap par mois existants
-                    df_reel_mois = df_dash.groupby('Mois')['Montant'].agg(
-                        Revenus=lambda x: x[x > 0].sum(),
-                        Dépenses=lambda x: abs(x[x < 0].sum())
-                    ).reset_index()
+                    df_reel_mois = cube_dash.groupby('Mois')[['Revenus', 'Dépenses']].sum().reset_index()
 
                     # 2. CRÉATION DE LA STRUCTURE COMPLÈTE (Jan à Déc)
                     # On crée un DataFrame avec tous les mois de ta liste NOMS_MOIS
@@ -880,46 +1224,18 @@ if selected == "Analyses":
                     # 3. On calcule l'épargne mensuelle
                     df_tab['Épargne'] = df_tab['Revenus'] - df_tab['Dépenses']
                     
-                    # 4. Tri chronologique (basé sur l'ordre de NOMS_MOIS)
-                    df_tab['Mois_idx'] = df_tab['Mois'].apply(lambda x: NOMS_MOIS.index(x))
-                    df_tab = df_tab.sort_values('Mois_idx')
-
-                    # 5. Calcul du Patrimoine cumulé
+                    # 4. Calcul du Patrimoine cumulé
                     # Le cumsum() fonctionnera sur les 12 mois, gardant le solde stable si l'épargne est à 0
                     df_tab['Patrimoine'] = s_init + df_tab['Épargne'].cumsum()
 
                     # --- AFFICHAGE DU TABLEAU ---
-                    h1, h2, h3, h4, h5 = st.columns([1.2, 1, 1, 1.2, 1.3])
-                    base_h = "margin:0; font-weight:bold; font-size:10px; color:gray;"
-                    
-                    h1.markdown(f"<p style='{base_h} text-align:Center;'>MOIS</p>", unsafe_allow_html=True)
-                    h2.markdown(f"<p style='{base_h} text-align:Center;'>REVENUS</p>", unsafe_allow_html=True)
-                    h3.markdown(f"<p style='{base_h} text-align:Center;'>DÉPENSES</p>", unsafe_allow_html=True)
-                    h4.markdown(f"<p style='{base_h} text-align:Center;'>ÉPARGNE</p>", unsafe_allow_html=True)
-                    h5.markdown(f"<p style='{base_h} text-align:Center;'>SOLDE</p>", unsafe_allow_html=True)
+                    st.markdown(html_entete_recap(), unsafe_allow_html=True)
 
                     st.markdown("<div style='margin-top: -10px;'></div>", unsafe_allow_html=True)
                     
                     with st.container(height=450):
-                        for _, row in df_tab.iterrows():
-                            # On n'affiche la ligne que si c'est un mois passé ou s'il y a de l'activité
-                            # (Optionnel : si tu veux vraiment voir les 12 mois même futurs, enlève toute condition)
-                            
-                            c1, c2, c3, c4, c5 = st.columns([1.2, 1, 1, 1.2, 1.3])
-                            
-                            color_ep = col_epargne if row['Épargne'] >= 0 else "#ff4b4b"
-                            base_d = "margin:0; font-weight:bold; font-size:13px;"
-                            
-                            # Style gris pour les mois à 0 (facultatif)
-                            opacity = "1.0" if (row['Revenus'] > 0 or row['Dépenses'] > 0) else "0.4"
-                            
-                            c1.markdown(f"<p style='{base_d} text-align:left; opacity:{opacity};'>{row['Mois']}</p>", unsafe_allow_html=True)
-                            c2.markdown(f"<p style='{base_d} text-align:right; color:{col_rev}; opacity:{opacity};'>{row['Revenus']:,.0f}€</p>", unsafe_allow_html=True)
-                            c3.markdown(f"<p style='{base_d} text-align:right; color:{col_perf_dep}; opacity:{opacity};'>{row['Dépenses']:,.0f}€</p>", unsafe_allow_html=True)
-                            c4.markdown(f"<p style='{base_d} text-align:right; color:{color_ep}; opacity:{opacity};'>{row['Épargne']:,.0f}€</p>", unsafe_allow_html=True)
-                            c5.markdown(f"<p style='{base_d} text-align:right; color:{col_patri};'>{row['Patrimoine']:,.0f}€</p>", unsafe_allow_html=True)
-                            
-                            st.markdown("<hr style='margin: 4px 0; border: 0.1px solid #f8f9fb;'>", unsafe_allow_html=True)
+                        # Les 12 mois (même sans activité) en un seul bloc
+                        st.markdown(html_recap_annuel(df_tab, col_rev, col_perf_dep, col_epargne, col_patri), unsafe_allow_html=True)
                 else:
                     st.info(f"Aucune donnée pour l'année {annee_choisie}.")
 
@@ -939,157 +1255,26 @@ if selected == "Analyses":
                                 <div style="background:{col_jauge}; width:{prog*100}%; height:12px; border-radius:5px;"></div>
                             </div>""", unsafe_allow_html=True)
                         
-                        # On complète df_tab avec les colonnes de chaque compte pour le graphique d'évolution
-                    for c in cps:
-                        nom_c = str(c).strip()
-                        # Calcul du flux mensuel par compte
-                        df_c = df_dash[df_dash['Compte'] == nom_c].groupby('Mois')['Montant'].sum().reset_index()
-                        df_c.columns = ['Mois', nom_c]
-                        
-                        # Fusion avec le tableau principal
-                        df_tab = pd.merge(df_tab, df_c, on='Mois', how='left').fillna(0)
-                        
-                        # Calcul du solde progressif pour ce compte précis
-                        # Solde initial du compte + cumul des flux de l'année
-                        s_init_c = st.session_state.config_groupes.get(nom_c, {}).get("Solde", 0.0)
-                        if nom_c in df_tab.columns:
-                            df_tab[nom_c] = s_init_c + df_tab[nom_c].cumsum()
-                        else:
-                            # Si le compte n'a pas de mouvements, son solde reste le solde initial
-                            df_tab[nom_c] = s_init_c
-
-                # --- 2. Flux Mensuels (Avec Dégradé Vertical) ---
-                    fig_p = go.Figure()
-
-                            # Fonction interne pour générer le dégradé à la volée pour chaque trace
-                    def appliquer_gradient(couleur_hex):
-                                hex_c = couleur_hex.lstrip('#')
-                                r, g, b = tuple(int(hex_c[i:i+2], 16) for i in (0, 2, 4))
-                                return dict(
-                                    type='vertical',
-                                    colorscale=[
-                                        (0, f'rgba({r},{g},{b},0)'),   # 0% en bas
-                                        (1, f'rgba({r},{g},{b},0.6)') # 60% en haut
-                                    ]
-                                )
-
-                            # Ajout des traces avec le dégradé
-                    fig_p.add_trace(go.Scatter(
-                                x=df_tab["Mois"], y=df_tab["Revenus"], name="Rev.", 
-                                fill='tozeroy', 
-                                line=dict(color=col_rev, width=2),
-                                fillgradient=appliquer_gradient(col_rev)
-                            ))
-
-                    fig_p.add_trace(go.Scatter(
-                                x=df_tab["Mois"], y=df_tab["Dépenses"], name="Dép.", 
-                                fill='tozeroy', 
-                                line=dict(color=col_perf_dep, width=2),
-                                fillgradient=appliquer_gradient(col_perf_dep)
-                            ))
-
-                    fig_p.add_trace(go.Scatter(
-                                x=df_tab["Mois"], y=df_tab["Épargne"], name="Épar.", 
-                                fill='tozeroy', 
-                                line=dict(color=col_epargne, width=2),
-                                fillgradient=appliquer_gradient(col_epargne)
-                            ))
-
-                    fig_p.update_layout(
-                                title=dict(text=f"Flux {annee_choisie} : {choix_actuel}", font=dict(size=14, color="white")),
-                                height=180, 
-                                margin=dict(l=0, r=0, t=40, b=0),
-                                hovermode="x unified",
-                                showlegend=True,
-                                paper_bgcolor='rgba(0,0,0,0)', 
-                                plot_bgcolor='rgba(0,0,0,0)',
-                                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(size=10, color="gray")),
-                                xaxis=dict(showgrid=False, tickfont=dict(size=10, color="gray")),
-                                yaxis=dict(showgrid=False, visible=False)
-                            )
-
-                    st.plotly_chart(fig_p, use_container_width=True, config={'displayModeBar': False},key=f"flux_{choix_actuel}_{annee_choisie}")
+
+                    # --- 2. Flux Mensuels (Avec Dégradé Vertical) ---
+                    couleurs_flux = (col_rev, col_perf_dep, col_epargne)
+                    cle = ("flux", st.session_state.version_df, tuple(cps), choix_actuel, annee_choisie, couleurs_flux)
+                    fig_p = figure_memorisee(cle, lambda: figure_flux(df_tab[["Mois", "Revenus", "Dépenses", "Épargne"]], choix_actuel, annee_choisie, couleurs_flux))
+                    with chrono("plotly"):
+                        st.plotly_chart(fig_p, use_container_width=True, config={'displayModeBar': False},key=f"flux_{choix_actuel}_{annee_choisie}")
                             
 
 
                                         # --- PRÉPARATION DES DONNÉES PAR COMPTE ---
                     for c in cps:
                             nom_c = str(c).strip()
-                            df_mouv = df_dash[df_dash['Compte'] == nom_c].groupby('Mois')['Montant'].sum().reset_index()
-                            df_mouv.columns = ['Mois', 'Mouv_Mois']
-                            df_tab = pd.merge(df_tab, df_mouv, on='Mois', how='left').fillna(0)
-                            
-                            solde_initial_historique = st.session_state.config_groupes.get(nom_c, {}).get("Solde", 0.0)
-                            mouvements_passes = st.session_state.df[
-                                (st.session_state.df['Compte'] == nom_c) & 
-                                (st.session_state.df['Année'] < annee_choisie)
-                            ]['Montant'].sum()
+                            solde_initial_historique = registre_session.solde(nom_c)
                             
-                            solde_au_depart = solde_initial_historique + mouvements_passes
-                            df_tab[nom_c] = solde_au_depart + df_tab['Mouv_Mois'].cumsum()
-                            df_tab = df_tab.drop(columns=['Mouv_Mois'])
-
+                            # Solde au 1er janvier = solde initial + toutes les années précédentes (lu dans l'index)
+                            solde_au_depart = solde_debut_annee(index_soldes, nom_c, annee_choisie, solde_initial_historique) if annee_choisie is not None else solde_initial_historique
+                            df_tab[nom_c] = solde_au_depart + flux_du_compte(nom_c).cumsum()
 
-                        # --- 3. Évolution Patrimoine (Dynamique avec Transparence) ---
-                    fig_e = go.Figure()
-
-                    if os.path.exists("config_comptes.csv"):
-                            df_config_file = pd.read_csv("config_comptes.csv", index_col=0, encoding='utf-8-sig')
-                            config_master = df_config_file.to_dict(orient='index')
-                    else:
-                            config_master = st.session_state.get('config_groupes', {})
-
-                    for c in cps:
-                            nom_c = str(c).strip()
-                            if nom_c in df_tab.columns:
-                                couleur_hex = config_master.get(nom_c, {}).get("Couleur", "#1f77b4")
-                                if not isinstance(couleur_hex, str) or pd.isna(couleur_hex):
-                                    couleur_hex = "#1f77b4"
-
-                                # Conversion HEX vers RGB pour le dégradé
-                                hex_c = couleur_hex.lstrip('#')
-                                r, g, b = tuple(int(hex_c[i:i+2], 16) for i in (0, 2, 4))
-                                
-                                # On définit la couleur de départ (60% opacité) et de fin (0% opacité)
-                                c_start = f'rgba({r}, {g}, {b}, 0.6)'
-                                c_stop = f'rgba({r}, {g}, {b}, 0.0)'
-
-                                fig_e.add_trace(go.Scatter(
-                                    x=df_tab["Mois"], 
-                                    y=df_tab[nom_c], 
-                                    name=nom_c, 
-                                    stackgroup='one', 
-                                    line=dict(color=couleur_hex, width=1.5),
-                                    # --- CONFIGURATION DU DÉGRADÉ ---
-                                    fillgradient=dict(
-                                        type='vertical', # Dégradé de haut en bas
-                                        colorscale=[(0, c_stop), (1, c_start)] # 0 est le bas, 1 est le haut
-                                    ),
-                                    hoverinfo='x+y+name'
-                                ))
-                                    
-                        # Ajout du TOTAL (Ligne pointillée)
-                    fig_e.add_trace(go.Scatter(
-                            x=df_tab["Mois"], 
-                            y=df_tab["Patrimoine"], 
-                            name="TOTAL", 
-                            line=dict(color=col_patri, width=3, dash='dot')
-                        ))
-
-                    fig_e.update_layout(
-                            title=dict(text=f"Évolution comptes {annee_choisie} : {choix_actuel}", font=dict(size=14, color="white")),
-                            height=300, 
-                            margin=dict(l=0, r=0, t=40, b=0),
-                            hovermode="x unified",
-                            showlegend=True,
-                            xaxis=dict(showgrid=False, tickfont=dict(color="gray")),
-                            yaxis=dict(showgrid=False, visible=False),
-                            paper_bgcolor='rgba(0,0,0,0)',
-                            plot_bgcolor='rgba(0,0,0,0)',
-                            legend=dict(orientation="h", yanchor="bottom", y=0.93, xanchor="right", x=1, font=dict(color="gray", size=10))
-                        )
-
-                    st.plotly_chart(fig_e, use_container_width=True, config={'displayModeBar': False},key=f"patri_{choix_actuel}_{annee_choisie}")
+                    graphique_evolution(df_tab, cps, index_soldes, registre_session, registre_fichier, annee_choisie, choix_actuel, col_patri)
                                         
     
             
@@ -1218,19 +1403,26 @@ elif selected == "Gestion":
             for key, val in {
                 'filter_g': "Tous", 'filter_c': "Tous", 
                 'filter_a': "Toutes", 'filter_m': "Tous", 
-                'input_new_cat': ""
+                'input_new_cat': "", 'modifs_gestion': {}
             }.items():
                 if key not in st.session_state: st.session_state[key] = val
 
             # 2. PRÉPARATION ET FILTRAGE (Indispensable de le faire ici pour le compteur)
-            df_edit = df_h.copy().reset_index(drop=True)
-            df_edit['Année'] = df_edit['Date'].dt.year.fillna(0).astype(int)
+            # On garde l'index d'origine : c'est l'identifiant de la ligne pour les suppressions/modifications
+            # (pas de copie du grand livre : seule la page affichée est copiée)
+            df_edit = df_h
             
             # Application des filtres successifs
-            df_f = df_edit.copy()
+            df_f = df_edit
+
+            # Recherche dans les libellés (index inversé) : appliquée en premier, c'est elle qui réduit le plus
+            texte_recherche = st.session_state.get("recherche_gestion", "")
+            montant_min, montant_max = st.session_state.get("recherche_min"), st.session_state.get("recherche_max")
+            if texte_recherche.strip() or montant_min is not None or montant_max is not None:
+                df_f = df_f.loc[rechercher_libelles(texte_recherche, montant_min, montant_max).intersection(df_f.index)]
             
             if st.session_state.filter_g != "Tous":
-                cps = [c for c,v in st.session_state.config_groupes.items() if v["Groupe"] == st.session_state.filter_g]
+                cps = registre_session.comptes_du_groupe(st.session_state.filter_g)
                 df_f = df_f[df_f["Compte"].isin(cps)]
             
             if st.session_state.filter_c != "Tous": 
@@ -1284,6 +1476,12 @@ elif selected == "Gestion":
                 idx_g = liste_g.index(st.session_state.filter_g) if st.session_state.filter_g in liste_g else 0
 
                 with st.container(border=True):
+                    # 0. RECHERCHE (préfixes des mots du libellé, montant en valeur absolue)
+                    st.text_input("🔎 Rechercher", key="recherche_gestion", placeholder="ex : amaz carref")
+                    cr1, cr2 = st.columns(2)
+                    cr1.number_input("Montant min (€)", min_value=0.0, value=None, step=10.0, key="recherche_min")
+                    cr2.number_input("Montant max (€)", min_value=0.0, value=None, step=10.0, key="recherche_max")
+
                     # 1. Filtre GROUPE
                     new_g = st.selectbox("Groupe", liste_g, index=idx_g)
                     if new_g != st.session_state.filter_g:
@@ -1292,7 +1490,7 @@ elif selected == "Gestion":
                         st.rerun()
 
                     # 2. Filtre COMPTE (dépend du groupe)
-                    cps_filtre = ["Tous"] + (comptes_detectes if st.session_state.filter_g == "Tous" else [c for c,v in st.session_state.config_groupes.items() if v["Groupe"] == st.session_state.filter_g])
+                    cps_filtre = ["Tous"] + (comptes_detectes if st.session_state.filter_g == "Tous" else registre_session.comptes_du_groupe(st.session_state.filter_g))
                     
                     idx_c = cps_filtre.index(st.session_state.filter_c) if st.session_state.filter_c in cps_filtre else 0
                     new_c = st.selectbox("Compte", cps_filtre, index=idx_c)
@@ -1318,6 +1516,11 @@ elif selected == "Gestion":
                             st.rerun()
                             st.markdown("<br>", unsafe_allow_html=True)
                 
+                # BLOC RÈGLE : même catégorie pour toutes les lignes dont le libellé contient un motif
+                st.markdown('<p style="font-weight:bold; color:#7f8c8d; margin-bottom:5px;">🏷️ Recatégoriser par règle</p>', unsafe_allow_html=True)
+                with st.container(border=True):
+                    regle_recategorisation(st.session_state.df, st.session_state.version_df, comptes_detectes)
+
                 # BLOC ACTIONS MASSIVES (Maintenant le compteur sera juste !)
                 st.markdown('<p style="font-weight:bold; color:#ff4b4b; margin-bottom:5px;">⚠️ Actions critiques</p>', unsafe_allow_html=True)
                 with st.container(border=True):
@@ -1325,90 +1528,24 @@ elif selected == "Gestion":
                     if st.button(f"🗑️ Tout supprimer ({len(df_f)})", use_container_width=True, type="secondary"):
                         if not df_f.empty:
                             # On drop les lignes basées sur l'index filtré
-                            st.session_state.df = st.session_state.df.drop(df_f.index)
-                            st.session_state.df.to_csv("ma_base_de_donnees.csv", index=False, encoding='utf-8-sig')
+                            publier_donnees(supprimer_transactions(st.session_state.df, df_f.index))
                             st.toast(f"✅ {len(df_f)} transactions supprimées", icon="🗑️")
                             time.sleep(1)
                             st.rerun()
                         else:
                             st.toast("Rien à supprimer", icon="ℹ️")
 
+                    # Débit d'un compte + crédit du même montant sur un autre compte à quelques jours d'écart
+                    if st.button("🔄 Rapprocher les transferts", use_container_width=True, type="secondary"):
+                        df_maj, nb_transferts = marquer_transferts(st.session_state.df, df_f.index)
+                        publier_donnees(df_maj)
+                        st.toast(f"🔄 {nb_transferts} transferts internes rapprochés")
+                        time.sleep(1)
+                        st.rerun()
+
             # --- COLONNE DROITE : ÉDITION ---
             with col_main:
-                df_f['Date_Affiche'] = df_f['Date'].dt.strftime('%d/%m/%Y')
-                
-                ct1, ct2, ct3 = st.columns([1.5, 1, 0.8]) # On ajoute une 3ème colonne
-                with ct1: 
-                    st.markdown(f"### 📝 Édition ({len(df_f)})")
-                
-                with ct2:
-                    # On utilise "Categorie" sans accent pour correspondre au DataFrame
-                    mode_tri = st.selectbox("📍 Trier par", ["Date", "Montant", "Categorie", "Nom"], label_visibility="collapsed")
-                
-                with ct3:
-                    # Choix de l'ordre
-                    ordre = st.selectbox("Ordre", ["Décroissant", "Ascendant"], label_visibility="collapsed")
-                    est_ascendant = (ordre == "Ascendant")
-                
-                # Application du tri
-                if mode_tri in df_f.columns:
-                    # Cas particulier : pour le montant, on inverse souvent la logique intuitive
-                    # (Décroissant = les plus grosses dépenses en premier)
-                    df_f = df_f.sort_values(by=mode_tri, ascending=est_ascendant)
-
-                h_col1, h_col2, h_col3, h_col4 = st.columns([3, 2, 2, 0.5])
-                h_col1.caption("DÉTAILS")
-                h_col2.caption("CATÉGORIE")
-                h_col3.caption("MOIS")
-                h_col4.caption("X")
-        # Conteneur de défilement pour les transactions
-                with st.container(height=600, border=True):
-                    for idx, row in df_f.iterrows():
-                        color_amount = "#2ecc71" if row['Montant'] > 0 else "#ff4b4b"
-                        c_info, c_cat, c_mois, c_del = st.columns([3, 2, 2, 0.5])
-                        
-                        with c_info:
-                            st.markdown(f'<div style="border-left:3px solid {color_amount}; padding-left:10px;"><div style="font-weight:bold; font-size:13px;">{row["Nom"]}</div><div style="font-size:11px; color:gray;">{row["Date_Affiche"]} • {row["Compte"]}</div><div style="font-weight:bold; color:{color_amount}; font-size:13px;">{row["Montant"]:.2f} €</div></div>', unsafe_allow_html=True)
-                        
-                        with c_cat:
-                            df_f.at[idx, 'Categorie'] = st.selectbox("C", options=LISTE_CATEGORIES_COMPLETE, index=LISTE_CATEGORIES_COMPLETE.index(row['Categorie']) if row['Categorie'] in LISTE_CATEGORIES_COMPLETE else 0, key=f"cat_{idx}", label_visibility="collapsed")
-                        
-                        with c_mois:
-                            df_f.at[idx, 'Mois'] = st.selectbox("M", options=NOMS_MOIS, index=NOMS_MOIS.index(row['Mois']) if row['Mois'] in NOMS_MOIS else 0, key=f"mo_{idx}", label_visibility="collapsed")
-                        
-                        with c_del:
-                            if st.button("🗑️", key=f"d_{idx}"):
-                                st.session_state.df = st.session_state.df.drop(idx)
-                                st.session_state.df.to_csv("ma_base_de_donnees.csv", index=False, encoding='utf-8-sig')
-                                st.rerun()
-                        
-                        st.markdown('<hr style="margin:5px 0; border:0; border-top:1px solid rgba(128,128,128,0.05);">', unsafe_allow_html=True)
-
-                # --- ICI ON SORT DE LA BOUCLE FOR (Même niveau que le for) ---
-                
-                
-                # Checkbox hors boucle pour éviter l'erreur DuplicateElementID
-                apprendre = st.checkbox(
-                    "🧠 Mémoriser les changements de catégories pour les futurs imports", 
-                    value=True, 
-                    key="global_memo_setting" 
-                )
-
-                if st.button("💾 Sauvegarder les modifications", use_container_width=True, type="primary", key="main_save_btn"):
-                    if apprendre:
-                        for idx_save, row_save in df_f.iterrows():
-                            # On compare avec la valeur d'origine dans le session_state
-                            ancienne_cat = st.session_state.df.at[idx_save, 'Categorie']
-                            nouvelle_cat = row_save['Categorie']
-                            if ancienne_cat != nouvelle_cat:
-                                sauvegarder_apprentissage(row_save['Nom'], nouvelle_cat)
-                    
-                    # Mise à jour globale et sauvegarde CSV
-                    st.session_state.df.update(df_f)
-                    st.session_state.df.to_csv("ma_base_de_donnees.csv", index=False, encoding='utf-8-sig')
-                    st.success("Modifications enregistrées ! ✨")
-                    time.sleep(1)
-                    st.rerun()
+                editeur_transactions(df_f, st.session_state.version_df)
                                     
 elif selected == "Import":                        
     # --- TAB IMPORT (VERSION CORRIGÉE ET SÉCURISÉE) ---
@@ -1426,23 +1563,16 @@ elif selected == "Import":
             with st.container(border=True):
                 c_mode = st.radio("Type de compte :", ["Existant", "Nouveau"], horizontal=True, label_visibility="collapsed")
                 
+                # --- 1. Comptes issus des transactions ---
+                comptes_transactions = st.session_state.df["Compte"].unique().tolist() if not st.session_state.df.empty else []
+                
+                # --- 2. Comptes issus de la config ---
+                comptes_config = charger_registre().comptes()
+                
+                # --- 3. Fusion sans doublons ---
+                liste_comptes = sorted(list(set(comptes_transactions + comptes_config)))
+
                 if c_mode == "Existant":
-                    # --- 1. Comptes issus des transactions ---
-                    comptes_transactions = st.session_state.df["Compte"].unique().tolist() if not st.session_state.df.empty else []
-                    
-                    # --- 2. Comptes issus de la config ---
-                    comptes_config = []
-                    if os.path.exists("config_comptes.csv"):
-                        try:
-                            df_cfg = pd.read_csv("config_comptes.csv", encoding='utf-8-sig')
-                            # On prend la première colonne (noms des comptes)
-                            comptes_config = df_cfg.iloc[:, 0].dropna().unique().tolist()
-                        except:
-                            pass
-                    
-                    # --- 3. Fusion sans doublons ---
-                    liste_comptes = sorted(list(set(comptes_transactions + comptes_config)))
-                    
                     c_nom = st.selectbox("Sélectionner le compte", liste_comptes if liste_comptes else ["Aucun compte"])
                 else:
                     c_nom = st.text_input("Nom du nouveau compte", placeholder="ex: Compte Courant Bourso")
@@ -1451,121 +1581,79 @@ elif selected == "Import":
 
         with col_upload:
             st.markdown("##### 📄 Fichier")
-            f = st.file_uploader("Glissez le fichier ici", type="csv", key="file_up", label_visibility="collapsed")
+            fichiers = st.file_uploader("Glissez le fichier ici", type="csv", key="file_up", accept_multiple_files=True, label_visibility="collapsed")
             
-            if f:
-                st.success(f"Fichier détecté : **{f.name}**")
+            comptes_fichiers = {}
+            if len(fichiers) == 1:
+                st.success(f"Fichier détecté : **{fichiers[0].name}**")
+            elif fichiers:
+                st.success(f"{len(fichiers)} fichiers détectés : choisissez le compte de chacun")
+                # Un compte par fichier (par défaut : le compte choisi à gauche)
+                options_comptes = liste_comptes + ([c_nom] if c_nom and c_nom != "Aucun compte" and c_nom not in liste_comptes else [])
+                with st.container(border=True):
+                    for fi in fichiers:
+                        comptes_fichiers[fi.file_id] = st.selectbox(
+                            fi.name, options_comptes,
+                            index=options_comptes.index(c_nom) if c_nom in options_comptes else 0,
+                            key=f"compte_fichier_{fi.file_id}"
+                        )
                 
             st.markdown("<br>", unsafe_allow_html=True)
             if st.button("🚀 Lancer l'importation automatique", use_container_width=True, type="primary"):
-                if not f:
+                if not fichiers:
                     st.error("Veuillez sélectionner un fichier.")
-                elif not c_nom or c_nom == "Aucun compte":
+                elif not c_nom or c_nom == "Aucun compte" or any(not c for c in comptes_fichiers.values()):
                     st.error("Veuillez nommer ou choisir un compte.")
+                elif len(fichiers) > 1:
+                    # Plusieurs relevés : analyse en parallèle puis une seule écriture dédoublonnée
+                    with st.spinner(f"Analyse de {len(fichiers)} fichiers en parallèle..."), chrono("import_multi"):
+                        statuts, nb_nouvelles, nb_doublons, nb_transferts = importer_plusieurs_fichiers([(fi, comptes_fichiers[fi.file_id]) for fi in fichiers])
+                    st.session_state.statut_import = statuts
+                    st.toast(f"✅ {nb_nouvelles} nouvelles transactions, {nb_doublons} doublons ignorés, {nb_transferts} transferts internes rapprochés", icon="🚀")
+                    time.sleep(1)
+                    st.rerun()
                 else:
+                    f = fichiers[0]
+                    st.session_state.statut_import = None
+                    mesure_import = demarrer_chrono("import_flux")
                     try:
-                        with st.spinner("Analyse et catégorisation en cours..."):
-                            st.cache_data.clear()
-                            raw = f.read()
-                            
-                            # --- 1. DÉCODAGE ROBUSTE ---
-                            text = ""
-                            for e in ['latin-1', 'utf-8', 'cp1252', 'utf-8-sig']:
-                                try: 
-                                    text = raw.decode(e)
-                                    break
-                                except: continue
-                            
-                            lines = [l.strip() for l in text.splitlines() if l.strip()]
-                            h_idx, sep = None, ','
-                            
-                            # --- 2. DÉTECTION DE L'EN-TÊTE ---
-                            # On cherche la ligne qui contient "Date" ET "Nom" ou "Montant"
-                            for i, line in enumerate(lines[:20]):
-                                l_lower = line.lower()
-                                if "date" in l_lower and (any(m in l_lower for m in ["montant", "debit", "credit", "valeur"])):
-                                    h_idx = i
-                                    sep = ';' if line.count(';') > line.count(',') else ','
-                                    break
-                            
-                            if h_idx is not None:
-                                # --- 3. LECTURE AVEC PARAMÈTRES FORCÉS ---
-                                df_n = pd.read_csv(
-                                    io.StringIO("\n".join(lines[h_idx:])), 
-                                    sep=sep, 
-                                    engine='python',
-                                    on_bad_lines='skip',
-                                    skip_blank_lines=True
-                                )
-                                
-                                # Nettoyage radical des colonnes
-                                df_n.columns = [str(c).strip() for c in df_n.columns]
-                                df_n = df_n.loc[:, ~df_n.columns.duplicated()].copy()
-                                
-                                # --- 4. RENOMMAGE ---
-                                for std, syns in CORRESPONDANCE.items():
-                                    for col in df_n.columns:
-                                        if col in syns or col.lower() in [s.lower() for s in syns]: 
-                                            df_n = df_n.rename(columns={col: std})
-                                
-                                # --- 5. VÉRIFICATION ET TRAITEMENT ---
-                                cols = df_n.columns.tolist()
-                                
-                                # On vérifie si on a les données minimales
-                                if "Date" in cols:
-                                    # Conversion Date
-                                    d_col = df_n["Date"].iloc[:, 0] if isinstance(df_n["Date"], pd.DataFrame) else df_n["Date"]
-                                    df_n["Date_C"] = pd.to_datetime(d_col.astype(str), dayfirst=True, errors='coerce')
-                                    df_n = df_n.dropna(subset=["Date_C"])
-                                    
-                                    # Détection Montant
-                                    if "Debit" in cols and "Credit" in cols:
-                                        c1 = df_n["Credit"].apply(clean_montant_physique).fillna(0)
-                                        c2 = df_n["Debit"].apply(clean_montant_physique).fillna(0)
-                                        df_n["M_Final"] = c1 - c2.abs()
-                                    elif "Montant" in cols:
-                                        df_n["M_Final"] = df_n["Montant"].apply(clean_montant_physique)
-                                    else:
-                                        st.error(f"Colonnes trouvées : {cols}. Vérifiez votre fichier CSV.")
-                                        st.stop()
-
-                                    # Détection Nom
-                                    n_col = "Nom" if "Nom" in cols else (cols[1] if len(cols) > 1 else cols[0])
-                                    
-                                    # --- 6. CRÉATION DU DF FINAL ---
-                                    # --- 6. CRÉATION DU DF FINAL ---
-                                    df_res = pd.DataFrame({
-                                        "Date": df_n["Date_C"], 
-                                        "Nom": df_n[n_col].astype(str).apply(simplifier_nom_definitif),
-                                        "Montant": df_n["M_Final"], 
-                                        "Compte": [c_nom] * len(df_n)
-                                    })
-
-                                    # --- MODIFICATION ICI : On utilise df_n pour avoir accès à TOUTES les colonnes ---
-                                    df_res["Categorie"] = df_n.apply(
-                                        lambda row: categoriser(row[n_col], row["M_Final"], c_nom, row), 
-                                        axis=1
-                                    )
-
-                                    df_res["Mois"] = df_res["Date"].dt.month.map(lambda x: NOMS_MOIS[int(x)-1])
-                                    df_res["Année"] = df_res["Date"].dt.year
-                                    
-                                    # --- SAUVEGARDE ET SYNCHRONISATION ---
-                                    sauvegarder_donnees(df_res)
-                                    
-                                    # On recharge TOUTES les données pour mettre à jour la session
-                                    if os.path.exists("ma_base_de_donnees.csv"):
-                                        # On réutilise ta fonction charger_donnees() définie plus haut pour plus de cohérence
-                                        st.session_state.df = charger_donnees()
-                                    
-                                    st.toast("✅ Données synchronisées !", icon="🚀")
-                                    time.sleep(1)
-                                    st.rerun()
-                                    
-                                else:
-                                    st.error(f"Structure non reconnue. Colonnes lues : {cols}")
-                            else:
-                                st.error("Impossible de trouver la ligne d'en-tête (Date, Montant...).")
+                        # Lecture en flux : le fichier est traité par morceaux (mémoire bornée)
+                        barre = st.progress(0.0, text="Analyse et catégorisation en cours...")
+                        df_maj, nb_nouvelles, nb_doublons, nb_transferts = st.session_state.df, 0, 0, 0
+                        contreparties = pd.Index([])
+                        # Profils de banque du compte : un format déjà vu est lu sans détection
+                        profils_connus = charger_profils().get(c_nom, {})
+                        profils = dict(profils_connus)
+                        for df_res, avancement in importer_en_flux(f, c_nom, moteur_categorisation(), profils=profils):
+                            # --- SAUVEGARDE ET SYNCHRONISATION ---
+                            # Ajout seul : seules les nouvelles lignes sont écrites (doublons filtrés par empreinte)
+                            if not df_res.empty:
+                                # Transferts entre comptes : chaque morceau est rapproché de tout le grand livre avant l'ajout
+                                df_res, c, t = marquer_transferts_import(df_maj, df_res)
+                                df_maj, n, d = ajouter_transactions(df_maj, df_res, instantane=False)
+                                nb_nouvelles, nb_doublons, nb_transferts = nb_nouvelles + n, nb_doublons + d, nb_transferts + t
+                                contreparties = contreparties.append(c)
+                            barre.progress(avancement, text=f"Import en cours... {nb_nouvelles} nouvelles transactions")
+                        # Contreparties déjà présentes : une seule mise à jour ponctuelle pour tout le fichier
+                        df_maj = recategoriser_transactions(df_maj, contreparties, CAT_TRANSFERT)
+                        finaliser_import(df_maj)
+                        publier_donnees(df_maj)
+                        if profils != profils_connus: enregistrer_profils(c_nom, profils)
+                        arreter_chrono(mesure_import)
+
+                        st.toast(f"✅ {nb_nouvelles} nouvelles transactions, {nb_doublons} doublons ignorés, {nb_transferts} transferts internes rapprochés", icon="🚀")
+                        time.sleep(1)
+                        st.rerun()
 
+                    except ValueError as e:
+                        # Fichier non reconnu (en-tête, colonnes...)
+                        st.error(str(e))
                     except Exception as e:
                         st.error(f"❌ Erreur critique : {e}")
+
+            # Bilan du dernier import multi-fichiers
+            if st.session_state.get("statut_import"):
+                st.dataframe(pd.DataFrame(st.session_state.statut_import), hide_index=True, use_container_width=True)
+
+arreter_chrono(mesure_onglet)
+clore_releve()
@@ -0,0 +1,62 @@
+import sys
+import time
+import random
+import numpy as np
+import pandas as pd
+from moteur import clean_montant_physique, convertir_montants
+
+# --- BENCHMARK : clean_montant_physique (ligne par ligne) vs convertir_montants (vectorisé) ---
+# Usage : python bench_montants.py [nb_valeurs]   (1 000 000 par défaut)
+
+NB_VALEURS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+BIZARRES = ["", None, np.nan, " ", "-", "abc", "nan", "inf", "1_000", "1.234,56", "12", 3, 4.5]
+
+
+def formater(v):
+    r = random.random()
+    if r < 0.20: return f"{v:,.2f}"                                              # 1,234.56
+    if r < 0.40: return f"{v:,.2f}".replace(",", " ").replace(".", ",")          # 1 234,56
+    if r < 0.50: return f"{v:,.2f}".replace(",", "\xa0").replace(".", ",") + " €"  # 1 234,56 € (NBSP)
+    if r < 0.55: return f"${v:.2f}"
+    if r < 0.57: return random.choice(BIZARRES)
+    if r < 0.75: return f"{v:.2f}".replace(".", ",")
+    return f"{v:.2f}"
+
+
+def generer(nb, nb_distincts=None):
+    random.seed(42)
+    if nb_distincts:
+        # Relevé réaliste : les mêmes montants reviennent (abonnements, courses, loyers...)
+        pool = [formater(round(random.uniform(-2000, 3000), 2)) for _ in range(nb_distincts)]
+        return pd.Series(random.choices(pool, k=nb), dtype=object)
+    return pd.Series([formater(random.uniform(-99999, 99999)) for _ in range(nb)], dtype=object)
+
+
+def identiques(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    return bool(((a == b) | (np.isnan(a) & np.isnan(b))).all())
+
+
+def mesurer(titre, serie):
+    t0 = time.perf_counter()
+    ancien = serie.apply(clean_montant_physique)
+    t_ancien = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    nouveau = convertir_montants(serie)
+    t_nouveau = time.perf_counter() - t0
+
+    ok = identiques(ancien, nouveau)
+    print(f"{titre:<32} apply: {t_ancien:7.3f}s   vectorisé: {t_nouveau:7.3f}s   "
+          f"x{t_ancien / max(t_nouveau, 1e-9):6.1f}   sortie identique: {'OUI' if ok else 'NON'}")
+    return ok
+
+
+if __name__ == "__main__":
+    print(f"{NB_VALEURS:,} valeurs".replace(",", " "))
+    resultats = [
+        mesurer("Relevé réaliste (20k distincts)", generer(NB_VALEURS, nb_distincts=20_000)),
+        mesurer("Toutes valeurs distinctes", generer(NB_VALEURS)),
+        mesurer("Colonne déjà numérique", pd.Series(np.round(np.random.default_rng(0).uniform(-2000, 3000, NB_VALEURS), 2))),
+    ]
+    sys.exit(0 if all(resultats) else 1)
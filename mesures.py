@@ -0,0 +1,127 @@
+import json
+import time
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+
+# --- MESURES DE PERFORMANCE ---
+# Chronomètres (bloc "with", décorateur ou début / fin) et compteurs (lectures et écritures de
+# fichiers, lignes parcourues). Les mesures d'un fil sont rattachées à son relevé en cours : avec
+# Streamlit, un relevé = un rerun d'une session. Les relevés terminés sont gardés en mémoire
+# (les plus récents) et exportables en JSON lines. Hors relevé, rien n'est enregistré.
+
+TAILLE_JOURNAL = 500
+JOURNAL = deque(maxlen=TAILLE_JOURNAL)
+VERROU_JOURNAL = threading.Lock()
+ETAT = threading.local()
+
+
+def releve_courant():
+    return getattr(ETAT, "releve", None)
+
+
+def nouveau_releve(etiquette=""):
+    # Un rerun interrompu (st.rerun, st.stop...) n'a pas été clos : il est enregistré tel quel
+    if releve_courant() is not None: clore_releve()
+    ETAT.releve = {"debut": time.time(), "chrono": time.perf_counter(), "etiquette": etiquette, "durees": Counter(), "appels": Counter(), "compteurs": Counter()}
+    return ETAT.releve
+
+
+def etiqueter_releve(etiquette):
+    releve = releve_courant()
+    if releve is not None: releve["etiquette"] = etiquette
+
+
+def clore_releve():
+    releve = releve_courant()
+    if releve is None: return None
+    ETAT.releve = None
+    ligne = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(releve["debut"])),
+        "etiquette": releve["etiquette"],
+        "total_ms": round((time.perf_counter() - releve["chrono"]) * 1000, 2),
+        "durees_ms": {nom: round(d * 1000, 2) for nom, d in releve["durees"].items()},
+        "appels": dict(releve["appels"]),
+        "compteurs": dict(releve["compteurs"]),
+    }
+    with VERROU_JOURNAL:
+        JOURNAL.append(ligne)
+    return ligne
+
+
+def integrer_releve(ligne):
+    # Ajoute au relevé en cours les mesures d'un relevé clos ailleurs (processus du pool d'import) :
+    # les durées de processus parallèles s'additionnent
+    releve = releve_courant()
+    if releve is None or ligne is None: return
+    for nom, ms in ligne["durees_ms"].items(): releve["durees"][nom] += ms / 1000
+    releve["appels"].update(ligne["appels"])
+    releve["compteurs"].update(ligne["compteurs"])
+
+
+def demarrer_chrono(nom):
+    return nom, time.perf_counter()
+
+
+def arreter_chrono(mesure):
+    nom, debut = mesure
+    releve = releve_courant()
+    if releve is None: return
+    releve["durees"][nom] += time.perf_counter() - debut
+    releve["appels"][nom] += 1
+
+
+@contextmanager
+def chrono(nom):
+    mesure = demarrer_chrono(nom)
+    try:
+        yield
+    finally:
+        arreter_chrono(mesure)
+
+
+def chronometre(nom=None):
+    # Décorateur : chaque appel de la fonction est chronométré sous son nom
+    def decorer(fonction):
+        @wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            with chrono(nom or fonction.__name__):
+                return fonction(*args, **kwargs)
+        return enveloppe
+    return decorer
+
+
+def releve_de_fragment(nom=None):
+    # Décorateur (sous @st.fragment) : un rerun du fragment seul n'exécute pas la page et n'a donc
+    # pas de relevé ; il en ouvre un, "fragment:<nom>". Appelé pendant la page, il y est chronométré.
+    def decorer(fonction):
+        etiquette = f"fragment:{nom or fonction.__name__}"
+        @wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            if releve_courant() is not None:
+                with chrono(etiquette):
+                    return fonction(*args, **kwargs)
+            nouveau_releve(etiquette)
+            try:
+                return fonction(*args, **kwargs)
+            finally:
+                clore_releve()
+        return enveloppe
+    return decorer
+
+
+def compter(nom, n=1):
+    releve = releve_courant()
+    if releve is not None: releve["compteurs"][nom] += int(n)
+
+
+def derniers_releves(nb=None):
+    with VERROU_JOURNAL:
+        releves = list(JOURNAL)
+    return releves if nb is None else releves[-nb:]
+
+
+def exporter_journal():
+    # Une ligne JSON par relevé (suivi des régressions : à concaténer d'un export à l'autre)
+    return "".join(json.dumps(ligne, ensure_ascii=False) + "\n" for ligne in derniers_releves())
@@ -0,0 +1,665 @@
+import io
+import os
+import hashlib
+import re
+import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from mesures import chronometre, compter, nouveau_releve, clore_releve
+
+# --- MOTEUR DE CATÉGORISATION ---
+# Tout ce qui est ici est du calcul pur (pas de Streamlit) : on peut l'importer
+# depuis un script, un benchmark ou un autre processus.
+
+NOMS_MOIS = ["Janvier", "Février", "Mars", "Avril", "Mai", "Juin", "Juillet", "Août", "Septembre", "Octobre", "Novembre", "Décembre"]
+
+CAT_TRANSFERT = "🔄 Transfert Interne"
+# Mouvements entre comptes : exclus des revenus / dépenses réels
+CATEGORIES_VIREMENTS = ["Virement Perso", "Transfert Interne", "Virement interne", CAT_TRANSFERT]
+
+MOTS_TRANSFERT = [
+    "VIREMENT VERS COMPTE CHEQUES", "VIREMENT VERS LIVRET A","Virement interne"
+]
+
+CATEGORIES_MOTS_CLES = {
+    "💰 Salaire": ["MELTED", "JEFF DB", "FRANCE TRAVAIL", "POLE EMPLOI", "SARL","JEFF DE BRUGES"],
+    "🏥 Remboursements": ["NOSTRUMCARE", "AMELI", "CPAM", "REMBOURSEMENT", "SANTÉ","FAUSTINE BOJUC"],
+    "👫 Compte Commun": ["A FONTA AUDE OU LEBARBIER THEO","AUDE FONTATHEO LEBARBIE", "VERSEMENT COMMUN", "VIREMENT COMMUN"],
+    "🤝 Virements Reçus": ["LEBARBIER THEO", "LEBARBIER DIDIER", "MARYLINE FONTA", "AURORE FONTA", "MME AUDE FONTA","DE MR LEBARBIER D"],
+    "📱 Abonnements": ["NETFLIX", "SPOTIFY", "DISNEY PLUS", "AMAZON PRIME", "YOUTUBE PREMIUM", "ORANGE", "GOOGLE PLAY", "GOOGLE ONE", "AMZ DIGITAL", "TWITCH"],
+    "🛒 Alimentation": ["CARREFOUR", "AUCHAN", "MONOPRIX", "CASINO", "SUPER", "PICARD", "BIOCOOP", "MARCHE", "BOULANGERIE", "RESTAURANT", "BAR", "MCDO", "SUBWAY", "INTERMARCHE", "LECLERC","AUTOGRILL","PROZIS","CIAO BELLA"],
+    "🛍️ Shopping": ["AMAZON", "FNAC", "DARTY", "CULTURA", "ZARA", "H&M", "KIABI", "KLARNA"],
+    "👕 Habillement": ["VETEMENTS", "CHAUSSURES", "MODE", "CELIO", "JULES", "ASOS"],
+    "⚖️ Impôts": ["IMPOTS", "TRESOR PUBLIC", "DGFIP"],
+    "🏦 Frais Bancaires": ["COTISATION BANCAIRE", "FRAIS BANCAIRES", "COTISATION ESSENTIEL"],
+    "🏠 Assurance Habitation": ["PACIFICA", "MMA", "MAIF", "MACIF"],
+    "🎮 Jeux vidéos": ["SONY PLAYSTATION", "NINTENDO", "STEAM", "EPIC GAMES", "INSTANT GAMING"],
+    "🩺 Mutuelle": ["MUTUELLE", "HARMONIE", "MGEN", "NOSTRUM CARE"],
+    "💊 Pharmacie": ["PHARMACIE", "MÉNARD", "PHARMA"],
+    "👨‍⚕️ Médecin/Santé": ["MEDECIN", "DENTISTE", "DOCTOLIB"],
+    "🔑 Loyer": ["LOYER", "AGENCE IMMOBILIERE", "Jason Moliner","JASON MOLINER"],
+    "🔨 Bricolage": ["CASTORAMA", "LEROY", "BRICO DEPOT", "IKEA"],
+    "🚌 Transports": ["RATP", "SNCF", "TCL", "ORIZO"],
+    "⛽ Carburant": ["TOTAL", "BP", "ESSENCE", "SHELL", "ESSOF", "CERTAS","STATION"],
+    "🚗 Auto": ["CREDIT AUTO", "GARAGE", "REPARATION", "AUTO"],
+    "💸 Virements Perso": ["VIREMENT A", "VIREMENT INSTANTANE", "VIR SEPA"],
+    "🏧 Retraits": ["RETRAIT DAB", "RETRAIT GAB"],
+    "🌐 Web/Énergie": ["FREE", "SFR", "BOUYGUES", "EDF", "ENGIE"],
+}
+
+
+def clean_montant_physique(valeur):
+    if pd.isna(valeur) or valeur == "": return 0.0
+    s = str(valeur).replace('\xa0', '').replace(' ', '').replace('€', '').replace('$', '')
+    if ',' in s and '.' in s: s = s.replace(',', '')
+    elif ',' in s: s = s.replace(',', '.')
+    try: return float(s)
+    except: return 0.0
+
+
+REGEX_SYMBOLES_MONTANT = r'[\xa0 €$]'
+REGEX_NOMBRE_SIMPLE = r'[+-]?(?:\d+\.?\d*|\.\d+)'
+# Part de montants distincts au-delà de laquelle le nettoyage vectorisé ne paie plus
+# (estimée d'abord sur un échantillon régulier de la colonne)
+TAILLE_ECHANTILLON_MONTANTS = 10_000
+PART_DISTINCTS_ECHANTILLON = 0.95
+PART_DISTINCTS_VECTORISE = 0.5
+
+
+def convertir_montants(serie):
+    # Équivalent vectorisé de clean_montant_physique sur toute une colonne
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        # Colonne déjà numérique (cas de notre base) : rien à analyser
+        return serie.astype('float64').fillna(0.0)
+
+    serie = pd.Series(serie)
+    # Petite colonne, ou montants presque tous distincts : même factoriser coûterait plus que
+    # ça ne rapporte, conversion directe valeur par valeur
+    echantillon = serie.iloc[::max(len(serie) // TAILLE_ECHANTILLON_MONTANTS, 1)]
+    if len(serie) < TAILLE_ECHANTILLON_MONTANTS or len(pd.unique(echantillon)) > PART_DISTINCTS_ECHANTILLON * len(echantillon):
+        return pd.Series([clean_montant_physique(v) for v in serie.tolist()], index=serie.index, dtype='float64')
+
+    vides = serie.isna().to_numpy()
+    resultat = np.zeros(len(serie), dtype='float64')
+    if vides.all(): return pd.Series(resultat, index=serie.index)
+
+    # Les montants se répètent beaucoup : on ne nettoie que les valeurs distinctes
+    codes, uniques = pd.factorize(serie[~vides].astype(str))
+    if len(uniques) > PART_DISTINCTS_VECTORISE * len(codes):
+        # Encore beaucoup de valeurs distinctes : la version ligne par ligne, une fois par valeur
+        resultat[~vides] = np.array([clean_montant_physique(v) for v in uniques.tolist()], dtype='float64')[codes]
+        return pd.Series(resultat, index=serie.index)
+    s = pd.Series(uniques)
+
+    a_nettoyer = s.str.contains(REGEX_SYMBOLES_MONTANT, regex=True)
+    if a_nettoyer.any():
+        s[a_nettoyer] = s[a_nettoyer].str.replace(REGEX_SYMBOLES_MONTANT, '', regex=True)
+
+    # "1,234.56" → on retire la virgule des milliers ; "1 234,56" → la virgule devient le point décimal
+    virgule = s.str.contains(',', regex=False)
+    if virgule.any():
+        avec_virgule = s[virgule]
+        point = avec_virgule.str.contains('.', regex=False)
+        s[virgule] = avec_virgule.str.replace(',', '', regex=False).where(point, avec_virgule.str.replace(',', '.', regex=False))
+
+    # Les nombres "simples" sont convertis d'un bloc (même conversion que float())
+    valeurs = np.zeros(len(s), dtype='float64')
+    valides = s.str.fullmatch(REGEX_NOMBRE_SIMPLE).to_numpy(dtype=bool)
+    valeurs[valides] = s[valides].astype('float64').to_numpy()
+
+    # Cas particuliers (vides, texte, notations exotiques) : on laisse trancher la version ligne par ligne
+    if not valides.all():
+        valeurs[~valides] = [clean_montant_physique(v) for v in uniques[~valides]]
+
+    resultat[~vides] = valeurs[codes]
+    return pd.Series(resultat, index=serie.index)
+
+
+def par_valeur_unique(serie, fonction):
+    # Les libellés bancaires se répètent énormément : on calcule une fois par valeur distincte
+    codes, uniques = pd.factorize(serie, use_na_sentinel=False)
+    resultats = np.empty(len(uniques), dtype=object)
+    resultats[:] = [fonction(u) for u in uniques]
+    return pd.Series(resultats[codes], index=serie.index)
+
+
+# --- DATES ---
+# Formats essayés sur un échantillon de dates distinctes (relevés français d'abord, jour avant mois)
+FORMATS_DATE_CANDIDATS = [
+    "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%Y", "%Y/%m/%d",
+    "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y%m%d"
+]
+TAILLE_ECHANTILLON_DATES = 200
+
+
+def deviner_format_date(dates, format_connu=None):
+    # Format explicite qui lit le plus de dates d'un échantillon de valeurs distinctes.
+    # Le premier candidat qui lit tout l'échantillon gagne (format_connu, d'un profil de banque, en tête).
+    # Si aucun ne fait aussi bien que l'analyse date par date ("mixed"), on garde "mixed".
+    echantillon = pd.Series(pd.unique(dates.dropna().astype(str).str.strip()))
+    echantillon = echantillon[echantillon != ""].head(TAILLE_ECHANTILLON_DATES)
+    if not len(echantillon): return format_connu
+
+    meilleur, meilleur_score = None, 0
+    for fmt in ([format_connu] if format_connu else []) + FORMATS_DATE_CANDIDATS:
+        if fmt == "mixed": continue
+        score = int(pd.to_datetime(echantillon, format=fmt, errors='coerce').notna().sum())
+        if score == len(echantillon): return fmt
+        if score > meilleur_score: meilleur, meilleur_score = fmt, score
+
+    lisibles = int(pd.to_datetime(echantillon, format="mixed", dayfirst=True, errors='coerce').notna().sum())
+    return meilleur if meilleur is not None and meilleur_score >= lisibles else "mixed"
+
+
+def convertir_dates(serie, format_date=None):
+    # Les dates se répètent beaucoup dans un relevé : on n'analyse que les valeurs distinctes
+    codes, uniques = pd.factorize(serie)
+    dates = pd.to_datetime(pd.Series(uniques, dtype=object), format=format_date, dayfirst=True, errors='coerce')
+    # Code -1 (valeur manquante) → dernier élément, NaT
+    valeurs = np.append(dates.to_numpy(), np.array(["NaT"], dtype=dates.dtype))
+    return pd.Series(valeurs[codes], index=serie.index)
+
+
+# --- NORMALISATION DES LIBELLÉS ---
+REGEX_REFERENCES = re.compile(r'(FAC|REF|NUM|ID|PRLV|VIREMENT)\s*[:.\-]?\s*[0-9A-Z]+')
+REGEX_DATES_LIBELLE = re.compile(r'\d{2}[\./]\d{2}([\./]\d{2,4})?')
+REGEX_SEPARATEURS = re.compile(r'[\*\-\/#]')
+MOTS_PARASITES = ["ACHAT CB", "ACHAT", "CB", "CARTE", "VERSEMENT", "CHEQUE", "SEPA"]
+TAILLE_CACHE_NOMS = 50_000
+
+
+@lru_cache(maxsize=TAILLE_CACHE_NOMS)
+def simplifier_texte(nom):
+    # Cache partagé par tous les imports du processus : les mêmes marchands reviennent chaque mois
+    nom = nom.upper()
+    nom = REGEX_REFERENCES.sub('', nom)
+    nom = REGEX_DATES_LIBELLE.sub('', nom)
+    for m in MOTS_PARASITES: nom = nom.replace(m, "")
+    return ' '.join(REGEX_SEPARATEURS.sub(' ', nom).split()).strip() or "AUTRE"
+
+
+def simplifier_nom_definitif(nom):
+    if not isinstance(nom, str): return str(nom)
+    return simplifier_texte(nom)
+
+
+def simplifier_noms(serie):
+    # Version "colonne" : on ne normalise que les libellés distincts puis on redistribue
+    return par_valeur_unique(serie.map(str), simplifier_nom_definitif)
+
+
+# Les imports ont toujours décodé les relevés en latin-1 : c'est sous cette forme que les libellés
+# (et donc leurs empreintes de dédoublonnage et la mémoire d'apprentissage) sont dans le grand livre.
+# Un relevé lu dans un autre encodage retrouve ce décodage pour son libellé enregistré : réimporter
+# un ancien relevé ne crée pas de doublons. Le grand livre n'est pas migré vers le texte bien décodé :
+# un libellé enregistré est déjà simplifié (majuscules, espaces insécables ou U+0085 d'un octet UTF-8
+# devenus de simples espaces), on ne retrouve pas toujours ses octets d'origine. Seul le libellé
+# enregistré garde ce décodage ; les mots-clés sont cherchés dans le texte bien décodé.
+ENCODAGE_LIBELLES = "latin-1"
+
+
+def libelles_historiques(serie, encodage):
+    if encodage is None or encodage == ENCODAGE_LIBELLES: return serie
+    # Le BOM n'appartient pas aux champs : on réencode sans lui
+    encodage = "utf-8" if encodage == "utf-8-sig" else encodage
+
+    def recoder(texte):
+        if not isinstance(texte, str) or texte.isascii(): return texte
+        return texte.encode(encodage, errors="replace").decode(ENCODAGE_LIBELLES)
+
+    return par_valeur_unique(serie, recoder)
+
+
+def construire_moteur(memoire):
+    # On compile une bonne fois pour toutes :
+    # 1. les marqueurs de transfert en une seule alternative
+    # 2. tous les mots-clés en UNE regex, triés par ordre de priorité des catégories
+    liste_cats = list(CATEGORIES_MOTS_CLES.keys())
+    rang_par_mot = {}
+    for rang, cat in enumerate(liste_cats):
+        for m in CATEGORIES_MOTS_CLES[cat]:
+            rang_par_mot.setdefault(m, rang)
+
+    mots_ordonnes = sorted(rang_par_mot, key=lambda m: rang_par_mot[m])
+    # Le lookahead permet de trouver TOUS les mots présents (même imbriqués) :
+    # à une position donnée, l'alternative retenue est celle de la catégorie la plus prioritaire.
+    regex_mots = re.compile("(?=(" + "|".join(re.escape(m) for m in mots_ordonnes) + "))")
+    regex_transfert = re.compile("|".join(re.escape(m) for m in MOTS_TRANSFERT))
+
+    return {
+        "transfert": regex_transfert,
+        "mots_cles": regex_mots,
+        "rang_par_mot": rang_par_mot,
+        "categories": liste_cats,
+        "memoire": dict(memoire),
+    }
+
+
+@chronometre()
+def categoriser_serie(moteur, noms, montants, lignes_completes=None, noms_simplifies=None):
+    compter("lignes_categorisees", len(noms))
+    n_brut = noms.map(str).str.upper()
+    # Si l'appelant a déjà normalisé les libellés (import), on ne refait pas le travail
+    n_clean = noms_simplifies if noms_simplifies is not None else simplifier_noms(n_brut)
+
+    # --- ÉTAPE 1 : Transferts sur le libellé principal ---
+    regex_transfert = moteur["transfert"]
+    est_transfert = par_valeur_unique(n_brut, lambda t: regex_transfert.search(t) is not None).astype(bool)
+
+    # --- ÉTAPE 2 : Transferts sur TOUTES les colonnes du CSV (uniquement les lignes restantes) ---
+    if lignes_completes is not None and len(lignes_completes.columns) and (~est_transfert).any():
+        reste = lignes_completes.loc[~est_transfert.values]
+        textes = [reste.iloc[:, i].map(str).str.upper() for i in range(reste.shape[1])]
+        texte_complet = textes[0].str.cat(textes[1:], sep=" ") if len(textes) > 1 else textes[0]
+        trouve = texte_complet.str.contains(regex_transfert.pattern, regex=True).astype(bool)
+        est_transfert.loc[trouve[trouve].index] = True
+
+    # --- ÉTAPE 3 : Mémoire (apprentissage) ---
+    cat_memoire = n_clean.map(moteur["memoire"])
+
+    # --- ÉTAPE 4 : Mots-clés, la catégorie la plus prioritaire l'emporte ---
+    regex_mots, rang_par_mot, liste_cats = moteur["mots_cles"], moteur["rang_par_mot"], moteur["categories"]
+
+    def meilleure_categorie(texte):
+        rangs = [rang_par_mot[m] for m in regex_mots.findall(texte)]
+        return liste_cats[min(rangs)] if rangs else None
+
+    cat_mots = par_valeur_unique(n_brut, meilleure_categorie)
+
+    # --- Repli final selon le signe du montant ---
+    montants = pd.to_numeric(pd.Series(np.asarray(montants), index=noms.index), errors='coerce')
+    repli = pd.Series(np.where(montants > 0, "💰 Autres Revenus", "❓ Autre"), index=noms.index)
+
+    resultat = cat_memoire.where(cat_memoire.notna(), cat_mots)
+    resultat = resultat.where(resultat.notna(), repli)
+    resultat[est_transfert.values] = CAT_TRANSFERT
+    return resultat.astype(object)
+
+
+# --- INDEX DES SOLDES ---
+# Par compte : dates triées + sommes cumulées des montants (précédées d'un 0).
+# Le solde à n'importe quelle date devient une recherche dichotomique, sans rescanner les transactions.
+# Le solde initial configuré n'est pas dans l'index (il change sans que les transactions changent) :
+# on l'ajoute au moment de la lecture.
+
+def construire_index_soldes(df):
+    index = {}
+    if df.empty: return index
+    base = pd.DataFrame({
+        "Compte": df["Compte"],
+        "Date": df["Date"],
+        "Montant": pd.to_numeric(df["Montant"], errors='coerce').fillna(0.0),
+    }).dropna(subset=["Date"]).sort_values(["Compte", "Date"], kind="stable")
+    for compte, grp in base.groupby("Compte", sort=False):
+        dates = grp["Date"].to_numpy(dtype="datetime64[ns]")
+        cumuls = np.concatenate([[0.0], grp["Montant"].to_numpy(dtype="float64").cumsum()])
+        index[compte] = (dates, cumuls)
+    return index
+
+
+def soldes_avant(index, compte, dates, solde_initial=0.0):
+    # Solde juste avant chaque date (mouvements strictement antérieurs)
+    dates_compte, cumuls = index.get(compte, (np.array([], dtype="datetime64[ns]"), np.zeros(1)))
+    positions = np.searchsorted(dates_compte, np.asarray(dates, dtype="datetime64[ns]"), side="left")
+    return solde_initial + cumuls[positions]
+
+
+def solde_debut_annee(index, compte, annee, solde_initial=0.0):
+    return float(soldes_avant(index, compte, [pd.Timestamp(int(annee), 1, 1)], solde_initial)[0])
+
+
+def flux_annee(index, compte, annee):
+    debut, fin = soldes_avant(index, compte, [pd.Timestamp(int(annee), 1, 1), pd.Timestamp(int(annee) + 1, 1, 1)])
+    return float(fin - debut)
+
+
+def soldes_fin_de_mois(index, compte, mois, solde_initial=0.0):
+    # mois : débuts de mois → solde au soir du dernier jour de chacun (courbes sur plusieurs années)
+    return soldes_avant(index, compte, pd.DatetimeIndex(mois) + pd.offsets.MonthBegin(1), solde_initial)
+
+
+def periode_index_soldes(index, comptes):
+    # Première et dernière date connues pour ces comptes (None si aucune transaction)
+    bornes = [(index[c][0][0], index[c][0][-1]) for c in comptes if c in index and len(index[c][0])]
+    if not bornes: return None
+    return pd.Timestamp(min(b[0] for b in bornes)), pd.Timestamp(max(b[1] for b in bornes))
+
+
+# --- INDEX DE RECHERCHE (libellés) ---
+# Index inversé : mot du libellé (majuscules, sans accents) → ids des lignes. Une recherche par
+# préfixe ("AMAZ") trouve les mots concernés par dichotomie dans la liste triée des mots, puis
+# réunit leurs ids : aucun libellé n'est parcouru. L'index suit le grand livre par différence
+# (seules les lignes ajoutées, supprimées ou renommées sont réindexées).
+REGEX_MOTS = re.compile(r"[A-Z0-9]+")
+
+
+@lru_cache(maxsize=TAILLE_CACHE_NOMS)
+def mots_libelle(nom):
+    texte = unicodedata.normalize("NFKD", str(nom).upper()).encode("ascii", "ignore").decode()
+    return tuple(dict.fromkeys(REGEX_MOTS.findall(texte)))
+
+
+class IndexRecherche:
+    def __init__(self):
+        self.listes = {}                          # mot → {ids}
+        self.noms = pd.Series(dtype=object)       # id → libellé indexé
+        self.montants = pd.Series(dtype=float)    # id → |montant|
+        self.mots_tries = None                    # recalculés à la demande après un changement
+        self.montants_tries = None
+
+    def ajouter(self, noms):
+        mots = par_valeur_unique(noms, mots_libelle).explode().dropna()
+        for mot, ids in mots.index.groupby(mots.values).items():
+            self.listes.setdefault(mot, set()).update(ids)
+        self.mots_tries = None
+
+    def retirer(self, ids):
+        for i, nom in self.noms.loc[ids].items():
+            for mot in mots_libelle(nom):
+                liste = self.listes.get(mot)
+                if liste is None: continue
+                liste.discard(i)
+                if not liste: del self.listes[mot]
+        self.mots_tries = None
+
+    def synchroniser(self, df):
+        noms = df["Nom"].astype(object).fillna("")
+        communs = self.noms.index.intersection(noms.index)
+        renommees = communs[self.noms.loc[communs].to_numpy() != noms.loc[communs].to_numpy()]
+        retirees = self.noms.index.difference(noms.index).append(renommees)
+        ajoutees = noms.index.difference(self.noms.index).append(renommees)
+        if len(retirees) > len(self.noms) // 2:
+            # Grand livre rechargé (ids renumérotés) : reconstruire coûte moins que tout retirer
+            self.listes, retirees, ajoutees = {}, [], noms.index
+        if len(retirees): self.retirer(retirees)
+        self.noms = noms
+        if len(ajoutees): self.ajouter(noms.loc[ajoutees])
+        self.montants = pd.to_numeric(df["Montant"], errors='coerce').abs()
+        self.montants_tries = None
+
+    def rechercher(self, texte="", montant_min=None, montant_max=None):
+        # Tous les mots de la recherche doivent être présents (chacun comme préfixe d'un mot du libellé).
+        # Montants en valeur absolue. Renvoie les ids trouvés (triés).
+        ids = None
+        if self.mots_tries is None: self.mots_tries = sorted(self.listes)
+        for prefixe in mots_libelle(texte):
+            debut = bisect_left(self.mots_tries, prefixe)
+            fin = bisect_left(self.mots_tries, prefixe + "~", debut)  # "~" est après A-Z et 0-9
+            trouves = set().union(*(self.listes[m] for m in self.mots_tries[debut:fin]))
+            ids = trouves if ids is None else ids & trouves
+            if not ids: return pd.Index([])
+        if montant_min is None and montant_max is None:
+            return pd.Index(sorted(ids)) if ids is not None else self.noms.index
+        bas = -np.inf if montant_min is None else montant_min
+        haut = np.inf if montant_max is None else montant_max
+        if ids is not None:
+            montants = self.montants.reindex(list(ids))
+            return montants.index[montants.between(bas, haut)].sort_values()
+        # Sans texte : plage lue dans les montants triés (dichotomie)
+        if self.montants_tries is None: self.montants_tries = self.montants.dropna().sort_values()
+        debut = self.montants_tries.searchsorted(bas, side="left")
+        fin = self.montants_tries.searchsorted(haut, side="right")
+        return self.montants_tries.index[debut:fin].sort_values()
+
+
+# --- RÈGLES DE RECATÉGORISATION ---
+
+def masque_regle(df, motif, compte=None, date_debut=None, date_fin=None, montant_min=None, montant_max=None):
+    # Lignes visées par une règle : libellé contenant le motif (sans tenir compte de la casse), puis
+    # filtres facultatifs (montants en valeur absolue). Le motif est testé une fois par libellé distinct.
+    motif = str(motif).strip().upper()
+    if not motif: return pd.Series(False, index=df.index)
+    masque = par_valeur_unique(df["Nom"].astype(object), lambda nom: motif in str(nom).upper()).astype(bool)
+    if compte is not None: masque &= (df["Compte"].astype(object) == compte).to_numpy()
+    if date_debut is not None: masque &= (df["Date"] >= pd.Timestamp(date_debut)).to_numpy()
+    if date_fin is not None: masque &= (df["Date"] < pd.Timestamp(date_fin) + pd.Timedelta(days=1)).to_numpy()
+    montants = pd.to_numeric(df["Montant"], errors='coerce').abs()
+    if montant_min is not None: masque &= (montants >= montant_min).to_numpy()
+    if montant_max is not None: masque &= (montants <= montant_max).to_numpy()
+    return masque
+
+
+# --- RAPPROCHEMENT DES TRANSFERTS ENTRE COMPTES ---
+# Un transfert interne = un débit sur un compte et un crédit du même montant sur un autre compte,
+# à quelques jours d'écart. Jointure par hachage sur (montant en centimes, tranche de dates) :
+# un débit n'est comparé qu'aux crédits de même montant des tranches voisines, jamais à tout le grand livre.
+FENETRE_TRANSFERT_JOURS = 3
+
+@chronometre()
+def rapprocher_transferts(df, lignes=None, fenetre_jours=FENETRE_TRANSFERT_JOURS, exclues=()):
+    # lignes : index des lignes à rapprocher (celles d'un import) ; None = tout le grand livre.
+    # exclues : index des lignes déjà appariées lors d'un rapprochement précédent (jamais reprises).
+    # Renvoie les paires (debit, credit) d'index du grand livre : une ligne est dans une paire au plus,
+    # et chaque paire contient au moins une des lignes à rapprocher.
+    montants = pd.to_numeric(df["Montant"], errors='coerce')
+    valides = montants.notna() & (montants != 0) & df["Date"].notna() & ~df.index.isin(exclues)
+    base = pd.DataFrame({
+        "cents": (montants[valides].abs() * 100).round().astype("int64"),
+        "jour": df.loc[valides, "Date"].to_numpy(dtype="datetime64[D]").astype("int64"),
+        "compte": df.loc[valides, "Compte"].astype("str"),
+        "est_debit": montants[valides] < 0,
+        "a_rapprocher": True if lignes is None else df.index[valides].isin(lignes),
+    }).rename_axis("id")
+    # Tranches de (fenêtre + 1) jours : deux dates assez proches sont dans la même tranche ou dans deux voisines
+    base["tranche"] = base["jour"] // (fenetre_jours + 1)
+    if lignes is not None:
+        # Seules les lignes de même montant qu'une ligne à rapprocher, dans sa tranche ou une voisine,
+        # peuvent former une paire : un montant fréquent (abonnement...) ne ramène pas tout son historique
+        base = base[base["cents"].isin(base.loc[base["a_rapprocher"], "cents"])]
+        cibles = base[base["a_rapprocher"]]
+        voisines = pd.MultiIndex.from_arrays([
+            np.tile(cibles["cents"].to_numpy(), 3),
+            np.concatenate([cibles["tranche"].to_numpy() + d for d in (-1, 0, 1)]),
+        ])
+        base = base[base["a_rapprocher"] | pd.MultiIndex.from_frame(base[["cents", "tranche"]]).isin(voisines)]
+
+    debits = base[base["est_debit"]].reset_index()
+    credits = base[~base["est_debit"]].reset_index()
+    credits = pd.concat([credits.assign(tranche=credits["tranche"] + d) for d in (-1, 0, 1)])
+    # Une ligne à rapprocher d'un côté au moins : les lignes déjà présentes ne sont pas comparées entre elles
+    candidats = pd.concat([
+        debits[debits["a_rapprocher"]].merge(credits, on=["cents", "tranche"], suffixes=("_debit", "_credit")),
+        debits[~debits["a_rapprocher"]].merge(credits[credits["a_rapprocher"]], on=["cents", "tranche"], suffixes=("_debit", "_credit")),
+    ])
+    candidats["ecart"] = (candidats["jour_debit"] - candidats["jour_credit"]).abs()
+    candidats = candidats[(candidats["compte_debit"] != candidats["compte_credit"]) & (candidats["ecart"] <= fenetre_jours)]
+
+    # Appariement un pour un, les mouvements les plus proches dans le temps d'abord
+    candidats = candidats.sort_values(["ecart", "id_debit", "id_credit"], kind="stable")
+    paires = [candidats.iloc[0:0]]
+    while not candidats.empty:
+        choix = candidats.drop_duplicates("id_debit").drop_duplicates("id_credit")
+        paires.append(choix)
+        candidats = candidats[~candidats["id_debit"].isin(choix["id_debit"]) & ~candidats["id_credit"].isin(choix["id_credit"])]
+    paires = pd.concat(paires)
+    return paires[["id_debit", "id_credit"]].rename(columns={"id_debit": "debit", "id_credit": "credit"}).reset_index(drop=True)
+
+
+@lru_cache(maxsize=1)
+def moteur_regles():
+    # Mots-clés et marqueurs de transfert seuls, sans la mémoire : la catégorie qu'une ligne
+    # reçoit par défaut (ce qui en diffère a été choisi par l'utilisateur)
+    return construire_moteur({})
+
+
+# --- IMPORT EN FLUX ---
+# Le relevé n'est jamais chargé en entier : on renifle l'encodage, la ligne d'en-tête et le séparateur
+# sur les premiers Ko, puis le moteur C de pandas lit le fichier par morceaux. Chaque morceau est
+# normalisé et catégorisé indépendamment → mémoire bornée quelle que soit la taille de l'export.
+
+CORRESPONDANCE = {
+    "Date": ["Date", "Date opération", "Date de valeur", "Effective Date", "Date op", "Date val", "Le", "Date de comptabilisation","Date operation", "date"],
+    "Nom": ["Nom", "Libelle simplifie", "Libellé", "Description", "Transaction", "Libellé de l'opération", "Détails", "Objet", "Type"],
+    "Montant": ["Montant", "Montant(EUROS)", "Valeur", "Amount", "Prix", "Montant net", "Somme"],
+    "Debit": ["Debit", "Débit"],
+    "Credit": ["Credit", "Crédit"]
+}
+
+ENCODAGES_IMPORT = ["utf-8-sig", "cp1252", "latin-1"]
+TAILLE_ECHANTILLON_IMPORT = 64 * 1024
+TAILLE_MORCEAU_IMPORT = 50_000
+NB_LIGNES_ENTETE_MAX = 20
+REGEX_FIN_DE_LIGNE = re.compile(r'\r\n|\n|\r')
+
+# Synonyme en minuscules → nom standard (le premier nom standard qui le cite l'emporte)
+SYNONYMES_COLONNES = {s.lower(): std for std, syns in reversed(list(CORRESPONDANCE.items())) for s in syns}
+
+
+def empreinte_entete(ligne):
+    # Identifie un format de relevé par sa ligne d'en-tête
+    return hashlib.sha1(ligne.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def lignes_echantillon(echantillon, encodage, complet=False):
+    if not complet and b"\n" in echantillon:
+        # La dernière ligne peut être coupée (et un caractère multi-octets avec elle)
+        echantillon = echantillon[:echantillon.rfind(b"\n") + 1]
+    return REGEX_FIN_DE_LIGNE.split(echantillon.decode(encodage, errors="replace"))
+
+
+def detecter_format(echantillon, complet=False):
+    # echantillon : premiers octets du fichier. Renvoie {encodage, ligne_entete (ligne physique), sep, empreinte} ou None.
+    if not complet and b"\n" in echantillon:
+        echantillon = echantillon[:echantillon.rfind(b"\n") + 1]
+    encodage = ENCODAGES_IMPORT[-1]
+    for encodage in ENCODAGES_IMPORT:
+        try:
+            echantillon.decode(encodage)
+            break
+        except UnicodeDecodeError:
+            continue
+
+    # On cherche, parmi les 20 premières lignes non vides, celle qui contient "Date" ET un montant
+    non_vides = 0
+    for i, ligne in enumerate(lignes_echantillon(echantillon, encodage, complet=True)):
+        ligne = ligne.strip()
+        if not ligne: continue
+        if non_vides >= NB_LIGNES_ENTETE_MAX: break
+        non_vides += 1
+        l_lower = ligne.lower()
+        if "date" in l_lower and any(m in l_lower for m in ["montant", "debit", "credit", "valeur"]):
+            return {"encodage": encodage, "ligne_entete": i, "sep": ';' if ligne.count(';') > ligne.count(',') else ',',
+                    "empreinte": empreinte_entete(ligne)}
+    return None
+
+
+def profil_reconnu(echantillon, profils, complet=False):
+    # profils : {empreinte: profil} d'un compte. On relit la ligne d'en-tête là où chaque profil l'attend :
+    # si son empreinte correspond, le fichier vient de la même banque et la détection est inutile.
+    for empreinte, profil in profils.items():
+        lignes = lignes_echantillon(echantillon, profil["encodage"], complet)
+        if len(lignes) > profil["ligne_entete"] and empreinte_entete(lignes[profil["ligne_entete"]]) == empreinte:
+            return empreinte, profil
+    return None, None
+
+
+def renommer_colonnes(colonnes):
+    # Noms standards (Date, Nom, Montant, Debit, Credit) d'après CORRESPONDANCE, calculés une fois par fichier
+    return [SYNONYMES_COLONNES.get(c.lower(), c) for c in colonnes]
+
+
+def colonne_date(df_n):
+    cols = df_n.columns.tolist()
+    if "Date" not in cols:
+        raise ValueError(f"Structure non reconnue. Colonnes lues : {cols}")
+    d_col = df_n["Date"].iloc[:, 0] if isinstance(df_n["Date"], pd.DataFrame) else df_n["Date"]
+    return d_col.astype(str).str.strip()
+
+
+def normaliser_morceau(df_n, compte, moteur, format_date=None, encodage=None):
+    # Un morceau du relevé (colonnes déjà renommées) → lignes au format du grand livre.
+    # encodage : celui de la lecture du relevé (libellé enregistré en décodage historique)
+    cols = df_n.columns.tolist()
+    df_n = df_n.assign(Date_C=convertir_dates(colonne_date(df_n), format_date))
+    df_n = df_n.dropna(subset=["Date_C"])
+
+    # Détection Montant
+    if "Debit" in cols and "Credit" in cols:
+        df_n["M_Final"] = convertir_montants(df_n["Credit"]) - convertir_montants(df_n["Debit"]).abs()
+    elif "Montant" in cols:
+        df_n["M_Final"] = convertir_montants(df_n["Montant"])
+    else:
+        raise ValueError(f"Colonnes trouvées : {cols}. Vérifiez votre fichier CSV.")
+
+    # Détection Nom
+    n_col = "Nom" if "Nom" in cols else (cols[1] if len(cols) > 1 else cols[0])
+
+    df_res = pd.DataFrame({
+        "Date": df_n["Date_C"],
+        "Nom": simplifier_noms(libelles_historiques(df_n[n_col], encodage)),
+        "Montant": df_n["M_Final"],
+        "Compte": [compte] * len(df_n)
+    })
+    # On passe df_n pour que les transferts soient aussi cherchés dans TOUTES les colonnes
+    # (mots-clés cherchés dans le texte bien décodé, mémoire sur le libellé enregistré)
+    df_res["Categorie"] = categoriser_serie(moteur, df_n[n_col], df_n["M_Final"], df_n, noms_simplifies=df_res["Nom"])
+    df_res["Mois"] = df_res["Date"].dt.month.map(lambda x: NOMS_MOIS[int(x)-1])
+    df_res["Année"] = df_res["Date"].dt.year
+    return df_res
+
+
+def importer_en_flux(fichier, compte, moteur, taille_morceau=TAILLE_MORCEAU_IMPORT, profils=None):
+    # Générateur : (lignes normalisées d'un morceau, part du fichier déjà lue entre 0 et 1).
+    # fichier : objet binaire avec seek/tell (fichier ouvert en "rb", UploadedFile de Streamlit...)
+    # profils : {empreinte: profil} du compte, complété sur place avec le format de ce fichier.
+    fichier.seek(0, os.SEEK_END)
+    taille = fichier.tell() or 1
+    fichier.seek(0)
+    echantillon = fichier.read(TAILLE_ECHANTILLON_IMPORT)
+    complet = len(echantillon) < TAILLE_ECHANTILLON_IMPORT
+    empreinte, profil = profil_reconnu(echantillon, profils or {}, complet)
+    if profil is None:
+        fmt = detecter_format(echantillon, complet)
+        if fmt is None:
+            raise ValueError("Impossible de trouver la ligne d'en-tête (Date, Montant...).")
+        empreinte, profil = fmt.pop("empreinte"), fmt
+    fichier.seek(0)
+
+    lecteur = pd.read_csv(
+        fichier, sep=profil["sep"], encoding=profil["encodage"], encoding_errors='replace',
+        skiprows=profil["ligne_entete"], header=0, dtype=str,
+        on_bad_lines='skip', skip_blank_lines=True, chunksize=taille_morceau
+    )
+    colonnes, garder, noms, format_date = None, None, None, None
+    with lecteur:
+        for df_n in lecteur:
+            if colonnes is None:
+                # Nettoyage radical des colonnes puis renommage, une fois pour tout le fichier
+                # (déjà connu si le profil a été appris sur les mêmes colonnes)
+                colonnes = [str(c).strip() for c in df_n.columns]
+                garder = ~pd.Index(colonnes).duplicated()
+                noms = profil["noms"] if profil.get("colonnes") == colonnes else renommer_colonnes([c for c, g in zip(colonnes, garder) if g])
+            df_n = df_n.loc[:, garder]
+            df_n.columns = noms
+            if format_date is None:
+                format_date = deviner_format_date(colonne_date(df_n), profil.get("format_date"))
+                if profils is not None:
+                    profils[empreinte] = {
+                        "ligne_entete": profil["ligne_entete"], "sep": profil["sep"], "encodage": profil["encodage"],
+                        "colonnes": colonnes, "noms": noms, "format_date": format_date
+                    }
+            yield normaliser_morceau(df_n, compte, moteur, format_date, profil["encodage"]), min(fichier.tell() / taille, 1.0)
+
+
+def importer_fichier(contenu, compte, memoire, profils=None):
+    # Pipeline complet d'un fichier (octets du relevé) : exécuté dans un processus du pool d'import,
+    # d'où des arguments simples (octets, texte, dict) et un moteur compilé sur place.
+    # Renvoie (lignes normalisées, profils du compte complétés avec le format de ce fichier).
+    moteur = construire_moteur(memoire)
+    profils = dict(profils or {})
+    morceaux = [m for m, _ in importer_en_flux(io.BytesIO(contenu), compte, moteur, profils=profils) if not m.empty]
+    if not morceaux: return pd.DataFrame(columns=["Date", "Nom", "Montant", "Compte", "Categorie", "Mois", "Année"]), profils
+    return pd.concat(morceaux, ignore_index=True), profils
+
+
+def importer_fichier_mesure(contenu, compte, memoire, profils=None):
+    # Tâche du pool d'import : un processus du pool n'a pas le relevé de la page qui l'a lancé,
+    # importer_fichier y est donc mesuré dans son propre relevé, renvoyé avec le résultat.
+    nouveau_releve("import:fichier")
+    try:
+        df_res, profils = importer_fichier(contenu, compte, memoire, profils)
+    finally:
+        releve = clore_releve()
+    return df_res, profils, releve
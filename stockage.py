@@ -0,0 +1,921 @@
+import os
+import csv
+import glob
+import json
+import atexit
+import threading
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    # pyarrow absent : pas d'instantané, on relit le CSV à chaque démarrage
+    pa = feather = None
+from mesures import chronometre, compter
+from moteur import (
+    NOMS_MOIS, CAT_TRANSFERT, convertir_montants, convertir_dates, deviner_format_date, rapprocher_transferts,
+    moteur_regles, categoriser_serie
+)
+
+# --- STOCKAGE DES TRANSACTIONS ---
+# Deux moteurs possibles :
+#   - CSV (historique) : tout le fichier est relu / réécrit à chaque opération
+#   - SQLite (optionnel) : actif dès que le fichier .db existe (créé par la migration)
+#     → requêtes indexées, suppressions et modifications ligne par ligne
+
+FICHIER_DONNEES = "ma_base_de_donnees.csv"
+FICHIER_SQLITE = "ma_base_de_donnees.db"
+# Index des empreintes (hash Date/Nom/Montant/Compte) du stockage CSV : int64 bruts, en ajout seul
+FICHIER_EMPREINTES = "ma_base_de_donnees.empreintes"
+COLONNES_DONNEES = ["Date", "Nom", "Montant", "Compte", "Categorie", "Mois", "Année"]
+CLE_DOUBLONS = ["Date", "Nom", "Montant", "Compte"]
+
+
+def stockage_sqlite_actif():
+    return os.path.exists(FICHIER_SQLITE)
+
+
+# Schéma vérifié une fois par fichier de base et par processus, pas à chaque connexion
+SCHEMAS_PREPARES = set()
+
+
+def connexion_sqlite(chemin=FICHIER_SQLITE):
+    con = sqlite3.connect(chemin)
+    cle = (os.path.abspath(chemin), os.stat(chemin).st_ino)
+    if cle not in SCHEMAS_PREPARES:
+        preparer_schema_sqlite(con)
+        SCHEMAS_PREPARES.add(cle)
+    return con
+
+
+def preparer_schema_sqlite(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            Date TEXT, Nom TEXT, Montant REAL, Compte TEXT,
+            Categorie TEXT, Mois TEXT, "Année" INTEGER, Empreinte INTEGER
+        )""")
+    colonnes = [ligne[1] for ligne in con.execute("PRAGMA table_info(transactions)")]
+    if "Empreinte" not in colonnes:
+        # Base créée avant l'index d'empreintes : on la complète une fois
+        con.execute("ALTER TABLE transactions ADD COLUMN Empreinte INTEGER")
+        remplir_empreintes_sqlite(con)
+    con.execute('CREATE INDEX IF NOT EXISTS idx_compte_date ON transactions (Compte, Date)')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_annee_mois ON transactions ("Année", Mois)')
+    con.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_empreinte ON transactions (Empreinte)')
+
+
+def remplir_empreintes_sqlite(con):
+    df = pd.read_sql_query("SELECT id, Date, Nom, Montant, Compte FROM transactions", con, index_col="id")
+    df["Date"] = pd.to_datetime(df["Date"], format='%Y-%m-%d', errors='coerce')
+    h = calculer_empreintes(df)
+    with con:
+        con.executemany("UPDATE transactions SET Empreinte = ? WHERE id = ?", [(int(v), int(i)) for i, v in h.items()])
+        # Les doublons éventuels empêcheraient l'index unique : on garde la première occurrence
+        con.execute("DELETE FROM transactions WHERE id NOT IN (SELECT MIN(id) FROM transactions GROUP BY Empreinte)")
+
+
+def calculer_empreintes(df):
+    # Empreinte 64 bits de (Date, Nom, Montant, Compte), calculée de façon vectorisée.
+    # Le montant est arrondi au centime pour que 12.3 et 12.30 donnent la même empreinte.
+    cle = pd.DataFrame({
+        "Date": df["Date"].dt.strftime('%Y-%m-%d').astype(object),
+        "Nom": df["Nom"].map(str).astype(object),
+        "Montant": pd.to_numeric(df["Montant"], errors='coerce').astype(float).round(2),
+        "Compte": df["Compte"].map(str).astype(object),
+    }, index=df.index)
+    return pd.Series(pd.util.hash_pandas_object(cle, index=False).values.view(np.int64), index=df.index)
+
+
+# --- INDEX DES EMPREINTES (stockage CSV) ---
+# Chargé une fois par processus puis tenu à jour en mémoire : vérifier un import coûte O(lignes importées).
+CACHE_EMPREINTES = {"signature": None, "ensemble": set()}
+
+
+def signature_fichier(chemin):
+    if not os.path.exists(chemin): return None
+    stat = os.stat(chemin)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def signature_stockage():
+    # Change à chaque écriture du stockage actif : sert de clé aux caches partagés
+    chemin = FICHIER_SQLITE if stockage_sqlite_actif() else FICHIER_DONNEES
+    return (chemin, signature_fichier(chemin))
+
+
+def ecrire_empreintes(df):
+    h = calculer_empreintes(df) if not df.empty else pd.Series([], dtype=np.int64)
+    h.values.astype(np.int64).tofile(FICHIER_EMPREINTES)
+    compter("ecritures_fichier")
+    CACHE_EMPREINTES.update(signature=signature_fichier(FICHIER_EMPREINTES), ensemble=set(h.tolist()))
+
+
+def charger_empreintes():
+    sig_csv = signature_fichier(FICHIER_DONNEES)
+    sig_emp = signature_fichier(FICHIER_EMPREINTES)
+    # Index absent ou plus ancien que le CSV (modifié à la main) : on le reconstruit
+    if sig_emp is None or (sig_csv is not None and sig_csv[0] > sig_emp[0]):
+        ecrire_empreintes(charger_donnees() if sig_csv is not None else pd.DataFrame(columns=COLONNES_DONNEES))
+    elif CACHE_EMPREINTES["signature"] != sig_emp:
+        CACHE_EMPREINTES.update(signature=sig_emp, ensemble=set(np.fromfile(FICHIER_EMPREINTES, dtype=np.int64).tolist()))
+        compter("lectures_fichier")
+    return CACHE_EMPREINTES["ensemble"]
+
+
+def ajouter_empreintes(h):
+    with open(FICHIER_EMPREINTES, "ab") as f:
+        np.asarray(h, dtype=np.int64).tofile(f)
+    compter("ecritures_fichier")
+    CACHE_EMPREINTES["ensemble"].update(h)
+    CACHE_EMPREINTES["signature"] = signature_fichier(FICHIER_EMPREINTES)
+
+
+# --- INSTANTANÉ COLONNAIRE (stockage CSV) ---
+# Copie Arrow IPC (Feather non compressé) du CSV, déjà typée, réécrite après chaque modification
+# et lue en mémoire mappée au démarrage. Elle porte la signature du CSV qu'elle reflète :
+# si le CSV a changé depuis (édition à la main...), elle est ignorée et refaite depuis le CSV.
+FICHIER_INSTANTANE = "ma_base_de_donnees.feather"
+
+
+def ecrire_instantane(df):
+    if feather is None or stockage_sqlite_actif(): return
+    table = pa.Table.from_pandas(compacter_types(df))
+    signature = json.dumps(signature_fichier(FICHIER_DONNEES)).encode()
+    table = table.replace_schema_metadata({**table.schema.metadata, b"signature_csv": signature})
+    tmp = FICHIER_INSTANTANE + ".tmp"
+    feather.write_feather(table, tmp, compression="uncompressed")
+    os.replace(tmp, FICHIER_INSTANTANE)
+    compter("ecritures_fichier")
+
+
+def lire_instantane():
+    # DataFrame identique à une lecture du CSV, ou None si l'instantané est absent ou périmé
+    if feather is None or not os.path.exists(FICHIER_INSTANTANE): return None
+    try:
+        table = feather.read_table(FICHIER_INSTANTANE, memory_map=True)
+    except (OSError, pa.ArrowException):
+        return None
+    compter("lectures_fichier")
+    if (table.schema.metadata or {}).get(b"signature_csv") != json.dumps(signature_fichier(FICHIER_DONNEES)).encode():
+        return None
+    compter("lignes_lues", table.num_rows)
+    return compacter_types(table.to_pandas())
+
+
+def instantane_a_jour():
+    # Lit seulement le schéma (métadonnées) de l'instantané, pas ses colonnes
+    if feather is None or not os.path.exists(FICHIER_INSTANTANE): return False
+    try:
+        with pa.memory_map(FICHIER_INSTANTANE) as source:
+            metadonnees = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowException):
+        return False
+    return metadonnees.get(b"signature_csv") == json.dumps(signature_fichier(FICHIER_DONNEES)).encode()
+
+
+# --- SCHÉMA COMPACT EN MÉMOIRE ---
+# Le grand livre partagé par les sessions : Compte/Categorie en catégories (un code par ligne),
+# Mois en catégorie ORDONNÉE sur NOMS_MOIS (le code est le numéro du mois : les tris n'ont plus
+# besoin de NOMS_MOIS.index), Année en int16. Les montants restent en float64 pour des sommes
+# exactes au centime. Les fichiers (CSV, SQLite) gardent leur format texte.
+COLONNES_CATEGORIELLES = ["Compte", "Categorie", "Mois"]
+
+
+def type_mois(valeurs=()):
+    # Mois hors liste (saisis à la main, "Inconnu"...) : gardés, rangés après Décembre
+    extras = sorted({v for v in valeurs if isinstance(v, str)} - set(NOMS_MOIS))
+    return pd.CategoricalDtype(NOMS_MOIS + extras, ordered=True)
+
+
+def type_categoriel(colonne, valeurs):
+    if colonne == "Mois": return type_mois(valeurs)
+    return pd.CategoricalDtype(sorted({v for v in valeurs if pd.notna(v)}, key=str))
+
+
+def valeurs_distinctes(serie):
+    return serie.cat.categories if isinstance(serie.dtype, pd.CategoricalDtype) else serie.unique()
+
+
+def compacter_types(df):
+    # Catégories toujours triées (Mois : ordre du calendrier), que la colonne soit déjà catégorielle ou non
+    types = {c: type_categoriel(c, valeurs_distinctes(df[c])) for c in COLONNES_CATEGORIELLES if c in df.columns}
+    if "Année" in df.columns and df["Année"].notna().all(): types["Année"] = "int16"
+    return df.astype(types)
+
+
+def concatener_compact(df_memoire, ajoutees):
+    # Seules les lignes ajoutées sont typées. Le grand livre garde son type, sauf si elles
+    # apportent une valeur nouvelle (compte, catégorie...) : le type est alors élargi à l'union.
+    ajoutees = compacter_types(ajoutees)
+    types = {}
+    for c in COLONNES_CATEGORIELLES:
+        if c not in ajoutees.columns or not isinstance(df_memoire[c].dtype, pd.CategoricalDtype): continue
+        connues = df_memoire[c].cat.categories
+        if set(ajoutees[c].cat.categories) <= set(connues): types[c] = df_memoire[c].dtype
+        else: types[c] = type_categoriel(c, list(connues) + list(ajoutees[c].cat.categories))
+    elargies = {c: t for c, t in types.items() if t != df_memoire[c].dtype}
+    if elargies: df_memoire = df_memoire.astype(elargies)
+    return pd.concat([df_memoire, ajoutees.astype(types)])
+
+
+def rapport_memoire(df):
+    # Octets par ligne : schéma texte d'origine (avant) et schéma compact (après)
+    avant = df.astype({c: "str" for c in COLONNES_CATEGORIELLES if c in df.columns})
+    if "Année" in df.columns and df["Année"].notna().all(): avant = avant.astype({"Année": "int64"})
+    n = max(len(df), 1)
+    rapport = pd.DataFrame({
+        "Avant (octets/ligne)": avant.memory_usage(deep=True, index=False) / n,
+        "Après (octets/ligne)": compacter_types(df).memory_usage(deep=True, index=False) / n,
+    })
+    rapport.loc["Total"] = rapport.sum()
+    return rapport.round(1)
+
+
+def completer_colonnes(df):
+    if "Mois" not in df.columns:
+        df["Mois"] = df["Date"].dt.month.map(lambda x: NOMS_MOIS[int(x)-1] if pd.notna(x) else "Inconnu")
+    if "Année" not in df.columns:
+        df["Année"] = df["Date"].dt.year
+    return df
+
+
+def vers_lignes_sqlite(df):
+    # Format de stockage : date ISO (texte), année entière et empreinte
+    df = completer_colonnes(df.copy())
+    dates = df["Date"].dt.strftime('%Y-%m-%d')
+    return list(zip(
+        dates.where(dates.notna(), None),
+        df["Nom"].astype(object), df["Montant"].astype(float), df["Compte"].astype(object),
+        df["Categorie"].astype(object), df["Mois"].astype(object),
+        df["Année"].astype("Int64").astype(object).where(df["Année"].notna(), None),
+        calculer_empreintes(df).astype(object),
+    ))
+
+
+# Nombre de paramètres d'une requête IN (...) : sous la limite de SQLite
+TAILLE_LOT_SQLITE = 500
+REQUETE_INSERTION = 'INSERT OR IGNORE INTO transactions (Date, Nom, Montant, Compte, Categorie, Mois, "Année", Empreinte) VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+
+
+def lire_sqlite(requete, params=()):
+    with closing(connexion_sqlite()) as con:
+        df = pd.read_sql_query(requete, con, params=params, index_col="id")
+    compter("lectures_fichier")
+    compter("lignes_lues", len(df))
+    df["Date"] = pd.to_datetime(df["Date"], format='%Y-%m-%d', errors='coerce')
+    df.index.name = None
+    return df
+
+
+def lire_dates_stockees(serie):
+    # Notre base est écrite en ISO (avec ou sans heure) : lecture ISO d'abord, sans jamais inverser
+    # jour et mois. Seules les valeurs restées illisibles (ancienne base non ISO) passent par la
+    # détection de format des imports, qui lit le jour avant le mois.
+    dates = convertir_dates(serie, "ISO8601")
+    restes = dates.isna() & serie.notna()
+    if restes.any():
+        dates[restes] = convertir_dates(serie[restes], deviner_format_date(serie[restes]))
+    return dates
+
+
+@chronometre()
+def charger_donnees():
+    if stockage_sqlite_actif():
+        return compacter_types(lire_sqlite('SELECT id, Date, Nom, Montant, Compte, Categorie, Mois, "Année" FROM transactions'))
+
+    if os.path.exists(FICHIER_DONNEES):
+        df = lire_instantane()
+        if df is not None: return df
+        try:
+            # On essaie UTF-8, sinon Latin-1 pour gérer les accents
+            try:
+                df = pd.read_csv(FICHIER_DONNEES, encoding='utf-8-sig')
+            except UnicodeDecodeError:
+                df = pd.read_csv(FICHIER_DONNEES, encoding='latin-1')
+            compter("lectures_fichier")
+            compter("lignes_lues", len(df))
+
+            if "Date" in df.columns:
+                df["Date"] = lire_dates_stockees(df["Date"])
+                df = df.dropna(subset=["Date"])
+
+                # --- AJOUT CRITIQUE POUR LE DASHBOARD ---
+                df = completer_colonnes(df)
+
+            if "Montant" in df.columns:
+                df["Montant"] = convertir_montants(df["Montant"])
+
+            df = compacter_types(df)
+            ecrire_instantane(df)
+            return df
+        except Exception as e:
+            # En cas d'erreur, on affiche l'erreur pour déboguer
+            print(f"Erreur lecture : {e}")
+            return pd.DataFrame(columns=COLONNES_DONNEES)
+
+    return pd.DataFrame(columns=COLONNES_DONNEES)
+
+
+@chronometre()
+def lire_transactions(df_memoire, comptes=None, annee=None, mois=None):
+    # Lecture ciblée pour le tableau de bord : profil (liste de comptes) + année (+ mois)
+    if stockage_sqlite_actif():
+        conditions, params = [], []
+        if comptes is not None:
+            if not comptes: return df_memoire.iloc[0:0]
+            conditions.append(f"Compte IN ({','.join('?' * len(comptes))})")
+            params += list(comptes)
+        if annee is not None:
+            conditions.append('"Année" = ?')
+            params.append(int(annee))
+        if mois is not None:
+            conditions.append("Mois = ?")
+            params.append(mois)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return lire_sqlite(f'SELECT id, Date, Nom, Montant, Compte, Categorie, Mois, "Année" FROM transactions{where}', params)
+
+    compter("lignes_parcourues", len(df_memoire))
+    df = df_memoire
+    if comptes is not None: df = df[df["Compte"].isin(comptes)]
+    if annee is not None: df = df[df["Année"] == annee]
+    if mois is not None: df = df[df["Mois"] == mois]
+    return df
+
+
+# --- CUMULS MENSUELS ---
+# Cube (Compte, Année, Mois, Categorie) → Revenus, Dépenses, Nombre, persisté à côté du stockage.
+# Il est tenu à jour par delta à chaque import / modification / suppression :
+# le tableau de bord lit ces totaux au lieu de ré-agréger les transactions à chaque rerun.
+FICHIER_CUMULS = "cumuls_mensuels.csv"
+CLE_CUMULS = ["Compte", "Année", "Mois", "Categorie"]
+COLONNES_CUMULS = CLE_CUMULS + ["Revenus", "Dépenses", "Nombre"]
+CACHE_CUMULS = {"signature": None, "cube": None}
+
+
+def calculer_cumuls(df):
+    if df.empty: return pd.DataFrame(columns=COLONNES_CUMULS)
+    montants = pd.to_numeric(df["Montant"], errors='coerce').fillna(0.0)
+    # Clés en texte : le cube garde le même type qu'il vienne du grand livre compact ou du CSV
+    base = pd.DataFrame({
+        "Compte": df["Compte"].astype("str"), "Année": df["Année"],
+        "Mois": df["Mois"].astype("str"), "Categorie": df["Categorie"].astype("str"),
+        "Revenus": montants.clip(lower=0), "Dépenses": (-montants).clip(lower=0), "Nombre": 1,
+    })
+    return base.groupby(CLE_CUMULS, dropna=False, as_index=False, sort=False).sum()
+
+
+def fusionner_cumuls(cube, delta, signe=1):
+    # signe = -1 pour retirer des lignes (suppression, ancienne version d'une ligne modifiée)
+    if delta.empty: return cube
+    delta = delta.copy()
+    delta[["Revenus", "Dépenses", "Nombre"]] *= signe
+    cube = pd.concat([cube, delta], ignore_index=True) if not cube.empty else delta
+    cube = cube.groupby(CLE_CUMULS, dropna=False, as_index=False, sort=False).sum()
+    # On arrondit au centime pour que les ajouts / retraits successifs ne dérivent pas
+    cube[["Revenus", "Dépenses"]] = cube[["Revenus", "Dépenses"]].round(2)
+    return cube[cube["Nombre"] != 0].reset_index(drop=True)
+
+
+def ecrire_cumuls(cube):
+    cube.to_csv(FICHIER_CUMULS, index=False, encoding='utf-8-sig')
+    compter("ecritures_fichier")
+    CACHE_CUMULS.update(signature=signature_fichier(FICHIER_CUMULS), cube=cube)
+
+
+@chronometre()
+def charger_cumuls(df_memoire=None):
+    sig_cumuls = signature_fichier(FICHIER_CUMULS)
+    sig_stockage = signature_stockage()[1]
+    # Cube absent ou plus ancien que le stockage (modifié hors de l'appli) : on le reconstruit
+    if sig_cumuls is None or (sig_stockage is not None and sig_stockage[0] > sig_cumuls[0]):
+        ecrire_cumuls(calculer_cumuls(df_memoire if df_memoire is not None else charger_donnees()))
+    elif CACHE_CUMULS["signature"] != sig_cumuls:
+        cube = pd.read_csv(FICHIER_CUMULS, encoding='utf-8-sig', dtype={"Compte": str, "Mois": str, "Categorie": str})
+        compter("lectures_fichier")
+        CACHE_CUMULS.update(signature=sig_cumuls, cube=cube)
+    return CACHE_CUMULS["cube"]
+
+
+def maj_cumuls(cube, retirees=None, ajoutees=None):
+    # À appeler APRÈS l'écriture du stockage, avec le cube lu AVANT : il redevient ainsi le plus récent
+    if retirees is not None: cube = fusionner_cumuls(cube, calculer_cumuls(retirees), -1)
+    if ajoutees is not None: cube = fusionner_cumuls(cube, calculer_cumuls(ajoutees))
+    ecrire_cumuls(cube)
+
+
+@chronometre()
+def sauvegarder_donnees(nouveau_df):
+    # Import en ajout seul : on ne lit ni ne réécrit l'existant.
+    # Renvoie (lignes réellement ajoutées, nombre de doublons ignorés). Le DataFrame reçu n'est pas modifié.
+    nouveau_df = completer_colonnes(nouveau_df.copy())
+    nouveau_df["Date"] = nouveau_df["Date"].dt.normalize()
+    h = calculer_empreintes(nouveau_df)
+    uniques = ~h.duplicated()
+    cube = charger_cumuls()
+
+    if stockage_sqlite_actif():
+        # L'index unique sur Empreinte fait le tri : INSERT OR IGNORE ligne à ligne pour récupérer les id
+        ids, lignes = [], vers_lignes_sqlite(nouveau_df[uniques.values])
+        with closing(connexion_sqlite()) as con, con:
+            cur = con.cursor()
+            for ligne in lignes:
+                cur.execute(REQUETE_INSERTION, ligne)
+                ids.append(cur.lastrowid if cur.rowcount == 1 else None)
+        compter("ecritures_fichier")
+        gardees = [i is not None for i in ids]
+        ajoutees = nouveau_df[uniques.values][gardees]
+        ajoutees.index = [i for i in ids if i is not None]
+        if not ajoutees.empty: maj_cumuls(cube, ajoutees=ajoutees)
+        return ajoutees, len(nouveau_df) - len(ajoutees)
+
+    connues = charger_empreintes()
+    nouvelles = uniques & pd.Series([x not in connues for x in h.tolist()], index=h.index)
+    ajoutees = nouveau_df[nouvelles.values]
+    if not ajoutees.empty:
+        if os.path.exists(FICHIER_DONNEES):
+            # On respecte l'ordre des colonnes du fichier existant
+            with open(FICHIER_DONNEES, "r", encoding="utf-8-sig") as f:
+                entete = f.readline().strip().split(",")
+            with open(FICHIER_DONNEES, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                fin_de_ligne = f.read(1) == b"\n"
+            with open(FICHIER_DONNEES, "a", encoding="utf-8", newline="") as f:
+                if not fin_de_ligne: f.write("\n")
+                ajoutees.reindex(columns=entete).to_csv(f, header=False, index=False)
+        else:
+            ajoutees[COLONNES_DONNEES].to_csv(FICHIER_DONNEES, index=False, encoding='utf-8-sig')
+        compter("ecritures_fichier")
+        ajouter_empreintes(h[nouvelles.values].tolist())
+        maj_cumuls(cube, ajoutees=ajoutees)
+    return ajoutees, len(nouveau_df) - len(ajoutees)
+
+
+def ajouter_transactions(df_memoire, nouveau_df, instantane=True):
+    # Enregistre l'import et complète le DataFrame en mémoire sans tout recharger.
+    # instantane=False pour un import par morceaux : finaliser_import() l'écrit une fois à la fin.
+    ajoutees, nb_doublons = sauvegarder_donnees(nouveau_df)
+    if not stockage_sqlite_actif():
+        depart = int(df_memoire.index.max()) + 1 if len(df_memoire) else 0
+        ajoutees.index = range(depart, depart + len(ajoutees))
+    ajoutees = ajoutees[[c for c in COLONNES_DONNEES if c in ajoutees.columns]]
+    df_maj = concatener_compact(df_memoire, ajoutees) if len(df_memoire) else compacter_types(ajoutees)
+    if instantane and not ajoutees.empty: ecrire_instantane(df_maj)
+    return df_maj, len(ajoutees), nb_doublons
+
+
+def finaliser_import(df):
+    # Après le dernier morceau : un seul instantané pour tout l'import (s'il ne reflète plus le CSV)
+    if not stockage_sqlite_actif() and not instantane_a_jour(): ecrire_instantane(df)
+
+
+@chronometre()
+def supprimer_transactions(df_memoire, ids):
+    # Renvoie le DataFrame en mémoire sans les lignes supprimées
+    ids = list(ids)
+    df_reste = df_memoire.drop(ids)
+    cube = charger_cumuls(df_memoire)
+    if stockage_sqlite_actif():
+        with closing(connexion_sqlite()) as con, con:
+            con.executemany("DELETE FROM transactions WHERE id = ?", [(int(i),) for i in ids])
+        compter("ecritures_fichier")
+    else:
+        df_reste.to_csv(FICHIER_DONNEES, index=False, encoding='utf-8-sig')
+        compter("ecritures_fichier")
+        # Les lignes supprimées pourront être réimportées
+        ecrire_empreintes(df_reste)
+        ecrire_instantane(df_reste)
+    maj_cumuls(cube, retirees=df_memoire.loc[ids])
+    return df_reste
+
+
+@chronometre()
+def modifier_transactions(df_memoire, df_modifs, colonnes=("Categorie", "Mois")):
+    # df_modifs : lignes éditées (même index que df_memoire). Seules les lignes réellement
+    # changées sont écrites (UPDATE ponctuel en SQLite).
+    colonnes = [c for c in colonnes if c in df_modifs.columns]
+    avant = df_memoire.loc[df_modifs.index, colonnes]
+    apres = df_modifs[colonnes]
+    changees = (avant.astype(object) != apres.astype(object)).any(axis=1)
+    apres = apres[changees]
+    if apres.empty: return df_memoire
+
+    cube = charger_cumuls(df_memoire)
+    df_maj = df_memoire.copy()
+    for c in colonnes:
+        # Nouvelle catégorie (ou mois hors liste) : le type catégoriel est refait, trié, avant l'écriture
+        if isinstance(df_maj[c].dtype, pd.CategoricalDtype):
+            connues = df_maj[c].cat.categories
+            nouvelles = set(apres[c].dropna()) - set(connues)
+            if nouvelles: df_maj[c] = df_maj[c].astype(type_categoriel(c, list(connues) + list(nouvelles)))
+    df_maj.loc[apres.index, colonnes] = apres.values
+    if stockage_sqlite_actif():
+        set_sql = ", ".join(f'"{c}" = ?' for c in colonnes)
+        with closing(connexion_sqlite()) as con, con:
+            con.executemany(
+                f"UPDATE transactions SET {set_sql} WHERE id = ?",
+                [tuple(v) + (int(i),) for i, v in zip(apres.index, apres.astype(object).values.tolist())]
+            )
+        compter("ecritures_fichier")
+    else:
+        df_maj.to_csv(FICHIER_DONNEES, index=False, encoding='utf-8-sig')
+        compter("ecritures_fichier")
+        # Catégorie/Mois ne changent pas les empreintes : on marque juste l'index comme à jour
+        if os.path.exists(FICHIER_EMPREINTES): os.utime(FICHIER_EMPREINTES)
+        ecrire_instantane(df_maj)
+    maj_cumuls(cube, retirees=df_memoire.loc[apres.index], ajoutees=df_maj.loc[apres.index])
+    return df_maj
+
+
+def recategoriser_transactions(df_memoire, ids, categorie):
+    # Même catégorie pour toutes ces lignes : une affectation groupée et une seule écriture
+    df_modifs = df_memoire.loc[ids, ["Categorie"]].astype(object)
+    df_modifs["Categorie"] = categorie
+    return modifier_transactions(df_memoire, df_modifs, colonnes=("Categorie",))
+
+
+# --- TRANSFERTS DÉJÀ RAPPROCHÉS ---
+# Paires (débit, crédit) retenues, en empreintes int64 à la suite, en ajout seul (les deux stockages).
+# Une ligne appariée ne l'est plus jamais à une autre : le rapprochement est le même d'un import à l'autre.
+FICHIER_TRANSFERTS = "ma_base_de_donnees.transferts"
+CACHE_TRANSFERTS = {"signature": None, "ensemble": set()}
+
+
+def charger_transferts():
+    signature = signature_fichier(FICHIER_TRANSFERTS)
+    if CACHE_TRANSFERTS["signature"] != signature:
+        ensemble = set(np.fromfile(FICHIER_TRANSFERTS, dtype=np.int64).tolist()) if signature is not None else set()
+        CACHE_TRANSFERTS.update(signature=signature, ensemble=ensemble)
+        compter("lectures_fichier")
+    return CACHE_TRANSFERTS["ensemble"]
+
+
+def ajouter_transferts(h):
+    charger_transferts()
+    with open(FICHIER_TRANSFERTS, "ab") as f:
+        np.asarray(h, dtype=np.int64).tofile(f)
+    compter("ecritures_fichier")
+    CACHE_TRANSFERTS["ensemble"].update(np.asarray(h, dtype=np.int64).ravel().tolist())
+    CACHE_TRANSFERTS["signature"] = signature_fichier(FICHIER_TRANSFERTS)
+
+
+def enregistrer_paires(df, lignes=None):
+    # Rapproche puis enregistre les paires ; renvoie les paires (index du grand livre)
+    montants = pd.to_numeric(df["Montant"], errors='coerce')
+    cents = (montants.abs() * 100).round()
+    # Empreintes des seules lignes qui peuvent former une paire (même montant qu'une ligne à rapprocher)
+    candidates = df if lignes is None else df[cents.isin(cents[df.index.isin(lignes)]) & montants.notna()]
+    empreintes = calculer_empreintes(candidates) if not candidates.empty else pd.Series([], dtype=np.int64)
+    deja = charger_transferts()
+    paires = rapprocher_transferts(df, lignes, exclues=empreintes.index[[h in deja for h in empreintes.tolist()]])
+    if len(paires) or not os.path.exists(FICHIER_TRANSFERTS):
+        ajouter_transferts(np.column_stack([empreintes.loc[paires["debit"]].to_numpy(), empreintes.loc[paires["credit"]].to_numpy()]))
+    return paires
+
+
+def transferts_a_marquer(df, ids):
+    # Lignes appariées encore dans la catégorie que les règles leur donnent : ni un choix de
+    # l'utilisateur ni une catégorie apprise (mémoire) n'est remplacé par le transfert interne
+    lignes = df.loc[ids]
+    defaut = categoriser_serie(moteur_regles(), lignes["Nom"], lignes["Montant"])
+    return lignes.index[lignes["Categorie"].astype(object).values == defaut.values]
+
+
+def marquer_transferts(df_memoire, lignes=None):
+    # Rapproche les transferts entre comptes parmi les lignes déjà enregistrées (lignes données,
+    # ou tout le grand livre) ; mise à jour ponctuelle des lignes appariées (voir transferts_a_marquer).
+    # Renvoie (DataFrame à jour, nombre de paires).
+    paires = enregistrer_paires(df_memoire, lignes)
+    ids = transferts_a_marquer(df_memoire, pd.Index(paires["debit"]).append(pd.Index(paires["credit"])))
+    return recategoriser_transactions(df_memoire, ids, CAT_TRANSFERT), len(paires)
+
+
+def empreintes_connues(h):
+    # Empreintes déjà enregistrées parmi h (en SQLite : recherche dans l'index unique, par lots)
+    if not stockage_sqlite_actif():
+        connues = charger_empreintes()
+        return {x for x in h.tolist() if x in connues}
+    valeurs, connues = [int(x) for x in h.tolist()], set()
+    with closing(connexion_sqlite()) as con:
+        for i in range(0, len(valeurs), TAILLE_LOT_SQLITE):
+            lot = valeurs[i:i + TAILLE_LOT_SQLITE]
+            requete = f"SELECT Empreinte FROM transactions WHERE Empreinte IN ({', '.join('?' * len(lot))})"
+            connues.update(v for (v,) in con.execute(requete, lot))
+    return connues
+
+
+def marquer_transferts_import(df_memoire, nouveau_df):
+    # Avant l'écriture d'un import : rapproche ses lignes nouvelles (ni doublon du fichier, ni déjà
+    # enregistrées) du grand livre et entre elles. Les nouvelles lignes appariées sont passées en
+    # transfert dans nouveau_df, qui est ensuite ajouté tel quel ; les lignes déjà présentes à
+    # marquer sont renvoyées pour une mise à jour ponctuelle (recategoriser_transactions).
+    # Renvoie (nouveau_df, index des lignes déjà présentes, nombre de paires).
+    if len(df_memoire) and not os.path.exists(FICHIER_TRANSFERTS):
+        # Premier rapprochement suivi : les paires du grand livre existant sont d'abord enregistrées
+        enregistrer_paires(df_memoire)
+    colonnes = ["Date", "Nom", "Montant", "Compte", "Categorie"]
+    nouveau_df = nouveau_df.assign(Date=nouveau_df["Date"].dt.normalize(), Categorie=nouveau_df["Categorie"].astype(object))
+    h = calculer_empreintes(nouveau_df)
+    nouvelles = np.flatnonzero((~h.duplicated() & ~h.isin(empreintes_connues(h))).values)
+    depart = int(df_memoire.index.max()) + 1 if len(df_memoire) else 0
+    a_rapprocher = nouveau_df.iloc[nouvelles][colonnes].set_axis(pd.RangeIndex(depart, depart + len(nouvelles)))
+
+    # Seules les lignes déjà présentes de même montant peuvent former une paire avec elles
+    cents = (pd.to_numeric(df_memoire["Montant"], errors='coerce').abs() * 100).round()
+    cents_import = (pd.to_numeric(a_rapprocher["Montant"], errors='coerce').abs() * 100).round()
+    anciennes = df_memoire.loc[cents.isin(cents_import).values, colonnes]
+    ensemble = pd.concat([anciennes.astype({c: object for c in ["Nom", "Compte", "Categorie"]}), a_rapprocher]) if len(anciennes) else a_rapprocher
+    paires = enregistrer_paires(ensemble, a_rapprocher.index)
+
+    ids = transferts_a_marquer(ensemble, pd.Index(paires["debit"]).append(pd.Index(paires["credit"])))
+    marquees = nouvelles[ids[ids >= depart] - depart]
+    nouveau_df.iloc[marquees, nouveau_df.columns.get_loc("Categorie")] = CAT_TRANSFERT
+    return nouveau_df, ids[ids < depart], len(paires)
+
+
+def migrer_csv_vers_sqlite():
+    # Migration unique : on construit la base dans un fichier temporaire puis on la met en place
+    # d'un coup (le CSV est conservé comme sauvegarde).
+    if stockage_sqlite_actif(): return 0
+    df = charger_donnees()
+    for col in COLONNES_DONNEES:
+        if col not in df.columns: df[col] = None
+    tmp = FICHIER_SQLITE + ".tmp"
+    if os.path.exists(tmp): os.remove(tmp)
+    with closing(connexion_sqlite(tmp)) as con, con:
+        avant = con.total_changes
+        con.executemany(REQUETE_INSERTION, vers_lignes_sqlite(df))
+        # Lignes réellement insérées : INSERT OR IGNORE écarte les doublons du CSV
+        nb_inserees = con.total_changes - avant
+    os.replace(tmp, FICHIER_SQLITE)
+    return nb_inserees
+
+
+# --- MÉMOIRE D'APPRENTISSAGE (libellé simplifié → catégorie) ---
+# Journal en ajout seul : chaque apprentissage ajoute des lignes en fin de fichier et la DERNIÈRE
+# ligne d'un libellé l'emporte. Le fichier est compacté (une ligne par libellé) quand les lignes
+# périmées deviennent trop nombreuses.
+FICHIER_MEMOIRE = "memoire_categories.csv"
+SEUIL_COMPACTAGE_MEMOIRE = 1000
+# Nombre de lignes du journal, tenu à jour à chaque lecture, ajout et compactage : décider du
+# compactage ne demande pas de relire le fichier
+CACHE_LIGNES_MEMOIRE = {"signature": None, "lignes": 0}
+
+
+def lire_memoire():
+    memoire = {}
+    signature = signature_fichier(FICHIER_MEMOIRE)
+    if signature is None: return memoire
+    with open(FICHIER_MEMOIRE, "r", encoding="utf-8-sig", newline="") as f:
+        compter("lectures_fichier")
+        lecteur = csv.reader(f)
+        next(lecteur, None)
+        for champs in lecteur:
+            if len(champs) < 2: continue
+            # Libellé avec virgule mal échappée (anciennes versions) : la catégorie est toujours le dernier champ
+            memoire[",".join(champs[:-1])] = champs[-1]
+        CACHE_LIGNES_MEMOIRE.update(signature=signature, lignes=lecteur.line_num)
+    return memoire
+
+
+def lignes_memoire():
+    # Journal modifié hors de ce processus depuis le dernier comptage : recompté une fois
+    signature = signature_fichier(FICHIER_MEMOIRE)
+    if CACHE_LIGNES_MEMOIRE["signature"] != signature:
+        lignes = 0
+        if signature is not None:
+            with open(FICHIER_MEMOIRE, "rb") as f:
+                lignes = sum(bloc.count(b"\n") for bloc in iter(lambda: f.read(1 << 16), b""))
+            compter("lectures_fichier")
+        CACHE_LIGNES_MEMOIRE.update(signature=signature, lignes=lignes)
+    return CACHE_LIGNES_MEMOIRE["lignes"]
+
+
+def compacter_memoire(memoire=None):
+    memoire = lire_memoire() if memoire is None else memoire
+    tmp = FICHIER_MEMOIRE + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        ecrivain = csv.writer(f, lineterminator="\n")
+        ecrivain.writerow(["Nom", "Categorie"])
+        ecrivain.writerows(memoire.items())
+    os.replace(tmp, FICHIER_MEMOIRE)
+    CACHE_LIGNES_MEMOIRE.update(signature=signature_fichier(FICHIER_MEMOIRE), lignes=len(memoire) + 1)
+
+
+def apprendre_categories(paires, memoire=None):
+    # paires : {libellé simplifié: catégorie}. Une seule écriture pour tout le lot,
+    # et seulement pour ce qui change vraiment. Renvoie le nombre de libellés appris.
+    memoire = lire_memoire() if memoire is None else memoire
+    nouvelles = {nom: cat for nom, cat in dict(paires).items() if memoire.get(nom) != cat}
+    if not nouvelles: return 0
+
+    existe = os.path.exists(FICHIER_MEMOIRE) and os.path.getsize(FICHIER_MEMOIRE) > 0
+    nb_lignes = lignes_memoire() if existe else 0
+    fin_de_ligne = True
+    if existe:
+        with open(FICHIER_MEMOIRE, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            fin_de_ligne = f.read(1) == b"\n"
+    with open(FICHIER_MEMOIRE, "a", encoding="utf-8", newline="") as f:
+        if not fin_de_ligne: f.write("\n")
+        ecrivain = csv.writer(f, lineterminator="\n")
+        if not existe: ecrivain.writerow(["Nom", "Categorie"])
+        ecrivain.writerows(nouvelles.items())
+    compter("ecritures_fichier")
+    # Seules les lignes ajoutées sont comptées (en-tête, libellés)
+    nb_lignes += (not existe) + len(nouvelles)
+    CACHE_LIGNES_MEMOIRE.update(signature=signature_fichier(FICHIER_MEMOIRE), lignes=nb_lignes)
+
+    # Compactage périodique : quand le journal contient bien plus de lignes que de libellés
+    memoire = {**memoire, **nouvelles}
+    if nb_lignes > 2 * len(memoire) + SEUIL_COMPACTAGE_MEMOIRE:
+        compacter_memoire(memoire)
+    return len(nouvelles)
+
+
+# --- PROFILS DE BANQUES (format d'import appris par compte) ---
+# {compte: {empreinte de la ligne d'en-tête: profil}}. Un profil mémorise tout ce que la détection
+# a trouvé (ligne d'en-tête, séparateur, encodage, colonnes, format de date) : le fichier suivant
+# de la même banque est lu directement, sans détection.
+FICHIER_PROFILS = "profils_banques.json"
+
+
+def charger_profils():
+    if not os.path.exists(FICHIER_PROFILS): return {}
+    try:
+        with open(FICHIER_PROFILS, "r", encoding="utf-8") as f:
+            compter("lectures_fichier")
+            return json.load(f)
+    except (OSError, ValueError):
+        # Fichier illisible : les profils seront réappris au prochain import
+        return {}
+
+
+def enregistrer_profils(compte, profils):
+    # Remplace les profils d'un compte (écriture atomique du fichier complet, il reste petit)
+    tous = charger_profils()
+    tous[compte] = profils
+    tmp = FICHIER_PROFILS + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(tous, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, FICHIER_PROFILS)
+    compter("ecritures_fichier")
+
+
+# --- RÉGLAGES (couleurs, style) ---
+# Un seul fichier JSON, lu une fois par processus puis servi depuis la mémoire. Une valeur
+# inchangée n'écrit rien ; les changements sont regroupés (écriture différée) et écrits
+# d'un coup dans un fichier temporaire remplacé atomiquement.
+FICHIER_REGLAGES = "reglages.json"
+DELAI_ECRITURE_REGLAGES = 1.0
+# Anciens réglages, un petit fichier texte par valeur : repris une fois (clé = nom sans .txt)
+ANCIENS_FICHIERS_REGLAGES = ["color_*.txt", "tab_*.txt", "ma_couleur.txt"]
+CACHE_REGLAGES = {"valeurs": None, "minuteur": None, "verrou": threading.Lock()}
+
+
+def migrer_anciens_reglages():
+    valeurs = {}
+    for motif in ANCIENS_FICHIERS_REGLAGES:
+        for chemin in sorted(glob.glob(motif)):
+            with open(chemin, "r", encoding="utf-8") as f:
+                valeurs[os.path.splitext(os.path.basename(chemin))[0]] = f.read().strip()
+    return valeurs
+
+
+def charger_reglages():
+    with CACHE_REGLAGES["verrou"]:
+        if CACHE_REGLAGES["valeurs"] is None:
+            valeurs = None
+            if os.path.exists(FICHIER_REGLAGES):
+                try:
+                    with open(FICHIER_REGLAGES, "r", encoding="utf-8") as f:
+                        valeurs = json.load(f)
+                except (OSError, ValueError):
+                    valeurs = None
+            if valeurs is None:
+                valeurs = migrer_anciens_reglages()
+                if valeurs: ecrire_reglages(valeurs)
+            CACHE_REGLAGES["valeurs"] = valeurs
+        return CACHE_REGLAGES["valeurs"]
+
+
+def lire_reglage(cle, defaut=None):
+    return charger_reglages().get(cle, defaut)
+
+
+def ecrire_reglages(valeurs):
+    tmp = FICHIER_REGLAGES + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(valeurs, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, FICHIER_REGLAGES)
+
+
+def vider_reglages_en_attente():
+    with CACHE_REGLAGES["verrou"]:
+        if CACHE_REGLAGES["minuteur"] is None: return
+        CACHE_REGLAGES["minuteur"].cancel()
+        CACHE_REGLAGES["minuteur"] = None
+        ecrire_reglages(dict(CACHE_REGLAGES["valeurs"]))
+
+
+def modifier_reglage(cle, valeur):
+    # Renvoie True si la valeur a changé (écriture programmée)
+    valeurs = charger_reglages()
+    if valeurs.get(cle) == valeur: return False
+    with CACHE_REGLAGES["verrou"]:
+        valeurs[cle] = valeur
+        # Écriture différée : un nouveau changement repousse l'écriture
+        if CACHE_REGLAGES["minuteur"] is not None: CACHE_REGLAGES["minuteur"].cancel()
+        minuteur = threading.Timer(DELAI_ECRITURE_REGLAGES, vider_reglages_en_attente)
+        minuteur.daemon = True
+        CACHE_REGLAGES["minuteur"] = minuteur
+        minuteur.start()
+    return True
+
+
+# Rien ne se perd si le serveur s'arrête avant la fin du délai
+atexit.register(vider_reglages_en_attente)
+
+
+# --- REGISTRE DES COMPTES (config_comptes.csv) ---
+# Groupe, solde initial, objectif et couleur de chaque compte. Le fichier est lu une fois puis
+# servi depuis la mémoire (relu seulement s'il change) ; les comptes sont indexés par groupe.
+FICHIER_CONFIG_COMPTES = "config_comptes.csv"
+COULEUR_COMPTE_DEFAUT = "#1f77b4"
+CACHE_REGISTRE = {"signature": None, "registre": None}
+
+
+def en_nombre(valeur):
+    # Solde / objectif : vide, texte ou NaN comptent pour 0
+    try:
+        valeur = float(valeur)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(valeur) else valeur
+
+
+class RegistreComptes:
+    def __init__(self, config=None):
+        # config : {compte: {"Groupe": ..., "Solde": ..., "Objectif": ..., "Couleur": ...}}
+        self.config = {nom: dict(v) for nom, v in (config or {}).items() if isinstance(nom, str)}
+        self.index_groupes = {}
+        for nom, v in self.config.items():
+            self.index_groupes.setdefault(v.get("Groupe"), []).append(nom)
+
+    def comptes(self):
+        return list(self.config)
+
+    def groupe(self, compte):
+        return self.config.get(compte, {}).get("Groupe")
+
+    def solde(self, compte):
+        return en_nombre(self.config.get(compte, {}).get("Solde"))
+
+    def objectif(self, compte):
+        return en_nombre(self.config.get(compte, {}).get("Objectif"))
+
+    def couleur(self, compte, defaut=None):
+        couleur = self.config.get(compte, {}).get("Couleur")
+        return couleur if isinstance(couleur, str) and couleur.startswith("#") else defaut
+
+    def comptes_du_groupe(self, groupe):
+        return list(self.index_groupes.get(groupe, []))
+
+    def total_soldes(self, comptes):
+        return sum(self.solde(c) for c in comptes)
+
+    def total_objectifs(self, comptes):
+        return sum(self.objectif(c) for c in comptes)
+
+    def vers_dict(self):
+        return {nom: dict(v) for nom, v in self.config.items()}
+
+
+def charger_registre():
+    signature = signature_fichier(FICHIER_CONFIG_COMPTES)
+    if CACHE_REGISTRE["registre"] is None or CACHE_REGISTRE["signature"] != signature:
+        config = {}
+        if signature is not None:
+            config = pd.read_csv(FICHIER_CONFIG_COMPTES, index_col=0, encoding='utf-8-sig').to_dict('index')
+            compter("lectures_fichier")
+        CACHE_REGISTRE.update(signature=signature, registre=RegistreComptes(config))
+    return CACHE_REGISTRE["registre"]
+
+
+def enregistrer_registre(config):
+    # Une seule écriture (fichier temporaire remplacé d'un coup). Les colonnes du fichier que
+    # le dict ne connaît pas (ajoutées à la main...) sont conservées.
+    existant = charger_registre().config
+    df = pd.DataFrame.from_dict(config, orient='index')
+    for col in dict.fromkeys(c for v in existant.values() for c in v):
+        if col not in df.columns:
+            df[col] = pd.Series({nom: v.get(col) for nom, v in existant.items()}, dtype=object)
+    tmp = FICHIER_CONFIG_COMPTES + ".tmp"
+    df.to_csv(tmp, encoding='utf-8-sig', index=True)
+    os.replace(tmp, FICHIER_CONFIG_COMPTES)
+    compter("ecritures_fichier")
+    CACHE_REGISTRE.update(signature=signature_fichier(FICHIER_CONFIG_COMPTES), registre=RegistreComptes(df.to_dict('index')))
+    return CACHE_REGISTRE["registre"]
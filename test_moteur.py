@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from moteur import (
+    CATEGORIES_MOTS_CLES, MOTS_TRANSFERT, CAT_TRANSFERT, TAILLE_ECHANTILLON_MONTANTS, clean_montant_physique,
+    convertir_montants, convertir_dates, deviner_format_date, simplifier_nom_definitif, construire_moteur,
+    categoriser_serie, construire_index_soldes, soldes_avant, IndexRecherche, rapprocher_transferts, importer_fichier,
+    masque_regle
+)
+
+
+# --- CATÉGORISATION ---
+# Référence : l'ancienne catégorisation ligne par ligne (transferts, puis mémoire, puis mots-clés)
+
+def categoriser_ligne(nom, montant, memoire, ligne_complete=None):
+    n_brut = str(nom).upper()
+    if any(m in n_brut for m in MOTS_TRANSFERT): return CAT_TRANSFERT
+    if ligne_complete is not None and any(m in " ".join(str(v).upper() for v in ligne_complete) for m in MOTS_TRANSFERT):
+        return CAT_TRANSFERT
+    n_clean = simplifier_nom_definitif(n_brut)
+    if n_clean in memoire: return memoire[n_clean]
+    for cat, mots in CATEGORIES_MOTS_CLES.items():
+        if any(m in n_brut for m in mots): return cat
+    return "💰 Autres Revenus" if montant > 0 else "❓ Autre"
+
+
+LIBELLES = [
+    "CB CARREFOUR MARKET 12/03", "PRLV SEPA NETFLIX.COM", "VIREMENT VERS LIVRET A", "RETRAIT DAB 01/02 PARIS",
+    "ACHAT CB AMAZON PRIME", "VIR SEPA JEAN DUPONT", "Café de la Gare", "SUPER U BAR", "TOTAL ACCESS STATION",
+    "PHARMACIE DU CENTRE", "LIBELLE INCONNU", "FACTURE ORANGE REF 1234", "", "MUTUELLE HARMONIE",
+]
+
+
+def test_categoriser_serie_equivaut_a_la_version_ligne_par_ligne():
+    r = np.random.default_rng(0)
+    noms = pd.Series(r.choice(LIBELLES, 500))
+    montants = pd.Series(r.uniform(-100, 100, 500).round(2))
+    memoire = {"LIBELLE INCONNU": "🎮 Jeux vidéos", "CAFÉ DE LA GARE": "🛒 Alimentation"}
+    attendu = [categoriser_ligne(n, m, memoire) for n, m in zip(noms, montants)]
+    assert categoriser_serie(construire_moteur(memoire), noms, montants).tolist() == attendu
+
+
+def test_categoriser_serie_cherche_les_transferts_dans_toute_la_ligne():
+    lignes = pd.DataFrame({"Nom": ["OPERATION 1", "OPERATION 2"], "Detail": ["Virement vers livret A", "rien"]})
+    montants = pd.Series([-10.0, 5.0])
+    attendu = [categoriser_ligne(n, m, {}, l) for (n, m), l in zip(zip(lignes["Nom"], montants), lignes.values)]
+    assert categoriser_serie(construire_moteur({}), lignes["Nom"], montants, lignes).tolist() == attendu
+    assert attendu == [CAT_TRANSFERT, "💰 Autres Revenus"]
+
+
+# --- MONTANTS ET DATES ---
+
+@pytest.mark.parametrize("valeur, attendu", [
+    ("12,50", 12.5), ("-1 234,56", -1234.56), ("1,234.56", 1234.56), ("12.5 €", 12.5), ("$7", 7.0),
+    ("1\xa0000,00", 1000.0), ("", 0.0), ("abc", 0.0), (None, 0.0), ("+3", 3.0), (".5", 0.5),
+])
+def test_convertir_montants_formats(valeur, attendu):
+    assert convertir_montants(pd.Series([valeur], dtype=object)).tolist() == [attendu]
+
+
+def test_convertir_montants_identique_a_clean_montant_physique_sur_grande_colonne():
+    # Au-delà de l'échantillon : chemin vectorisé (montants répétés) et chemin par valeur distincte
+    r = np.random.default_rng(1)
+    n = 3 * TAILLE_ECHANTILLON_MONTANTS
+    formats = ["{:.2f}", "{:.2f} €", "{:,.2f}"]
+    repetes = [formats[i % 3].format(v).replace(".", ",") if i % 2 else formats[i % 3].format(v) for i, v in enumerate(r.uniform(-50, 50, 40).round(2))]
+    for valeurs in (r.choice(repetes + ["", "n/a"], n), [f"{v:.2f}".replace(".", ",") for v in r.uniform(-1e5, 1e5, n)]):
+        serie = pd.Series(valeurs, dtype=object)
+        assert convertir_montants(serie).tolist() == [clean_montant_physique(v) for v in serie]
+
+
+def test_convertir_montants_colonne_numerique():
+    assert convertir_montants(pd.Series([1.5, None, -2])).tolist() == [1.5, 0.0, -2.0]
+
+
+@pytest.mark.parametrize("valeurs, format_attendu", [
+    (["01/02/2024", "13/02/2024"], "%d/%m/%Y"),
+    (["2024-02-01", "2024-02-13"], "%Y-%m-%d"),
+    (["01-02-24", "13-02-24"], "%d-%m-%y"),
+    (["01.02.2024", "13.02.2024"], "%d.%m.%Y"),
+    (["20240201", "20240213"], "%Y%m%d"),
+])
+def test_convertir_dates_formats(valeurs, format_attendu):
+    serie = pd.Series(valeurs + [valeurs[0], None])
+    fmt = deviner_format_date(serie)
+    assert fmt == format_attendu
+    dates = convertir_dates(serie, fmt)
+    assert dates.iloc[:3].tolist() == [pd.Timestamp("2024-02-01"), pd.Timestamp("2024-02-13"), pd.Timestamp("2024-02-01")]
+    assert pd.isna(dates.iloc[3])
+
+
+def test_convertir_dates_jour_avant_mois_et_valeurs_illisibles():
+    dates = convertir_dates(pd.Series(["05/03/2024", "pas une date"]), "mixed")
+    assert dates.iloc[0] == pd.Timestamp("2024-03-05")
+    assert pd.isna(dates.iloc[1])
+
+
+# --- IMPORT ---
+
+@pytest.mark.parametrize("encodage, encodage_detecte, libelle", [
+    ("utf-8", "utf-8-sig", "Pharmacie MÉNARD – Noël"),
+    ("utf-8-sig", "utf-8-sig", "Pharmacie MÉNARD – Noël"),
+    ("cp1252", "cp1252", "Pharmacie MÉNARD – Noël"),
+    ("latin-1", "cp1252", "Pharmacie MÉNARD Noël"),
+])
+def test_importer_fichier_garde_les_libelles_historiques(encodage, encodage_detecte, libelle):
+    # Le libellé enregistré est celui des anciens imports (octets lus en latin-1, sans BOM) : même
+    # empreinte pour un relevé déjà importé ; les mots-clés sont cherchés dans le texte bien décodé
+    contenu = f"Date;Libellé;Montant\n01/03/2024;{libelle};-3,50\n".encode(encodage)
+    df, profils = importer_fichier(contenu, "A", {})
+    assert [p["encodage"] for p in profils.values()] == [encodage_detecte]
+    assert df["Nom"].tolist() == [simplifier_nom_definitif(libelle.encode(encodage.replace("-sig", "")).decode("latin-1"))]
+    assert df["Categorie"].tolist() == ["💊 Pharmacie"]
+
+
+# --- SOLDES ---
+
+def test_soldes_avant_egal_a_la_somme_cumulee():
+    r = np.random.default_rng(2)
+    n = 300
+    df = pd.DataFrame({
+        "Compte": r.choice(["A", "B"], n),
+        "Date": pd.Timestamp("2024-01-01") + pd.to_timedelta(r.integers(0, 60, n), "D"),
+        "Montant": r.uniform(-100, 100, n).round(2),
+    })
+    index = construire_index_soldes(df)
+    jours = pd.date_range("2023-12-30", "2024-03-05")
+    for compte in ["A", "B", "C"]:
+        lignes = df[df["Compte"] == compte]
+        attendu = [100.0 + lignes.loc[lignes["Date"] < j, "Montant"].sum() for j in jours]
+        np.testing.assert_allclose(soldes_avant(index, compte, jours, solde_initial=100.0), attendu)
+
+
+# --- RECHERCHE ---
+
+def test_index_recherche_par_prefixe():
+    df = pd.DataFrame({"Nom": ["AMAZON PAYMENTS", "Amazon Prime", "CARREFOUR MARKET", "Café Amaz"], "Montant": [-10.0, -5.0, -30.0, -2.0]}, index=[10, 11, 12, 13])
+    index = IndexRecherche()
+    index.synchroniser(df)
+    assert index.rechercher("amaz").tolist() == [10, 11, 13]
+    assert index.rechercher("AMA PRI").tolist() == [11]
+    assert index.rechercher("cafe").tolist() == [13]
+    assert index.rechercher("AMAZ", montant_min=4, montant_max=10).tolist() == [10, 11]
+    assert index.rechercher("INTROUVABLE").tolist() == []
+    assert index.rechercher(montant_min=20).tolist() == [12]
+
+    # Suivi par différence : ligne renommée, supprimée, ajoutée
+    df = df.drop(13)
+    df.loc[11, "Nom"] = "NETFLIX"
+    df.loc[14] = ["AMAZON MARKETPLACE", -8.0]
+    index.synchroniser(df)
+    assert index.rechercher("AMAZ").tolist() == [10, 14]
+    assert index.rechercher("NET").tolist() == [11]
+
+
+# --- RÈGLES DE RECATÉGORISATION ---
+
+def test_masque_regle_motif_et_filtres():
+    df = pd.DataFrame({
+        "Nom": pd.Categorical(["AMAZON EU", "amazon prime", "CARREFOUR", "AMAZON EU", "AMAZON EU"]),
+        "Compte": ["A", "A", "A", "B", "A"],
+        "Date": pd.to_datetime(["2024-03-01", "2024-03-15", "2024-03-02", "2024-03-03", "2024-04-01"]),
+        "Montant": [-30.0, -5.0, -20.0, -40.0, 12.0],
+    }, index=[10, 11, 12, 13, 14])
+    assert df.index[masque_regle(df, " Amazon ")].tolist() == [10, 11, 13, 14]
+    assert df.index[masque_regle(df, "amazon", compte="A")].tolist() == [10, 11, 14]
+    # Bornes de dates incluses (date de fin comprise toute la journée), montants en valeur absolue
+    assert df.index[masque_regle(df, "AMAZON", date_debut="2024-03-03", date_fin="2024-03-15")].tolist() == [11, 13]
+    assert df.index[masque_regle(df, "AMAZON", montant_min=10, montant_max=35)].tolist() == [10, 14]
+    assert not masque_regle(df, "  ").any()
+
+
+# --- TRANSFERTS ---
+
+def transactions(lignes):
+    return pd.DataFrame(lignes, columns=["Date", "Montant", "Compte"]).assign(Date=lambda d: pd.to_datetime(d["Date"]))
+
+
+def test_rapprocher_transferts_un_pour_un():
+    df = transactions([
+        ("2024-03-01", -50.0, "A"),   # 0 : débit
+        ("2024-03-02", 50.0, "B"),    # 1 : crédit le plus proche
+        ("2024-03-03", 50.0, "C"),    # 2 : second crédit, plus loin : reste seul
+        ("2024-03-01", 50.0, "A"),    # 3 : même compte : jamais apparié
+        ("2024-03-20", -50.0, "B"),   # 4 : hors fenêtre
+        ("2024-03-02", -20.0, "A"),   # 5 : montant différent
+        ("2024-03-02", 20.0, "B"),    # 6
+    ])
+    paires = rapprocher_transferts(df)
+    assert sorted(map(tuple, paires.values.tolist())) == [(0, 1), (5, 6)]
+
+
+def test_rapprocher_transferts_lignes_et_exclusions():
+    df = transactions([
+        ("2024-03-01", -50.0, "A"),   # 0 : déjà présent
+        ("2024-03-01", 50.0, "B"),    # 1 : déjà présent
+        ("2024-03-02", 50.0, "C"),    # 2 : nouvelle ligne
+        ("2024-03-02", -50.0, "D"),   # 3 : déjà présent, même jour que la nouvelle ligne
+    ])
+    # Les lignes déjà présentes ne sont pas appariées entre elles (0 et 1 restent seules)
+    paires = rapprocher_transferts(df, lignes=[2])
+    assert paires.values.tolist() == [[3, 2]]
+    # Une ligne exclue (appariée lors d'un import précédent) n'est jamais reprise
+    assert rapprocher_transferts(df, lignes=[2], exclues=[0, 3]).empty
@@ -0,0 +1,175 @@
+from contextlib import closing
+
+from mesures import nouveau_releve, clore_releve
+
+import pandas as pd
+import pytest
+
+import stockage
+from stockage import (
+    ajouter_transactions, charger_donnees, connexion_sqlite, stockage_sqlite_actif, marquer_transferts,
+    marquer_transferts_import, modifier_transactions, recategoriser_transactions, CAT_TRANSFERT
+)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def grand_livre(request, tmp_path, monkeypatch):
+    # Dossier vide par test, caches de fichiers remis à zéro ; en SQLite, la base est créée vide
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stockage, "CACHE_EMPREINTES", {"signature": None, "ensemble": set()})
+    monkeypatch.setattr(stockage, "CACHE_CUMULS", {"signature": None, "cube": None})
+    monkeypatch.setattr(stockage, "CACHE_TRANSFERTS", {"signature": None, "ensemble": set()})
+    if request.param == "sqlite":
+        with closing(connexion_sqlite()): pass
+    assert stockage_sqlite_actif() == (request.param == "sqlite")
+    return charger_donnees()
+
+
+def transactions(lignes):
+    return pd.DataFrame(lignes, columns=["Date", "Nom", "Montant", "Compte", "Categorie"]).assign(Date=lambda d: pd.to_datetime(d["Date"]))
+
+
+RELEVE = [
+    ("2024-03-01", "CARREFOUR", -12.5, "A", "🛒 Alimentation"),
+    ("2024-03-02", "NETFLIX", -9.99, "A", "📱 Abonnements"),
+    ("2024-03-02", "NETFLIX", -9.99, "A", "📱 Abonnements"),    # doublon dans le fichier
+    ("2024-03-05", "SALAIRE", 2000.0, "B", "💰 Salaire"),
+]
+
+
+def test_ajouter_transactions_dedoublonne(grand_livre):
+    df, nouvelles, doublons = ajouter_transactions(grand_livre, transactions(RELEVE))
+    assert (nouvelles, doublons) == (3, 1)
+
+    # Réimport du même relevé avec une ligne en plus : seule celle-ci est ajoutée
+    releve = RELEVE + [("2024-03-06", "NETFLIX", -9.99, "A", "📱 Abonnements")]
+    df, nouvelles, doublons = ajouter_transactions(df, transactions(releve))
+    assert (nouvelles, doublons) == (1, 4)
+    assert len(df) == 4 and df.index.is_unique
+
+    # Une autre session (ou un redémarrage) relit le même grand livre depuis le disque
+    relu = charger_donnees()
+    assert len(relu) == 4
+    assert sorted(relu["Nom"].astype(str)) == sorted(df["Nom"].astype(str))
+    _, nouvelles, doublons = ajouter_transactions(relu, transactions(RELEVE))
+    assert (nouvelles, doublons) == (0, 4)
+
+
+def test_ajouter_transactions_ne_modifie_pas_le_releve(grand_livre):
+    releve = transactions([("2024-03-01 14:30", "CARREFOUR", -12.5, "A", "🛒 Alimentation")])
+    ajouter_transactions(grand_livre, releve)
+    assert releve.columns.tolist() == ["Date", "Nom", "Montant", "Compte", "Categorie"]
+    assert releve["Date"].tolist() == [pd.Timestamp("2024-03-01 14:30")]
+
+
+def test_ajouter_transactions_types_compacts(grand_livre):
+    df, _, _ = ajouter_transactions(grand_livre, transactions(RELEVE))
+    df, _, _ = ajouter_transactions(df, transactions([("2024-03-07", "AUCHAN", -3.0, "0 Compte", "🛒 Alimentation")]))
+    # Un nouveau compte élargit le type catégoriel, toujours trié
+    assert df["Compte"].cat.categories.tolist() == ["0 Compte", "A", "B"]
+    assert str(df["Année"].dtype) == "int16"
+    df = modifier_transactions(df, df.loc[df.index[:1], ["Categorie"]].assign(Categorie="0 Nouvelle"), colonnes=("Categorie",))
+    assert list(df["Categorie"].cat.categories) == sorted(df["Categorie"].cat.categories)
+
+
+def test_marquer_transferts_garde_les_categories_choisies(grand_livre):
+    df, _, _ = ajouter_transactions(grand_livre, transactions([
+        ("2024-03-01", "VIR VERS B", -50.0, "A", "❓ Autre"),          # catégorie par défaut
+        ("2024-03-01", "VIR VERS B BIS", -70.0, "A", "🚗 Auto"),       # catégorie choisie par l'utilisateur
+    ]))
+    n_avant = len(df)
+    df, _, _ = ajouter_transactions(df, transactions([
+        ("2024-03-02", "VIR DE A", 50.0, "B", "💰 Autres Revenus"),
+        ("2024-03-02", "VIR DE A BIS", 70.0, "B", "💰 Autres Revenus"),
+    ]))
+    df, nb = marquer_transferts(df, df.index[n_avant:])
+    assert nb == 2
+    assert df["Categorie"].astype(str).tolist() == [CAT_TRANSFERT, "🚗 Auto", CAT_TRANSFERT, CAT_TRANSFERT]
+
+    # Les lignes appariées ne le sont plus jamais à une autre
+    n_avant = len(df)
+    df, _, _ = ajouter_transactions(df, transactions([("2024-03-02", "VIR DE A TER", 50.0, "C", "💰 Autres Revenus")]))
+    df, nb = marquer_transferts(df, df.index[n_avant:])
+    assert nb == 0
+    assert marquer_transferts(df)[1] == 0
+
+
+def test_marquer_transferts_import_avant_ajout(grand_livre):
+    # Premier import dans un grand livre vide : les paires sont prises dans le relevé seul
+    releve, contreparties, nb = marquer_transferts_import(grand_livre, transactions([
+        ("2024-02-01", "VIR VERS B", -20.0, "A", "❓ Autre"), ("2024-02-01", "VIR DE A", 20.0, "B", "💰 Autres Revenus"),
+    ]))
+    assert (nb, len(contreparties)) == (1, 0) and releve["Categorie"].tolist() == [CAT_TRANSFERT, CAT_TRANSFERT]
+
+    df, _, _ = ajouter_transactions(grand_livre, transactions([
+        ("2024-03-01", "VIR VERS B", -50.0, "A", "❓ Autre"),
+        ("2024-03-01", "VIR VERS B BIS", -70.0, "A", "🚗 Auto"),
+    ]))
+    releve = transactions([
+        ("2024-03-01", "VIR VERS B", -50.0, "A", "❓ Autre"),          # déjà enregistrée : jamais rapprochée
+        ("2024-03-02", "VIR DE A", 50.0, "B", "💰 Autres Revenus"),
+        ("2024-03-02", "VIR DE A BIS", 70.0, "B", "💰 Autres Revenus"),
+        ("2024-03-03", "VIR VERS B 2", -30.0, "A", "❓ Autre"),
+        ("2024-03-03", "VIR DE A 2", 30.0, "B", "🎮 Jeux vidéos"),     # catégorie apprise (mémoire)
+    ])
+    releve, contreparties, nb = marquer_transferts_import(df, releve)
+    assert nb == 3
+    assert releve["Categorie"].tolist() == ["❓ Autre", CAT_TRANSFERT, CAT_TRANSFERT, CAT_TRANSFERT, "🎮 Jeux vidéos"]
+    # Seule la contrepartie déjà présente avec sa catégorie par défaut est à mettre à jour
+    assert df.loc[contreparties, "Nom"].astype(str).tolist() == ["VIR VERS B"]
+
+    n_avant = len(df)
+    df, nouvelles, _ = ajouter_transactions(df, releve)
+    df = recategoriser_transactions(df, contreparties, CAT_TRANSFERT)
+    assert nouvelles == 4
+    assert charger_donnees()["Categorie"].astype(str).tolist() == df["Categorie"].astype(str).tolist() == [
+        CAT_TRANSFERT, "🚗 Auto", CAT_TRANSFERT, CAT_TRANSFERT, CAT_TRANSFERT, "🎮 Jeux vidéos"
+    ]
+    # Les lignes appariées ne le sont plus jamais à une autre
+    assert marquer_transferts_import(df, transactions([("2024-03-02", "VIR DE A TER", 50.0, "C", "💰 Autres Revenus")]))[2] == 0
+    assert marquer_transferts(df)[1] == 0 and len(df) == n_avant + 4
+
+
+def test_charger_donnees_lit_les_dates_iso_du_grand_livre(tmp_path, monkeypatch):
+    # Dates avec et sans heure dans le même fichier : jamais lues jour avant mois
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame({
+        "Date": ["2025-03-04", "2025-03-05 00:00:00", "2025-11-28"], "Nom": ["A", "B", "C"],
+        "Montant": [-1.0, -2.0, -3.0], "Compte": "X", "Categorie": "❓ Autre",
+    }).to_csv(stockage.FICHIER_DONNEES, index=False)
+    df = charger_donnees()
+    assert df["Date"].tolist() == [pd.Timestamp("2025-03-04"), pd.Timestamp("2025-03-05"), pd.Timestamp("2025-11-28")]
+    assert df["Mois"].astype(str).tolist() == ["Mars", "Mars", "Novembre"]
+
+
+def test_migrer_csv_vers_sqlite_compte_les_lignes_inserees(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame({
+        "Date": ["2024-03-01", "2024-03-02", "2024-03-02"], "Nom": ["A", "B", "B"],
+        "Montant": [-1.0, -2.0, -2.0], "Compte": "X", "Categorie": "❓ Autre",
+    }).to_csv(stockage.FICHIER_DONNEES, index=False)
+    # Le doublon du CSV est écarté par l'index unique : il n'est pas compté
+    assert stockage.migrer_csv_vers_sqlite() == 2
+    assert stockage_sqlite_actif() and len(charger_donnees()) == 2
+
+
+def test_apprendre_categories_compte_les_lignes_sans_relire(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stockage, "SEUIL_COMPACTAGE_MEMOIRE", 5)
+    monkeypatch.setattr(stockage, "CACHE_LIGNES_MEMOIRE", {"signature": None, "lignes": 0})
+    memoire = stockage.lire_memoire()
+    nouveau_releve()
+    ajoutees = 0
+    for i in range(12):
+        # Le même libellé change de catégorie : une ligne périmée de plus à chaque fois
+        ajoutees += stockage.apprendre_categories({"CARREFOUR": f"Catégorie {i}", f"LIBELLE {i % 2}": "X"}, memoire)
+        memoire = stockage.lire_memoire() if i == 3 else {**memoire, "CARREFOUR": f"Catégorie {i}", f"LIBELLE {i % 2}": "X"}
+    releve = clore_releve()
+    # Une seule lecture du journal (celle demandée à i == 3), jamais pour compter ses lignes
+    assert releve["compteurs"]["lectures_fichier"] == 1
+    with open(stockage.FICHIER_MEMOIRE, "rb") as f:
+        lignes = f.read().count(b"\n")
+    # Compacté dès que le journal dépasse 2 × 3 libellés + 5 lignes : il reste sous ce seuil
+    assert ajoutees == 14 and lignes < 1 + ajoutees
+    assert lignes == stockage.CACHE_LIGNES_MEMOIRE["lignes"] and lignes <= 2 * 3 + 5
+    assert stockage.lire_memoire()["CARREFOUR"] == "Catégorie 11"